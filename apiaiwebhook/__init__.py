@@ -13,4 +13,46 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-from apiaiwebhook.apiai_webhook import APIAIWebhook
+import importlib
+import sys
+
+# the public names and their modules. They are imported on first access,
+# so importing the package does not import Flask until the application class is used.
+_exports = {
+    "AgentHost": "apiaiwebhook.agents",
+    "APIAIWebhook": "apiaiwebhook.apiai_webhook",
+    "CacheBackend": "apiaiwebhook.cache",
+    "LRUCache": "apiaiwebhook.cache",
+    "ResponseCache": "apiaiwebhook.cache",
+    "SQLiteCache": "apiaiwebhook.cache",
+    "Compression": "apiaiwebhook.compression",
+    "HTTPPool": "apiaiwebhook.httpclient",
+    "Profiler": "apiaiwebhook.profiling",
+    "AdmissionControl": "apiaiwebhook.ratelimit",
+    "RateLimit": "apiaiwebhook.ratelimit",
+    "RateLimitBackend": "apiaiwebhook.ratelimit",
+    "ResourceRegistry": "apiaiwebhook.resources",
+    "SQLiteRateLimitBackend": "apiaiwebhook.ratelimit",
+    "Session": "apiaiwebhook.session",
+    "SessionStore": "apiaiwebhook.session",
+    "WebhookEngine": "apiaiwebhook.engine",
+    "WebhookRequest": "apiaiwebhook.model",
+    "WebhookResponse": "apiaiwebhook.model",
+}
+
+__all__ = sorted(_exports)
+
+if sys.version_info >= (3, 7):
+    def __getattr__(name):
+        module = _exports.get(name)
+        if module is None:
+            raise AttributeError("module %r has no attribute %r" % (__name__, name))
+        value = getattr(importlib.import_module(module), name)
+        globals()[name] = value
+        return value
+
+    def __dir__():
+        return sorted(set(globals()) | set(_exports))
+else:
+    for _name, _module in _exports.items():
+        globals()[_name] = getattr(importlib.import_module(_module), _name)
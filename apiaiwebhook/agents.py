@@ -0,0 +1,285 @@
+# Copyright (C) 2017 Paoro
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import threading
+import weakref
+
+from apiaiwebhook.auth import APIKeyring, key_digest
+from apiaiwebhook.engine import WebhookEngine
+from apiaiwebhook.exceptions import WebhookError
+
+
+class Agent(WebhookEngine):
+    """
+    The webhook of one agent of an :class:`AgentHost`. It has its own fulfillment functions, routes,
+    API keys and webhook URL, and it shares the infrastructure of the host: the JSON backend, the metrics,
+    the executor pools, the resources and the HTTP pool, the session store and the admission control.
+    It is created by `AgentHost.agent()`.
+
+    The cache and coalescing keys of its functions, the keys of its sessions and of its rate limit buckets
+    are prefixed by the name of the agent, so the agents which share a :class:`ResponseCache`, the
+    :class:`SessionStore` or the :class:`AdmissionControl` of the host do not share their responses,
+    their conversation states or their rate limits.
+
+    :param host:            the :class:`AgentHost` object
+    :param name:            name of the agent, the `source` of its responses
+    :param api_key_value:   the key or the list of the keys of the agent
+    :param webhook_url:     the URL of the agent. Defaults to the `url_prefix` of the host and the name.
+    """
+
+    def __init__(self, host, name, api_key_value=None, webhook_url=None):
+        if not name or "/" in name:
+            raise ValueError("invalid agent name: %r" % name)
+        self.agent_name = name
+        self.host = host
+        self.cache_namespace = name
+        WebhookEngine.__init__(self,
+                               "%s.%s" % (host.import_name, name),
+                               host.api_key_header,
+                               api_key_value,
+                               webhook_url or "%s%s/" % (host.url_prefix, name),
+                               host.json_backend,
+                               None,
+                               host.deadline,
+                               host.session_store,
+                               host.admission,
+                               auth_log_interval=host.auth_failures.interval,
+                               compression=host.compression,
+                               max_body_size=host.max_body_size,
+                               profiler=host.profiler)
+        self.metrics = host.metrics
+        self.executors = host.executors
+        self.single_flight = host.single_flight
+        self.resources = host.resources
+        self.http_pool = host.http_pool
+        self.payload_logger = host.payload_logger
+        for injector_name, injector in host.injectors.items():
+            self.injectors.setdefault(injector_name, injector)
+
+    @property
+    def name(self):
+        return self.agent_name
+
+    def profile_key(self, action):
+        return "%s:%s" % (self.agent_name, action)
+
+    def warn_api_key(self):
+        if self.api_keys is None:
+            self.logger.warning("api-key of agent '%s' is empty, it is served by its URL only." % self.agent_name)
+
+    def __repr__(self):
+        return "<Agent %s>" % self.agent_name
+
+
+class AgentHost(WebhookEngine):
+    """
+    Serves the webhooks of many agents in one process. usage::
+
+        from apiaiwebhook.agents import AgentHost
+        host = AgentHost(__name__, metrics_url="/metrics")
+        support = host.agent("support", api_key_value="support-secret")
+
+        @support.fulfillment("hello-world")
+        def hello_world():
+            return support.make_response_apiai(speech="Hello, World!")
+
+        app = host.make_wsgi_app()
+
+    A request is routed to its agent by its URL (`url_prefix` and the name of the agent, e.g. `/agents/support/`)
+    or, at the `webhook_url` of the host, by the value of its API key header. Both are dictionary lookups,
+    so the routing does not depend on the number of the agents. The agents can be added and removed at runtime,
+    the requests in flight are completed by the agent they were routed to.
+
+    The resources, startup and shutdown hooks, executor pools and the other infrastructure are registered
+    on the host and shared by the agents. The other parameters are the same as the parameters of
+    :class:`WebhookEngine`.
+
+    :param url_prefix: the prefix of the URLs of the agents
+    """
+
+    def __init__(self,
+                 import_name,
+                 api_key_header="api-key",
+                 webhook_url="/webhook/",
+                 url_prefix="/agents/",
+                 json_backend=None,
+                 metrics_url=None,
+                 deadline=None,
+                 session_store=None,
+                 admission=None,
+                 log_sample_rate=1,
+                 log_redact=None,
+                 log_async=False,
+                 auth_log_interval=60,
+                 compression=None,
+                 max_body_size=None,
+                 http_pool=None,
+                 profiler=None):
+        WebhookEngine.__init__(self, import_name, api_key_header, None, webhook_url, json_backend, metrics_url,
+                               deadline, session_store, admission, log_sample_rate, log_redact, log_async,
+                               auth_log_interval, compression, max_body_size, http_pool, profiler)
+        self.url_prefix = url_prefix
+        self.path = webhook_url.rstrip("/")
+        self.agents = {}
+        self.paths = {}
+        self.keys = {}
+        # the WSGI and ASGI applications of the host, they drop the applications of the removed agents
+        self.frontends = weakref.WeakSet()
+        self._lock = threading.Lock()
+
+    def warn_api_key(self):
+        # the keys belong to the agents
+        pass
+
+    def agent(self, name, api_key_value=None, webhook_url=None):
+        """
+        Creates an agent and adds it to the host. An agent of the same name is replaced.
+
+        :param name:            name of the agent, the `source` of its responses
+        :param api_key_value:   the key or the list of the keys of the agent. The requests sent to
+                                the `webhook_url` of the host are routed to the agent by these keys.
+        :param webhook_url:     the URL of the agent. Defaults to `url_prefix` and the name.
+        :return: An Agent object
+        :raise ValueError: when the URL or a key of the agent is used by another agent
+        """
+        return self.add_agent(Agent(self, name, api_key_value, webhook_url))
+
+    def add_agent(self, agent):
+        """
+        Adds an agent created for this host, or replaces the agent of the same name.
+
+        :return: the agent
+        :raise ValueError: when the URL or a key of the agent is used by another agent
+        """
+        with self._lock:
+            agents = dict(self.agents)
+            agents[agent.agent_name] = agent
+            self.index(agents)
+        return agent
+
+    def remove_agent(self, name):
+        """
+        Removes an agent, its URL and keys are not served anymore.
+
+        :return: the removed Agent object
+        :raise KeyError: when the agent is not found
+        """
+        with self._lock:
+            agents = dict(self.agents)
+            agent = agents.pop(name)
+            self.index(agents)
+        for frontend in list(self.frontends):
+            frontend.discard_agent(name)
+        return agent
+
+    def rotate_keys(self, name, keys):
+        """
+        Replaces the API keys of an agent, and its routes at the `webhook_url` of the host.
+
+        :param name: name of the agent
+        :param keys: the new keys as strings
+        :raise ValueError: when a key is used by another agent
+        """
+        with self._lock:
+            agent = self.agents[name]
+            for key in keys:
+                other = self.keys.get(key_digest(key))
+                if other is not None and other is not agent:
+                    raise ValueError("api-key of agent '%s' is used by agent '%s'" % (name, other.agent_name))
+            if agent.api_keys is None:
+                agent.api_keys = APIKeyring(keys)
+            else:
+                agent.api_keys.rotate(keys)
+            self.index(self.agents)
+
+    def index(self, agents):
+        """
+        Builds the routing tables of the agents, then replaces the current tables.
+        The requests in flight keep reading the tables they started with.
+        """
+        paths = {}
+        keys = {}
+        for name, agent in agents.items():
+            path = agent.webhook_url.rstrip("/")
+            if path == self.path or paths.setdefault(path, agent) is not agent:
+                raise ValueError("webhook URL of agent '%s' is already used: %s" % (name, agent.webhook_url))
+            if agent.api_keys is None:
+                continue
+            for digest in agent.api_keys.digests:
+                if keys.setdefault(digest, agent) is not agent:
+                    raise ValueError("api-key of agent '%s' is used by agent '%s'" % (name, keys[digest].agent_name))
+        self.agents = agents
+        self.paths = paths
+        self.keys = keys
+
+    def find_agent(self, path, api_key_value=None):
+        """
+        Looks up the agent of a request by its URL, or by its API key at the `webhook_url` of the host.
+        The key is verified by the agent.
+
+        :param path: the path of the request
+        :param api_key_value: value of the `api_key_header` HTTP header or None when it is not provided
+        :return: the Agent object
+        :raise WebhookError: HTTP 404 when the URL is not served, HTTP 400 or 401 when the key routes to no agent
+        """
+        stripped = path.rstrip("/")
+        agent = self.paths.get(stripped)
+        if agent is not None:
+            return agent
+        if stripped != self.path:
+            raise WebhookError(404, "not found: %s" % path)
+        if api_key_value is None:
+            self.auth_failure("missing")
+            raise WebhookError(400, "api-key http header is required")
+        agent = self.keys.get(key_digest(api_key_value))
+        if agent is None:
+            self.auth_failure("invalid")
+            raise WebhookError(401, "api-key is invalid")
+        return agent
+
+    def agent_request(self, agent, status):
+        """
+        Counts a request of an agent by its HTTP status.
+        """
+        if self.metrics is not None:
+            self.metrics.increment("apiaiwebhook_agent_requests_total", (("agent", agent.agent_name),
+                                                                         ("status", str(status))))
+
+    def add_injector(self, name, injector):
+        super(AgentHost, self).add_injector(name, injector)
+        for agent in list(self.agents.values()):
+            agent.add_injector(name, injector)
+
+    def fulfillment(self, rule, **kwargs):
+        raise TypeError("fulfillment functions are registered on the agents, see AgentHost.agent()")
+
+    def make_asgi_app(self, executor=None):
+        """
+        Creates an ASGI application which serves the agents, see `WebhookEngine.make_asgi_app()`.
+
+        :return: A ASGIAgentHost object
+        """
+        from apiaiwebhook.asgi import ASGIAgentHost
+        return ASGIAgentHost(self, executor=executor)
+
+    def make_wsgi_app(self):
+        """
+        Creates a WSGI application which serves the agents, see `WebhookEngine.make_wsgi_app()`.
+
+        :return: A WSGIAgentHost object
+        """
+        from apiaiwebhook.wsgi import WSGIAgentHost
+        return WSGIAgentHost(self)
@@ -13,16 +13,24 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import io
+import os
+
 import flask
-import flask.json as json
-import flask.testing
+
+from apiaiwebhook.context import Deadline
+from apiaiwebhook.engine import WebhookEngine
+from apiaiwebhook.exceptions import WebhookError
+from apiaiwebhook.payload import WebhookPayload
+from apiaiwebhook.testing import APIAIWebhookClient
 
 
-class APIAIWebhook(flask.Flask):
+class APIAIWebhook(flask.Flask, WebhookEngine):
     """
     The API.AI webhook object extends the Flask WSGI application and acts as the central
     object. Once it is created it will act as a central registry for
-    the fulfillment functions.
+    the fulfillment functions. The dispatch core is implemented by :class:`WebhookEngine`,
+    this class serves it by Flask.
 
     Usually you create a :class:`APIAIWebhook` instance in your main module or
     in the :file:`__init__.py` file of your package like this::
@@ -36,40 +44,56 @@ class APIAIWebhook(flask.Flask):
                             Defaults to 'api-key'.
 
     :param api_key_value:   HTTP authentication header name for the shared secret is shared by API.AI.
+                            A list of keys can be provided, any of them is accepted, see :class:`APIKeyring`.
                             When None is provided the HTTP authentication header is not validated.
                             Defaults to None.
     :param webhook_url:     URL rule for the webhook dispatcher. Defaults to '/webhook/'.
 
-    For more information, see the specification of Flask object.
+    :param json_backend:    name of the JSON library which decodes the requests and encodes the responses:
+                            'orjson', 'json' or a custom JSONBackend object.
+                            Defaults to None, which selects 'orjson' when it is installed.
 
-    """
+    :param metrics_url:     URL rule of the metrics of the webhook dispatcher, e.g. '/metrics/'.
+                            When None is provided the metrics are not collected. Defaults to None.
 
-    def fulfillment(self, rule):
-        """
-        A decorator that is used to register a fulfillment function for a
-        given action. usage::
+    :param batch_url:       URL rule of the batch webhook dispatcher, e.g. '/webhook/batch/'.
+                            When None is provided the batch dispatcher is not registered. Defaults to None.
 
-            @app.fulfillment("hello-world")
-            def hello_world():
-                return "Hello, World!"
-
-        :param rule The 'action' as string.
-                    The action is extracted from::
-                        {
-                            "results": {
-                                "action": <HERE>,
-                                "parameters": {
-                                    "parameter": <EXAMPLE>
-                                    }
-                            }
-                        }
-        """
+    :param batch_workers:   number of threads which dispatch the requests of a batch in parallel.
+                            When None is provided the requests are dispatched one by one. Defaults to None.
 
-        def decorator(f):
-            self.fulfillment_functions[rule] = f
-            return f
+    :param deadline:        time budget of the requests in seconds, e.g. 4.5. When it is over, the functions run
+                            by an executor are abandoned and their fallback response is sent. Defaults to None.
+
+    :param session_store:   the :class:`SessionStore` of the conversation states. Functions which declare
+                            a `session` parameter receive the Session of the request. Defaults to an in-process store.
+
+    :param admission:       an :class:`AdmissionControl` object when the requests are rate limited. Defaults to None.
+
+    :param log_sample_rate: the request and response bodies are logged at DEBUG level for one in every N requests.
+                            Defaults to 1, i.e. every request.
+    :param log_redact:      names of the parameters whose values are not logged. Defaults to None.
+    :param log_async:       when True, the log records are written by a background thread. Defaults to False.
+    :param auth_log_interval: the authentication failures and the rejected requests are counted and logged
+                            together, at most once per this many seconds. Defaults to 60.
+
+    :param compression:     a :class:`Compression` object when the responses are compressed by the content coding
+                            negotiated with the client. Defaults to None.
+    :param max_body_size:   maximum size of the request bodies in bytes, after decompression.
+                            Larger requests are rejected by HTTP 413. Defaults to None, no limit.
+    :param http_pool:       the :class:`HTTPPool` of the `http` client of the fulfillment functions.
+                            Defaults to a pool which is created on first use.
+    :param profiler:        a :class:`Profiler` object when the fulfillment of the sampled requests and of the requests
+                            with its debug header is profiled. Defaults to None.
+
+    :param slim:            when True, the Flask machinery which is not used by a webhook is skipped in order to
+                            construct the application faster on cold start: the static files and the templates
+                            are disabled and the root path is the working directory, unless `root_path` is given.
+                            Defaults to False.
+
+    For more information, see the specification of Flask object.
 
-        return decorator
+    """
 
     def webhook(self):
         """
@@ -95,11 +119,17 @@ class APIAIWebhook(flask.Flask):
 
         The default value is required when the parameter can be empty.
         Kwargs is useful when additional parameters are expected in the future.
+        The parameters which are not declared by the function are dropped, unless it takes kwargs.
 
         :return:
             * HTTP 400 when `api_key_value` is defined but it the authentication header is not provided.
+            * HTTP 400 when a required parameter is missing or a parameter cannot be converted to its type.
             * HTTP 401 when `api_key_value` is defined but it is invalid.
             * HTTP 404 when fulfillment function is not defined for the provided action.
+            * HTTP 413 when the request body is larger than `max_body_size`.
+            * HTTP 415 when the content encoding of the request is not gzip.
+            * HTTP 503 when the queue of the fulfillment function is full and it has no fallback response.
+            * HTTP 504 when the fulfillment function timed out and it has no fallback response.
             * Otherwise it returns a valid application/json content-type HTTP response.
 
             The response can be create using the helper function of `make_response_apiai()`
@@ -111,6 +141,12 @@ class APIAIWebhook(flask.Flask):
                         return app.make_response_apiai(speech="Hello, World!"
                                                        display_text="Hello, World! I am please to meet you!")
 
+            Coroutine fulfillment functions are supported as well:
+
+                    @app.fulfillment("hello-world")
+                    async def my_fulfillment_async():
+                        return app.make_response_apiai(speech="Hello, World!")
+
             The response will be like:
 
                     {
@@ -122,42 +158,132 @@ class APIAIWebhook(flask.Flask):
                         "followupEvent": None
                     }
         """
-        if self.api_key_value is not None:
-            api_key_value = flask.request.headers.get(self.api_key_header)
-            if api_key_value is None:
-                msg = "api-key http header is required"
-                self.logger.error(msg)
-                flask.abort(400, msg)
-                return
-
-            if api_key_value != self.api_key_value:
-                msg = "api-key is invalid"
-                self.logger.error(msg)
-                flask.abort(401, msg)
-                return
-
-        req = flask.request.get_json(force=True)
-        self.logger.debug("request: %s" % json.dumps(req))
-
-        result = req["result"]
-        action = result.get("action", "")
-        parameters = result.get("parameters", {})
-
-        self.logger.debug("%s: %s" % (action, parameters))
-
-        if action in self.fulfillment_functions:
-            res = self.fulfillment_functions[action](**parameters)
-        else:
-            msg = "fulfillment is not implemented: %s" % action
-            self.logger.error(msg)
-            flask.abort(404, msg)
+        deadline = Deadline(self.deadline)
+        request_timer = self.metrics.start() if self.metrics is not None else None
+        try:
+            self.check_api_key(flask.request.headers.get(self.api_key_header))
+            if request_timer is not None:
+                request_timer.mark("auth")
+
+            log_payload = self.payload_logger.sample()
+            request = flask.request
+            body = self.read_request(request.stream.read, request.content_length,
+                                     request.headers.get("Content-Encoding"))
+            if log_payload:
+                self.payload_logger.request(body)
+
+            payload = WebhookPayload(body, self.json_backend.loads)
+            if self.profiler is None:
+                res = self.fulfill(payload, request_timer, deadline)
+            else:
+                res = self.profiler.call(self.profile_key(payload.action),
+                                         request.headers.get(self.profiler.debug_header),
+                                         self.fulfill, payload, request_timer, deadline)
+        except WebhookError as e:
+            if request_timer is not None:
+                request_timer.finish(e.status)
+            flask.abort(e.status, e.message)
             return
+        except Exception:
+            if request_timer is not None:
+                request_timer.finish(500)
+            raise
 
-        res = json.dumps(res)
-        self.logger.debug("response: %s" % res)
+        if request_timer is not None:
+            request_timer.finish(200)
+        if log_payload:
+            self.payload_logger.response(res)
 
+        res, coding = self.compress_response(res, flask.request.headers.get("Accept-Encoding"))
         r = flask.make_response(res)
         r.headers['Content-Type'] = 'application/json'
+        if coding is not None:
+            r.headers['Content-Encoding'] = coding
+        if self.compression is not None:
+            r.headers['Vary'] = 'Accept-Encoding'
+        return r
+
+    def webhook_batch(self):
+        """
+        Batch webhook dispatcher. It accepts a JSON array or an NDJSON stream (`application/x-ndjson`)
+        of webhook requests, validates the authentication header once, then dispatches every request
+        by the same fulfillment functions as the webhook dispatcher.
+
+        The results are streamed back as NDJSON in the order of the requests, one line per request:
+
+            {"index": 0, "status": 200, "response": {"speech": "Hello, World!", ...}}
+            {"index": 1, "status": 404, "error": "fulfillment is not implemented: unknown"}
+
+        When `batch_workers` is defined, the requests are dispatched in parallel by a thread pool.
+
+        :return:
+            * HTTP 400 when `api_key_value` is defined but it the authentication header is not provided.
+            * HTTP 400 when the body is not a JSON array or an NDJSON stream.
+            * HTTP 401 when `api_key_value` is defined but it is invalid.
+            * HTTP 413 when the request body is larger than `max_body_size`.
+            * HTTP 415 when the content encoding of the request is not gzip.
+            * Otherwise it returns an application/x-ndjson content-type HTTP response.
+        """
+        from apiaiwebhook.batch import encode_item, iter_ndjson, ordered_map
+
+        request = flask.request
+        ndjson = request.mimetype == "application/x-ndjson"
+        try:
+            self.check_api_key(request.headers.get(self.api_key_header))
+            log_payload = self.payload_logger.sample()
+            body = self.read_request(request.stream.read, request.content_length,
+                                     request.headers.get("Content-Encoding"))
+            if ndjson:
+                items = iter_ndjson(io.BytesIO(body))
+            else:
+                items = self.json_backend.loads(body)
+                if not isinstance(items, list):
+                    raise WebhookError(400, "request body is not a JSON array")
+        except ValueError:
+            flask.abort(400, "request body is not a valid JSON document")
+            return
+        except WebhookError as e:
+            flask.abort(e.status, e.message)
+            return
+        debug_value = request.headers.get(self.profiler.debug_header) if self.profiler is not None else None
+
+        def fulfill(item):
+            if log_payload:
+                self.payload_logger.request(item)
+            payload = WebhookPayload(item, self.json_backend.loads) if ndjson else WebhookPayload(data=item)
+            status, res = self.fulfill_batch_item(payload, debug_value)
+            if log_payload and status == 200:
+                self.payload_logger.response(res)
+            return status, res
+
+        def generate():
+            results = ordered_map(fulfill, items, self.batch_executor, self.batch_window)
+            for index, (status, body) in enumerate(results):
+                yield encode_item(index, status, body)
+
+        return flask.Response(flask.stream_with_context(generate()), mimetype="application/x-ndjson")
+
+    def metrics_view(self):
+        """
+        Exports the metrics of the webhook dispatcher in the Prometheus text exposition format.
+        """
+        r = flask.make_response(self.metrics.render_prometheus())
+        r.headers['Content-Type'] = 'text/plain; version=0.0.4'
+        return r
+
+    def profile_view(self):
+        """
+        Serves the profiles of the profiler, see :class:`Profiler`.
+        """
+        request = flask.request
+        try:
+            body, content_type = self.render_profile(request.args, request.headers.get(self.profiler.debug_header),
+                                                     request.headers.get(self.api_key_header))
+        except WebhookError as e:
+            flask.abort(e.status, e.message)
+            return
+        r = flask.make_response(body)
+        r.headers['Content-Type'] = content_type
         return r
 
     def test_client_apiai(self):
@@ -167,46 +293,34 @@ class APIAIWebhook(flask.Flask):
             app.testing = True
             client = app.test_client_apiai()
 
-        :return: A APIAIWebhookTestClient class
+        :return: A APIAIWebhookClient object
         """
         flask_test_client = super(APIAIWebhook, self).test_client()
         flask_test_client.__class__ = APIAIWebhookClient
         flask_test_client.apiai_webhook = self
         return flask_test_client
 
-    def make_response_apiai(self,
-                            speech=None,
-                            display_text=None,
-                            data=None,
-                            context_out=[],
-                            followup_event=None):
-        """
-        Convert the return value from a fulfillment function to the expected response.
-
-        :param speech: String. Response to the request.
-        :param display_text: String. Response to the request.
-        :param data: Object. Additional data required for performing the action on the client side.
-        The data is sent to the client in the original form and is not processed by API.AI.
-        :param context_out: Array of context objects. Such contexts are activated after intent completion.
-        Example: "contextOut": [{"name":"weather", "lifespan":2, "parameters":{"city":"Rome"}}]
-        :param followup_event: Object. Event name and optional parameters sent from the web service to API.AI.
-        Example: {"followupEvent":{"name":"<event_name>","data":{"<parameter_name>":"<parameter_value>"}}}
-        :return: dictionary which can be converted to a JSON object by the webhook dispatcher.
-        """
-        return {
-            "speech": speech,
-            "displayText": display_text,
-            "data": data,
-            "contextOut": context_out,
-            "source": self.name,
-            "followupEvent": followup_event
-        }
-
     def __init__(self,
                  import_name,
                  api_key_header="api-key",
                  api_key_value=None,
                  webhook_url="/webhook/",
+                 json_backend=None,
+                 metrics_url=None,
+                 batch_url=None,
+                 batch_workers=None,
+                 deadline=None,
+                 session_store=None,
+                 admission=None,
+                 log_sample_rate=1,
+                 log_redact=None,
+                 log_async=False,
+                 auth_log_interval=60,
+                 compression=None,
+                 max_body_size=None,
+                 http_pool=None,
+                 profiler=None,
+                 slim=False,
                  static_path=None,
                  static_url_path=None,
                  static_folder='static',
@@ -214,6 +328,12 @@ class APIAIWebhook(flask.Flask):
                  instance_path=None,
                  instance_relative_config=False,
                  root_path=None):
+        if slim:
+            static_folder = template_folder = None
+            if root_path is None:
+                root_path = os.getcwd()
+            if instance_path is None:
+                instance_path = os.path.join(root_path, "instance")
         super(APIAIWebhook, self).__init__(
             import_name,
             static_path,
@@ -224,48 +344,37 @@ class APIAIWebhook(flask.Flask):
             instance_relative_config,
             root_path)
 
-        self.api_key_header = api_key_header
-        self.api_key_value = api_key_value
-        self.fulfillment_functions = {}
-        self.webhook_url = webhook_url
-        self.add_url_rule(webhook_url, "webhook", self.webhook, methods=['POST'])
-        if self.api_key_value is None:
-            self.logger.warning("api-key is empty! use 'api_key_value' parameter to define it.")
-
-
-class APIAIWebhookClient(flask.testing.FlaskClient):
-    """
-    The API.AI Webhook Client extends the Flask Client in order to post valid webhook messages.
-
-        app.testing = True
-        app.debug = True
-        r = app.test_client_apiai().webhook(action="hello-world",
-                                            parameters={"param": "value"})
-    """
-
-    def __init__(self, *args, **kwargs):
-        super(APIAIWebhookClient, self).__init__(*args, **kwargs)
-        self.apiai_webhook = None
-
-    def webhook(self,
-                action=None,
-                parameters={}):
-        """
-        Uses a regular Flask test client in order to post valid webhook messages.
-
-        :param action: action to tested
-        :param parameters: parameters of the action as dictionary
-        :return: returns a response object as a regular Flask test client
-        """
-        req = {
-            "result": {
-                "action": action,
-                "parameters": parameters
-            }
-        }
+        WebhookEngine.__init__(
+            self,
+            import_name,
+            api_key_header,
+            api_key_value,
+            webhook_url,
+            json_backend,
+            metrics_url,
+            deadline,
+            session_store,
+            admission,
+            log_sample_rate,
+            log_redact,
+            log_async,
+            auth_log_interval,
+            compression,
+            max_body_size,
+            http_pool,
+            profiler)
 
-        return self.post(
-            self.apiai_webhook.webhook_url,
-            data=json.dumps(req),
-            content_type="application/json",
-            headers={self.apiai_webhook.api_key_header: self.apiai_webhook.api_key_value})
+        self.add_url_rule(webhook_url, "webhook", self.webhook, methods=['POST'])
+        if metrics_url is not None:
+            self.add_url_rule(metrics_url, "metrics", self.metrics_view, methods=['GET'])
+        if profiler is not None:
+            self.add_url_rule(profiler.url, "profile", self.profile_view, methods=['GET'])
+        self.batch_url = batch_url
+        self.batch_executor = None
+        self.batch_window = None
+        if batch_workers is not None:
+            from concurrent.futures import ThreadPoolExecutor
+            self.batch_executor = ThreadPoolExecutor(batch_workers)
+            self.batch_window = 2 * batch_workers
+        if batch_url is not None:
+            self.add_url_rule(batch_url, "webhook_batch", self.webhook_batch, methods=['POST'])
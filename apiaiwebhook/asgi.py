@@ -0,0 +1,428 @@
+# Copyright (C) 2017 Paoro
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+import io
+import threading
+from urllib.parse import parse_qsl
+
+from apiaiwebhook.context import Deadline, FulfillmentContext
+from apiaiwebhook.exceptions import FallbackResponse, WebhookError
+from apiaiwebhook.payload import WebhookPayload
+
+_local = threading.local()
+
+
+def run_coroutine(coro):
+    """
+    Runs a coroutine to completion on the event loop of the current thread.
+    The event loop is created on the first call and reused by the later calls,
+    so the WSGI request threads do not pay for a new event loop per request.
+
+    :param coro: the coroutine returned by an `async def` fulfillment function
+    :return: the result of the coroutine
+    """
+    loop = getattr(_local, "loop", None)
+    if loop is None or loop.is_closed():
+        loop = _local.loop = asyncio.new_event_loop()
+    return loop.run_until_complete(coro)
+
+
+class ASGIWebhook(object):
+    """
+    ASGI application which dispatches the webhook requests of a :class:`WebhookEngine`
+    concurrently on one event loop. It shares the `fulfillment_functions` registry,
+    the authentication settings and the `webhook_url` of the webhook object.
+
+    Coroutine fulfillment functions are awaited directly, regular functions are
+    run in the executor, so they never block the event loop.
+
+    :param webhook:  the :class:`WebhookEngine` object, e.g. an :class:`APIAIWebhook`
+    :param executor: `concurrent.futures.Executor` for the regular fulfillment functions.
+                     Defaults to the default executor of the event loop.
+    """
+
+    def __init__(self, webhook, executor=None):
+        self.webhook = webhook
+        self.executor = executor
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self.lifespan(receive, send)
+            return
+
+        if scope["type"] != "http":
+            raise ValueError("unsupported ASGI scope type: %s" % scope["type"])
+
+        metrics = self.webhook.metrics
+        if metrics is not None and scope["path"] == self.webhook.metrics_url and scope["method"] == "GET":
+            await self.send_response(send, 200, metrics.render_prometheus().encode("utf-8"),
+                                     b"text/plain; version=0.0.4")
+            return
+        profiler = self.webhook.profiler
+        if profiler is not None and scope["path"] == profiler.url and scope["method"] == "GET":
+            await self.profile(scope, send)
+            return
+
+        deadline = Deadline(self.webhook.deadline)
+        request_timer = metrics.start() if metrics is not None else None
+        try:
+            res = await self.handle(scope, receive, request_timer, deadline)
+        except WebhookError as e:
+            if request_timer is not None:
+                request_timer.finish(e.status)
+            await self.send_response(send, e.status, e.message.encode("utf-8"), b"text/plain; charset=utf-8")
+            return
+        except Exception:
+            if request_timer is not None:
+                request_timer.finish(500)
+            raise
+
+        if request_timer is not None:
+            request_timer.finish(200)
+        res, coding = self.webhook.compress_response(res, self.get_header(scope, b"accept-encoding"))
+        headers = None
+        if self.webhook.compression is not None:
+            headers = [(b"vary", b"Accept-Encoding")]
+            if coding is not None:
+                headers.append((b"content-encoding", coding.encode("latin-1")))
+        await self.send_response(send, 200, res, b"application/json", headers)
+
+    async def handle(self, scope, receive, request_timer=None, deadline=None):
+        """
+        Validates and dispatches one HTTP request.
+
+        :param request_timer: A RequestTimer object when the phases of the request are measured
+        :param deadline: the :class:`Deadline` of the request
+        :return: the JSON encoded response as bytes
+        :raise WebhookError: when the request cannot be fulfilled
+        """
+        if scope["path"].rstrip("/") != self.webhook.webhook_url.rstrip("/"):
+            raise WebhookError(404, "not found: %s" % scope["path"])
+
+        if scope["method"] != "POST":
+            raise WebhookError(405, "method is not allowed: %s" % scope["method"])
+
+        return await self.handle_request(scope, receive, request_timer, deadline)
+
+    async def handle_request(self, scope, receive, request_timer=None, deadline=None):
+        """
+        Authenticates, reads and dispatches a POST request of the webhook URL.
+
+        :return: the JSON encoded response as bytes
+        :raise WebhookError: when the request cannot be fulfilled
+        """
+        self.webhook.check_api_key(self.get_header(scope, self.webhook.api_key_header.lower().encode("latin-1")))
+        if request_timer is not None:
+            request_timer.mark("auth")
+
+        body = await self.read_body(receive, self.webhook.max_body_size)
+        content_encoding = self.get_header(scope, b"content-encoding")
+        if content_encoding is not None:
+            body = self.webhook.read_request(io.BytesIO(body).read, len(body), content_encoding)
+        log_payload = self.webhook.payload_logger.sample()
+        if log_payload:
+            self.webhook.payload_logger.request(body)
+
+        payload = WebhookPayload(body, self.webhook.json_backend.loads)
+        profile = None
+        profiler = self.webhook.profiler
+        if profiler is not None and profiler.select(
+                self.get_header(scope, profiler.debug_header.lower().encode("latin-1"))):
+            # the function is profiled by the thread which runs it, see `run_fulfillment()`
+            profile = self.webhook.profile_key(payload.action)
+        res = await self.fulfill(payload, request_timer, deadline, profile)
+        if log_payload:
+            self.webhook.payload_logger.response(res)
+        return res
+
+    async def fulfill(self, payload, request_timer=None, deadline=None, profile=None):
+        """
+        Dispatches the request and encodes the response, see `WebhookEngine.fulfill()`.
+
+        :param payload: the request as :class:`WebhookPayload`
+        :param request_timer: A RequestTimer object when the phases of the request are measured
+        :param deadline: the :class:`Deadline` of the request. Defaults to a deadline which starts now.
+        :param profile: the name of the profile when the request is profiled, see :class:`Profiler`
+        :return: the JSON encoded response as bytes
+        """
+        context = FulfillmentContext(payload, deadline or Deadline(self.webhook.deadline), request_timer, profile)
+        plan, kwargs = self.webhook.resolve_fulfillment(payload, context)
+        if request_timer is not None:
+            request_timer.action = context.label
+            request_timer.mark("decode")
+
+        key = None
+        if plan.cache is not None or plan.coalesce:
+            key = plan.cache_key(payload.action, kwargs)
+        if plan.cache is not None:
+            res = plan.cache.get(key)
+            if res is not None:
+                return res
+
+        if plan.coalesce:
+            res, cacheable = await self.coalesce(key, lambda: self.respond(plan, kwargs, context),
+                                                 lambda: self.webhook.coalesced(context.label))
+        else:
+            res, cacheable = await self.respond(plan, kwargs, context)
+
+        if cacheable and plan.cache is not None:
+            plan.cache.set(key, res)
+        return res
+
+    async def respond(self, plan, kwargs, context):
+        """
+        Awaits the fulfillment function and encodes its response, see `WebhookEngine.respond()`.
+        """
+        request_timer = context.request_timer
+        cacheable = True
+        try:
+            res = await self.call_fulfillment(plan, kwargs, context)
+            res = self.webhook.store_session(context, res)
+        except FallbackResponse as e:
+            res = self.webhook.fallback_response(context.label, e)
+            cacheable = False
+        if request_timer is not None:
+            request_timer.mark("handler")
+
+        res = self.webhook.encode_response(res)
+        if request_timer is not None:
+            request_timer.mark("encode")
+        return res, cacheable
+
+    async def coalesce(self, key, f, shared=None):
+        """
+        Awaits the coroutine function, unless a call of the same key is in flight,
+        see `SingleFlight.do()`. The calls in flight are shared with the WSGI threads.
+        """
+        single_flight = self.webhook.single_flight
+        future, leader = single_flight.join(key)
+        if not leader:
+            if shared is not None:
+                shared()
+            return await asyncio.wrap_future(future)
+        try:
+            res = await f()
+        except BaseException as e:
+            single_flight.finish(key, future, exception=e)
+            raise
+        single_flight.finish(key, future, res)
+        return res
+
+    async def dispatch(self, payload):
+        """
+        Calls the fulfillment function of the request. Coroutine functions are awaited,
+        regular functions are run in the executor.
+
+        :param payload: the request as :class:`WebhookPayload`
+        :return: the return value of the fulfillment function
+        """
+        context = FulfillmentContext(payload, Deadline(self.webhook.deadline))
+        plan, kwargs = self.webhook.resolve_fulfillment(payload, context)
+        try:
+            res = await self.call_fulfillment(plan, kwargs, context)
+        except FallbackResponse as e:
+            return self.webhook.fallback_response(context.label, e)
+        return self.webhook.store_session(context, res)
+
+    async def call_fulfillment(self, plan, kwargs, context):
+        """
+        Awaits the fulfillment function, when the request is admitted by the admission control.
+
+        :raise FallbackResponse: when the fallback response of the function is sent instead of its return value
+        """
+        admission = self.webhook.admission
+        if admission is None:
+            return await self.run_fulfillment(plan, kwargs, context)
+        self.webhook.admit(plan, context)
+        try:
+            return await self.run_fulfillment(plan, kwargs, context)
+        finally:
+            admission.release()
+
+    async def run_fulfillment(self, plan, kwargs, context):
+        """
+        Awaits the fulfillment function, see `WebhookEngine.run_fulfillment()`.
+        Coroutine functions are cancelled when their timeout or the deadline of the request is over.
+        The function of a profiled request is profiled by the thread which runs it: the regular functions
+        by the worker thread, the coroutine functions by the event loop.
+
+        :raise FallbackResponse: when the fallback response of the function is sent instead of its return value
+        """
+        webhook = self.webhook
+        timeout, reason = plan.timeout, "timeout"
+        deadline = context.deadline
+        if deadline.budget is not None:
+            remaining = deadline.remaining()
+            if remaining <= 0:
+                webhook.executors.fallback(plan, "deadline")
+            if timeout is None or remaining < timeout:
+                timeout, reason = remaining, "deadline"
+
+        profiler = webhook.profiler if context.profile is not None else None
+        token = None
+        concurrent_future = None
+        if plan.executor != "inline":
+            concurrent_future = webhook.executors.submit(plan, kwargs)
+            future = asyncio.wrap_future(concurrent_future)
+        elif plan.is_coroutine:
+            future = plan.function(**kwargs)
+            if profiler is not None:
+                token = profiler.enable(context.profile)
+        else:
+            def call():
+                profile = profiler.enable(context.profile) if profiler is not None else None
+                try:
+                    res = plan.function(**kwargs)
+                finally:
+                    if profile is not None:
+                        profiler.stop(profile)
+                if deadline.expired():
+                    webhook.late_completion(context.label)
+                return res
+
+            future = asyncio.get_running_loop().run_in_executor(self.executor, call)
+
+        try:
+            res = await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            if concurrent_future is not None and not concurrent_future.cancelled():
+                concurrent_future.add_done_callback(lambda f: webhook.late_completion(context.label))
+            webhook.executors.fallback(plan, reason)
+        finally:
+            if token is not None:
+                profiler.stop(token)
+        if asyncio.iscoroutine(res):
+            res = await res
+        return res
+
+    async def profile(self, scope, send):
+        """
+        Serves the profiles of the profiler, see `WebhookEngine.render_profile()`.
+        """
+        webhook = self.webhook
+        query = dict(parse_qsl(scope.get("query_string", b"").decode("latin-1")))
+        try:
+            body, content_type = webhook.render_profile(
+                query,
+                self.get_header(scope, webhook.profiler.debug_header.lower().encode("latin-1")),
+                self.get_header(scope, webhook.api_key_header.lower().encode("latin-1")))
+        except WebhookError as e:
+            await self.send_response(send, e.status, e.message.encode("utf-8"), b"text/plain; charset=utf-8")
+            return
+        await self.send_response(send, 200, body, content_type.encode("latin-1"))
+
+    @staticmethod
+    def get_header(scope, header_name):
+        """
+        :param header_name: the lower case name of the header as bytes
+        :return: the value of the header or None when it is not provided
+        """
+        for name, value in scope.get("headers", []):
+            if name.lower() == header_name:
+                return value.decode("latin-1")
+        return None
+
+    @staticmethod
+    async def read_body(receive, max_body_size=None):
+        body = b""
+        more_body = True
+        while more_body:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                raise WebhookError(400, "client disconnected")
+            body += message.get("body", b"")
+            if max_body_size is not None and len(body) > max_body_size:
+                raise WebhookError(413, "request body is larger than %d bytes" % max_body_size)
+            more_body = message.get("more_body", False)
+        return body
+
+    @staticmethod
+    async def send_response(send, status, body, content_type, headers=None):
+        response_headers = [
+            (b"content-type", content_type),
+            (b"content-length", str(len(body)).encode("latin-1")),
+        ]
+        if headers:
+            response_headers.extend(headers)
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": response_headers,
+        })
+        await send({
+            "type": "http.response.body",
+            "body": body,
+        })
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                self.webhook.startup()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                self.webhook.shutdown()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+
+class ASGIAgentHost(ASGIWebhook):
+    """
+    ASGI application which serves the agents of an :class:`AgentHost`. Each request is routed to its agent
+    by its URL or its API key, then it is dispatched by the :class:`ASGIWebhook` of the agent.
+
+    :param host:     the :class:`AgentHost` object
+    :param executor: `concurrent.futures.Executor` for the regular fulfillment functions of the agents.
+    """
+
+    def __init__(self, host, executor=None):
+        super(ASGIAgentHost, self).__init__(host, executor)
+        self.apps = {}
+        host.frontends.add(self)
+
+    def agent_app(self, agent):
+        """
+        :return: the ASGIWebhook of the agent, it is created on first use
+        """
+        app = self.apps.get(agent.agent_name)
+        if app is None or app.webhook is not agent:
+            app = self.apps[agent.agent_name] = ASGIWebhook(agent, self.executor)
+            if self.webhook.agents.get(agent.agent_name) is not agent:
+                # the agent was removed while its request was routed
+                self.discard_agent(agent.agent_name)
+        return app
+
+    def discard_agent(self, name):
+        """
+        Drops the application of a removed agent, see `AgentHost.remove_agent()`.
+        """
+        self.apps.pop(name, None)
+
+    async def handle(self, scope, receive, request_timer=None, deadline=None):
+        host = self.webhook
+        agent = host.find_agent(scope["path"], self.get_header(scope, host.api_key_header.lower().encode("latin-1")))
+        try:
+            if scope["method"] != "POST":
+                raise WebhookError(405, "method is not allowed: %s" % scope["method"])
+            res = await self.agent_app(agent).handle_request(scope, receive, request_timer, deadline)
+        except WebhookError as e:
+            host.agent_request(agent, e.status)
+            raise
+        except Exception:
+            host.agent_request(agent, 500)
+            raise
+        host.agent_request(agent, 200)
+        return res
@@ -0,0 +1,118 @@
+# Copyright (C) 2017 Paoro
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import hashlib
+import hmac
+import threading
+
+from apiaiwebhook.context import timer
+
+
+def key_digest(key):
+    if not isinstance(key, bytes):
+        key = key.encode("utf-8")
+    return hashlib.sha256(key).digest()
+
+
+class APIKeyring(object):
+    """
+    Set of the active API keys. Only the SHA-256 digests of the keys are kept and a provided key
+    is compared with every active key in constant time, so the response time does not reveal
+    which key or how much of a key matched. The keys can be rotated without a restart::
+
+        app = APIAIWebhook(__name__, api_key_value=["new-secret", "old-secret"])
+        ...
+        app.api_keys.remove("old-secret")
+
+    :param keys: the active keys as strings
+    """
+
+    def __init__(self, keys=()):
+        self._digests = frozenset(key_digest(key) for key in keys)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._digests)
+
+    @property
+    def digests(self):
+        """
+        The SHA-256 digests of the active keys as frozenset.
+        """
+        return self._digests
+
+    def add(self, key):
+        with self._lock:
+            self._digests = self._digests | {key_digest(key)}
+
+    def remove(self, key):
+        with self._lock:
+            self._digests = self._digests - {key_digest(key)}
+
+    def rotate(self, keys):
+        """
+        Replaces the active keys at once.
+
+        :param keys: the new active keys as strings
+        """
+        digests = frozenset(key_digest(key) for key in keys)
+        with self._lock:
+            self._digests = digests
+
+    def verify(self, key):
+        """
+        :param key: the provided key as string
+        :return: True when the key is active
+        """
+        digest = key_digest(key)
+        valid = False
+        for active in self._digests:
+            valid |= hmac.compare_digest(active, digest)
+        return valid
+
+
+class FailureLog(object):
+    """
+    Rate-limited log of the authentication failures. The failures are counted by their reason
+    and one aggregated message is logged at most once per interval, so a flood of bad requests
+    does not turn into a flood of log writes.
+
+    :param logger:      the logger of the webhook
+    :param interval:    minimum seconds between two messages
+    :param message:     the prefix of the messages
+    """
+
+    def __init__(self, logger, interval=60.0, message="api-key authentication failed"):
+        self.logger = logger
+        self.interval = interval
+        self.message = message
+        self.counts = {}
+        self._logged = None
+        self._lock = threading.Lock()
+
+    def failure(self, reason):
+        """
+        Counts a failure and logs the failures counted since the last message when the interval is over.
+
+        :param reason: the reason of the failure, e.g. "missing" or "invalid"
+        """
+        now = timer()
+        with self._lock:
+            self.counts[reason] = self.counts.get(reason, 0) + 1
+            if self._logged is not None and now - self._logged < self.interval:
+                return
+            counts, self.counts = self.counts, {}
+            self._logged = now
+        self.logger.error("%s: %s" % (self.message, ", ".join("%d %s" % (counts[r], r) for r in sorted(counts))))
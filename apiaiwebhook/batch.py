@@ -0,0 +1,69 @@
+# Copyright (C) 2017 Paoro
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import collections
+import json
+
+
+def iter_ndjson(stream):
+    """
+    Reads an NDJSON stream line by line, the empty lines are skipped.
+
+    :param stream: file-like object of bytes
+    :return: iterator of the lines as bytes
+    """
+    for line in iter(stream.readline, b""):
+        line = line.strip()
+        if line:
+            yield line
+
+
+def ordered_map(f, iterable, executor=None, window=None):
+    """
+    Applies the function to the items and yields the results in the order of the items.
+    When an executor is provided, at most `window` items are processed at the same time,
+    so the items are read from the iterable only as fast as they are processed.
+
+    :param f:           the function
+    :param iterable:    the items
+    :param executor:    `concurrent.futures.Executor` or None when the items are processed one by one
+    :param window:      maximum number of items in flight
+    """
+    if executor is None:
+        for item in iterable:
+            yield f(item)
+        return
+
+    futures = collections.deque()
+    for item in iterable:
+        futures.append(executor.submit(f, item))
+        if len(futures) >= window:
+            yield futures.popleft().result()
+    while futures:
+        yield futures.popleft().result()
+
+
+def encode_item(index, status, body):
+    """
+    Encodes the result of one request of a batch as an NDJSON line.
+
+    :param index:   the index of the request in the batch
+    :param status:  HTTP status code of the request
+    :param body:    the JSON encoded response as bytes when the status is 200, otherwise the error message
+    :return: the line as bytes
+    """
+    if status == 200:
+        return b'{"index":' + str(index).encode("ascii") + b',"status":200,"response":' + body + b'}\n'
+    return (json.dumps({"index": index, "status": status, "error": body}) + "\n").encode("utf-8")
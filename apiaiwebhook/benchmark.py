@@ -0,0 +1,456 @@
+# Copyright (C) 2017 Paoro
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Load generation and latency benchmark of the webhook dispatcher. usage::
+
+    python -m apiaiwebhook.benchmark hello_world:app --action hello-world --driver wsgi --requests 5000
+
+The results can be saved as a baseline and compared to it later:
+
+    python -m apiaiwebhook.benchmark hello_world:app --action hello-world --save baseline.json
+    python -m apiaiwebhook.benchmark hello_world:app --action hello-world --compare baseline.json
+"""
+
+import argparse
+import importlib
+import io
+import json
+import math
+import random
+import socket
+import sys
+import threading
+import time
+import uuid
+
+try:
+    import http.client as httplib
+except ImportError:
+    import httplib
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+
+class PayloadGenerator(object):
+    """
+    Generates API.AI (Dialogflow v1) webhook requests.
+
+    :param actions:         dictionary of actions and their weights, e.g. {"hello-world": 3, "weather": 1}
+    :param parameters:      dictionary of actions and the parameters which are sent for them
+    :param parameter_count: number of parameters per request, the missing ones are filled by generated parameters
+    :param context_count:   number of contexts per request
+    :param size:            approximate size of the requests in bytes, the requests are padded by `originalRequest`
+    :param seed:            seed of the random action mix
+    """
+
+    def __init__(self, actions, parameters=None, parameter_count=20, context_count=3, size=None, seed=0):
+        self.actions = list(actions.keys())
+        self.weights = [actions[action] for action in self.actions]
+        self.parameters = parameters or {}
+        self.parameter_count = parameter_count
+        self.context_count = context_count
+        self.size = size
+        self.random = random.Random(seed)
+
+    def make_request(self, action):
+        """
+        :return: the request of the action as dictionary
+        """
+        parameters = dict(("parameter%d" % i, "value %d" % i) for i in range(self.parameter_count))
+        parameters.update(self.parameters.get(action, {}))
+        req = {
+            "id": str(uuid.UUID(int=self.random.getrandbits(128))),
+            "timestamp": "2017-05-10T10:00:00.000Z",
+            "lang": "en",
+            "sessionId": "%016x" % self.random.getrandbits(64),
+            "result": {
+                "source": "agent",
+                "resolvedQuery": "benchmark %s" % action,
+                "action": action,
+                "actionIncomplete": False,
+                "parameters": parameters,
+                "contexts": [{"name": "context%d" % i, "lifespan": 5, "parameters": parameters}
+                             for i in range(self.context_count)],
+                "metadata": {"intentId": "%032x" % self.random.getrandbits(128),
+                             "webhookUsed": "true",
+                             "intentName": action},
+                "fulfillment": {"speech": "", "messages": [{"type": 0, "speech": ""}]},
+                "score": 1,
+            },
+            "status": {"code": 200, "errorType": "success"},
+            "originalRequest": {"source": "benchmark", "data": {}},
+        }
+        if self.size is not None:
+            req["originalRequest"]["data"]["padding"] = ""
+            padding = self.size - len(json.dumps(req))
+            if padding > 0:
+                req["originalRequest"]["data"]["padding"] = "x" * padding
+        return req
+
+    def generate(self, count):
+        """
+        Generates the encoded requests by the weighted action mix.
+
+        :param count: number of requests
+        :return: list of requests as bytes
+        """
+        bodies = {}
+        for action in self.actions:
+            bodies[action] = json.dumps(self.make_request(action)).encode("utf-8")
+        return [bodies[self.choose()] for _ in range(count)]
+
+    def choose(self):
+        r = self.random.uniform(0, sum(self.weights))
+        for action, weight in zip(self.actions, self.weights):
+            r -= weight
+            if r <= 0:
+                return action
+        return self.actions[-1]
+
+
+class TestClientDriver(object):
+    """
+    Drives the requests through the Flask test client.
+    """
+
+    name = "test-client"
+
+    def __init__(self, app, headers=None):
+        self.app = app
+        self.client = app.test_client()
+        self.headers = headers or {}
+
+    def request(self, body):
+        return self.fetch(body)[0]
+
+    def fetch(self, body):
+        """
+        :return: tuple of the HTTP status code and the response body as bytes
+        """
+        r = self.client.post(self.app.webhook_url, data=body, content_type="application/json", headers=self.headers)
+        return r.status_code, r.data
+
+    def close(self):
+        pass
+
+
+class WSGIDriver(object):
+    """
+    Calls the WSGI application directly, without the Flask test client.
+    """
+
+    name = "wsgi"
+
+    def __init__(self, app, headers=None):
+        self.app = app
+        self.environ = {
+            "REQUEST_METHOD": "POST",
+            "SCRIPT_NAME": "",
+            "PATH_INFO": app.webhook_url,
+            "QUERY_STRING": "",
+            "SERVER_NAME": "localhost",
+            "SERVER_PORT": "80",
+            "SERVER_PROTOCOL": "HTTP/1.1",
+            "CONTENT_TYPE": "application/json",
+            "wsgi.version": (1, 0),
+            "wsgi.url_scheme": "http",
+            "wsgi.errors": sys.stderr,
+            "wsgi.multithread": False,
+            "wsgi.multiprocess": False,
+            "wsgi.run_once": False,
+        }
+        for name, value in (headers or {}).items():
+            self.environ["HTTP_" + name.upper().replace("-", "_")] = value
+        self.status = None
+
+    def start_response(self, status, headers, exc_info=None):
+        self.status = int(status.split(" ", 1)[0])
+
+    def request(self, body):
+        return self.fetch(body)[0]
+
+    def fetch(self, body):
+        environ = dict(self.environ)
+        environ["CONTENT_LENGTH"] = str(len(body))
+        environ["wsgi.input"] = io.BytesIO(body)
+        iterable = self.app(environ, self.start_response)
+        try:
+            data = b"".join(iterable)
+        finally:
+            close = getattr(iterable, "close", None)
+            if close is not None:
+                close()
+        return self.status, data
+
+    def close(self):
+        pass
+
+
+class RawWSGIDriver(WSGIDriver):
+    """
+    Calls the raw WSGI application of the webhook, see `WebhookEngine.make_wsgi_app()`.
+    """
+
+    name = "raw-wsgi"
+
+    def __init__(self, app, headers=None):
+        super(RawWSGIDriver, self).__init__(app.make_wsgi_app(), headers)
+
+
+class SocketDriver(object):
+    """
+    Serves the application by the Werkzeug development server on a local socket
+    and sends the requests over a keep-alive HTTP connection.
+    """
+
+    name = "socket"
+
+    def __init__(self, app, headers=None):
+        from werkzeug.serving import WSGIRequestHandler, make_server
+
+        class RequestHandler(WSGIRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def log_request(self, *args, **kwargs):
+                pass
+
+        self.app = app
+        self.headers = {"Content-Type": "application/json"}
+        self.headers.update(headers or {})
+        self.server = make_server("127.0.0.1", 0, app, threaded=True, request_handler=RequestHandler)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.connection = httplib.HTTPConnection("127.0.0.1", self.server.server_port)
+        self.connection.connect()
+        self.connection.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def request(self, body):
+        return self.fetch(body)[0]
+
+    def fetch(self, body):
+        self.connection.request("POST", self.app.webhook_url, body, self.headers)
+        r = self.connection.getresponse()
+        return r.status, r.read()
+
+    def close(self):
+        self.connection.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+
+DRIVERS = dict((driver.name, driver) for driver in (TestClientDriver, WSGIDriver, RawWSGIDriver, SocketDriver))
+
+
+def percentile(values, p):
+    """
+    :param values: sorted list of numbers
+    :param p: percentile between 0 and 100
+    :return: the nearest-rank percentile of the values
+    """
+    if not values:
+        return None
+    rank = int(math.ceil(p / 100.0 * len(values))) - 1
+    return values[min(max(rank, 0), len(values) - 1)]
+
+
+class BenchmarkResult(object):
+    """
+    Result of a benchmark run.
+
+    :param name:        name of the run, e.g. the name of the driver
+    :param latencies:   the latencies of the requests in seconds
+    :param seconds:     the duration of the run in seconds
+    :param statuses:    dictionary of HTTP status codes and their counts
+    :param allocated:   average peak of the memory allocated per request in bytes, or None when it is not measured
+    """
+
+    def __init__(self, name, latencies, seconds, statuses, allocated=None):
+        latencies = sorted(latencies)
+        self.name = name
+        self.requests = len(latencies)
+        self.seconds = seconds
+        self.throughput = self.requests / seconds if seconds else 0.0
+        self.p50 = percentile(latencies, 50)
+        self.p95 = percentile(latencies, 95)
+        self.p99 = percentile(latencies, 99)
+        self.statuses = statuses
+        self.allocated = allocated
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "requests": self.requests,
+            "seconds": self.seconds,
+            "throughput": self.throughput,
+            "p50": self.p50,
+            "p95": self.p95,
+            "p99": self.p99,
+            "statuses": dict((str(k), v) for k, v in self.statuses.items()),
+            "allocated": self.allocated,
+        }
+
+    def __str__(self):
+        allocated = "%.1f KiB" % (self.allocated / 1024.0) if self.allocated is not None else "n/a"
+        return "%-12s %8d requests %10.1f req/s   p50 %7.3f ms   p95 %7.3f ms   p99 %7.3f ms   alloc %s   %s" % (
+            self.name, self.requests, self.throughput,
+            self.p50 * 1000, self.p95 * 1000, self.p99 * 1000,
+            allocated, self.statuses)
+
+
+def measure_allocations(driver, bodies):
+    """
+    :return: average peak of the memory allocated per request in bytes, or None when tracemalloc is not available
+    """
+    if tracemalloc is None or not hasattr(tracemalloc, "reset_peak"):
+        return None
+    total = 0
+    tracemalloc.start()
+    try:
+        for body in bodies:
+            current = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            driver.request(body)
+            total += tracemalloc.get_traced_memory()[1] - current
+    finally:
+        tracemalloc.stop()
+    return total / float(len(bodies))
+
+
+def run_benchmark(driver, bodies, warmup=100, allocations=100):
+    """
+    Sends the requests by the driver and measures the latencies.
+
+    :param driver:      a driver object, e.g. :class:`WSGIDriver`
+    :param bodies:      the requests as bytes, see :class:`PayloadGenerator`
+    :param warmup:      number of requests sent before the measurement
+    :param allocations: number of requests whose allocations are measured after the run
+    :return: A BenchmarkResult object
+    """
+    for body in bodies[:warmup]:
+        driver.request(body)
+
+    latencies = []
+    statuses = {}
+    timer = getattr(time, "perf_counter", time.time)
+    started = timer()
+    for body in bodies:
+        t = timer()
+        status = driver.request(body)
+        latencies.append(timer() - t)
+        statuses[status] = statuses.get(status, 0) + 1
+    seconds = timer() - started
+
+    allocated = measure_allocations(driver, bodies[:allocations]) if allocations else None
+    return BenchmarkResult(driver.name, latencies, seconds, statuses, allocated)
+
+
+def save_results(path, results):
+    with open(path, "w") as f:
+        json.dump([result.to_dict() for result in results], f, indent=2, sort_keys=True)
+
+
+def compare_results(results, baseline, tolerance=0.1):
+    """
+    Compares the results to a baseline saved by :func:`save_results`.
+
+    :param results:     list of BenchmarkResult objects
+    :param baseline:    list of dictionaries loaded from the baseline file
+    :param tolerance:   relative tolerance, e.g. 0.1 allows 10% lower throughput or 10% higher latency
+    :return: list of regressions as strings
+    """
+    baseline = dict((result["name"], result) for result in baseline)
+    regressions = []
+    for result in results:
+        base = baseline.get(result.name)
+        if base is None:
+            continue
+        if result.throughput < base["throughput"] * (1 - tolerance):
+            regressions.append("%s: throughput %.1f req/s < %.1f req/s" % (
+                result.name, result.throughput, base["throughput"]))
+        for key in ("p50", "p95", "p99"):
+            if getattr(result, key) > base[key] * (1 + tolerance):
+                regressions.append("%s: %s %.3f ms > %.3f ms" % (
+                    result.name, key, getattr(result, key) * 1000, base[key] * 1000))
+    return regressions
+
+
+def load_app(name):
+    """
+    :param name: "module:attribute", e.g. "hello_world:app"
+    """
+    module_name, _, attribute = name.partition(":")
+    return getattr(importlib.import_module(module_name), attribute or "app")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark of an API.AI webhook application.")
+    parser.add_argument("app", help="the application as module:attribute, e.g. hello_world:app")
+    parser.add_argument("--action", action="append", default=[],
+                        help="action and its weight as action[=weight], it can be repeated")
+    parser.add_argument("--driver", action="append", choices=sorted(DRIVERS), default=[],
+                        help="driver, it can be repeated. Defaults to all drivers.")
+    parser.add_argument("--requests", type=int, default=2000, help="number of requests per driver")
+    parser.add_argument("--parameters", type=int, default=20, help="number of parameters per request")
+    parser.add_argument("--contexts", type=int, default=3, help="number of contexts per request")
+    parser.add_argument("--size", type=int, default=None, help="approximate size of the requests in bytes")
+    parser.add_argument("--save", help="save the results as a baseline to this file")
+    parser.add_argument("--compare", help="compare the results to the baseline of this file")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="relative tolerance of the comparison")
+    args = parser.parse_args(argv)
+
+    sys.path.insert(0, ".")
+    app = load_app(args.app)
+
+    actions = {}
+    for action in args.action or ["hello-world"]:
+        name, _, weight = action.partition("=")
+        actions[name] = float(weight or 1)
+    generator = PayloadGenerator(actions, parameter_count=args.parameters, context_count=args.contexts,
+                                 size=args.size)
+    bodies = generator.generate(args.requests)
+    headers = {}
+    if getattr(app, "api_key_value", None) is not None:
+        headers[app.api_key_header] = app.api_key_value
+
+    results = []
+    for name in args.driver or sorted(DRIVERS):
+        driver = DRIVERS[name](app, headers)
+        try:
+            result = run_benchmark(driver, bodies)
+        finally:
+            driver.close()
+        print(result)
+        results.append(result)
+
+    if args.save:
+        save_results(args.save, results)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare_results(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print("REGRESSION %s" % regression)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,257 @@
+# Copyright (C) 2017 Paoro
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+def cache_key(action, kwargs):
+    """
+    Canonical key of a fulfillment: the hash of the action and the bound parameters,
+    independent of the order of the parameters.
+
+    :param action:  the action of the request
+    :param kwargs:  the keyword arguments of the fulfillment function
+    :return: hexadecimal SHA-1 digest as string
+    """
+    canonical = json.dumps([action, kwargs], sort_keys=True, separators=(",", ":"), default=repr)
+    return hashlib.sha1(canonical.encode("utf-8")).hexdigest()
+
+
+class CacheBackend(object):
+    """
+    Interface of the stores of the response cache. The values are the encoded responses as bytes.
+    Implement it to share the cache between the worker processes, e.g. by Redis or Memcached.
+    """
+
+    def get(self, key):
+        """
+        :return: the value of the key as bytes or None when it is not cached or it is expired
+        """
+        raise NotImplementedError()
+
+    def set(self, key, value, ttl=None):
+        """
+        :param key:     the key as string
+        :param value:   the value as bytes
+        :param ttl:     time to live in seconds, None when the value does not expire
+        """
+        raise NotImplementedError()
+
+    def set_many(self, items, ttl=None):
+        """
+        Stores several values at once. Override it when the store can write them in one round trip.
+
+        :param items:   dictionary of the keys and the values
+        :param ttl:     time to live in seconds, None when the values do not expire
+        """
+        for key, value in items.items():
+            self.set(key, value, ttl)
+
+    def delete(self, key):
+        raise NotImplementedError()
+
+    def clear(self):
+        raise NotImplementedError()
+
+
+class LRUCache(CacheBackend):
+    """
+    In-process cache store. When the cache is full, the least recently used entries are evicted.
+
+    :param max_entries: maximum number of entries
+    :param max_bytes:   maximum size of the keys and values in bytes, None when the size is not limited
+    """
+
+    def __init__(self, max_entries=1024, max_bytes=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires is not None and expires <= time.time():
+                self._remove(key)
+                self.expirations += 1
+                return None
+            del self._entries[key]
+            self._entries[key] = entry
+            return value
+
+    def set(self, key, value, ttl=None):
+        size = len(key) + len(value)
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+        expires = time.time() + ttl if ttl is not None else None
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, expires)
+            self.size += size
+            while len(self._entries) > self.max_entries or \
+                    (self.max_bytes is not None and self.size > self.max_bytes):
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def _remove(self, key):
+        value, expires = self._entries.pop(key)
+        self.size -= len(key) + len(value)
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "bytes": self.size,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+class SQLiteCache(CacheBackend):
+    """
+    Cache store in an SQLite database file. It is shared by the worker processes of one host
+    and it survives restarts, so it stands in for a networked store in development and small deployments.
+
+    :param path:    path of the database file, ":memory:" for a private in-memory database
+    :param table:   name of the table of the entries
+    """
+
+    def __init__(self, path, table="cache"):
+        self.path = path
+        self.table = table
+        self._connection = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def connection(self):
+        # connections must not be shared by forked worker processes
+        if self._connection is None or self._pid != os.getpid():
+            import sqlite3
+            self._connection = sqlite3.connect(self.path, timeout=10, check_same_thread=False,
+                                               isolation_level=None)
+            self._connection.execute("CREATE TABLE IF NOT EXISTS %s "
+                                     "(key TEXT PRIMARY KEY, value BLOB, expires REAL)" % self.table)
+            self._pid = os.getpid()
+        return self._connection
+
+    def get(self, key):
+        with self._lock:
+            row = self.connection().execute("SELECT value, expires FROM %s WHERE key = ?" % self.table,
+                                            (key,)).fetchone()
+        if row is None:
+            return None
+        value, expires = row
+        if expires is not None and expires <= time.time():
+            self.delete(key)
+            return None
+        return bytes(value)
+
+    def set(self, key, value, ttl=None):
+        self.set_many({key: value}, ttl)
+
+    def set_many(self, items, ttl=None):
+        expires = time.time() + ttl if ttl is not None else None
+        import sqlite3
+        rows = [(key, sqlite3.Binary(value), expires) for key, value in items.items()]
+        with self._lock:
+            connection = self.connection()
+            connection.execute("BEGIN")
+            try:
+                connection.executemany("INSERT OR REPLACE INTO %s (key, value, expires) VALUES (?, ?, ?)"
+                                       % self.table, rows)
+            except Exception:
+                connection.execute("ROLLBACK")
+                raise
+            connection.execute("COMMIT")
+
+    def delete(self, key):
+        with self._lock:
+            self.connection().execute("DELETE FROM %s WHERE key = ?" % self.table, (key,))
+
+    def clear(self):
+        with self._lock:
+            self.connection().execute("DELETE FROM %s" % self.table)
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None and self._pid == os.getpid():
+                self._connection.close()
+            self._connection = None
+
+
+class ResponseCache(object):
+    """
+    Response cache policy of a fulfillment function. The encoded responses are cached
+    by the action and the parameters declared by the function. usage::
+
+        @app.fulfillment("faq", cache=ResponseCache(ttl=300, max_entries=10000))
+        def faq(question):
+            return app.make_response_apiai(speech=answer(question))
+
+    Use it only for the fulfillment functions which depend on their parameters only.
+
+    :param ttl:         time to live of the responses in seconds, None when they do not expire
+    :param max_entries: maximum number of cached responses of the in-process store
+    :param max_bytes:   maximum size of the cached responses of the in-process store
+    :param backend:     a :class:`CacheBackend` object, e.g. a shared store. Defaults to an in-process :class:`LRUCache`.
+    """
+
+    def __init__(self, ttl=60, max_entries=1024, max_bytes=None, backend=None):
+        self.ttl = ttl
+        self.backend = backend if backend is not None else LRUCache(max_entries, max_bytes)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        value = self.backend.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key, value):
+        self.backend.set(key, value, self.ttl)
+
+    def stats(self):
+        stats = {"hits": self.hits, "misses": self.misses}
+        backend_stats = getattr(self.backend, "stats", None)
+        if backend_stats is not None:
+            stats.update(backend_stats())
+        return stats
@@ -0,0 +1,105 @@
+# Copyright (C) 2017 Paoro
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import threading
+
+try:
+    from concurrent.futures import Future
+except ImportError:
+    Future = None
+
+
+class _Future(object):
+    """
+    Minimal future of a call in flight, when `concurrent.futures` is not available (Python 2 without `futures`).
+    """
+
+    def __init__(self):
+        self._done = threading.Event()
+        self._result = None
+        self._exception = None
+
+    def set_result(self, result):
+        self._result = result
+        self._done.set()
+
+    def set_exception(self, exception):
+        self._exception = exception
+        self._done.set()
+
+    def result(self):
+        self._done.wait()
+        if self._exception is not None:
+            raise self._exception
+        return self._result
+
+
+class SingleFlight(object):
+    """
+    Coalesces identical concurrent calls: while a call of a key is in flight, the later calls of the same key
+    wait for it and share its result or its exception instead of calling the function again.
+    The threads of the WSGI server and the coroutines of the ASGI application share the calls in flight,
+    see `ASGIWebhook.coalesce()`.
+    """
+
+    def __init__(self):
+        self.saved = 0
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._calls)
+
+    def join(self, key):
+        """
+        :return: tuple of the future of the call of the key and True when the caller has to make the call
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                self.saved += 1
+                return future, False
+            future = self._calls[key] = Future() if Future is not None else _Future()
+            return future, True
+
+    def finish(self, key, future, result=None, exception=None):
+        with self._lock:
+            del self._calls[key]
+        if exception is not None:
+            future.set_exception(exception)
+        else:
+            future.set_result(result)
+
+    def do(self, key, f, shared=None):
+        """
+        Calls the function, unless a call of the same key is in flight.
+
+        :param key:     the key of the call, e.g. the cache key of the action and the parameters
+        :param f:       the function without arguments
+        :param shared:  function which is called when the result of a call in flight is shared
+        :return: the result of the function
+        """
+        future, leader = self.join(key)
+        if not leader:
+            if shared is not None:
+                shared()
+            return future.result()
+        try:
+            res = f()
+        except BaseException as e:
+            self.finish(key, future, exception=e)
+            raise
+        self.finish(key, future, res)
+        return res
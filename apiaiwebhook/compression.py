@@ -0,0 +1,205 @@
+# Copyright (C) 2017 Paoro
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import zlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+from apiaiwebhook.exceptions import WebhookError
+
+CHUNK_SIZE = 64 * 1024
+
+
+def parse_accept_encoding(header):
+    """
+    Parses an `Accept-Encoding` header.
+
+    :param header: value of the header, e.g. "gzip, deflate, br;q=0.9"
+    :return: dictionary of the content codings and their quality values
+    """
+    codings = {}
+    for item in header.split(","):
+        coding, _, params = item.partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        codings[coding] = q
+    return codings
+
+
+def gzip_compress(data, level=6):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
+class Compression(object):
+    """
+    Negotiated compression of the responses. The content coding is selected by the `Accept-Encoding`
+    header of the request, the responses shorter than the threshold are sent uncompressed. usage::
+
+        app = APIAIWebhook(__name__, compression=Compression(threshold=1024))
+
+    :param threshold:       responses shorter than this many bytes are not compressed. Defaults to 1024.
+    :param gzip_level:      compression level of gzip, 1-9. Defaults to 6.
+    :param brotli_quality:  compression quality of Brotli, 0-11. Defaults to 4, which is fast enough for
+                            dynamic responses.
+    :param codings:         the supported content codings in order of preference, "br" and "gzip".
+                            Defaults to ("br", "gzip") when the `brotli` package is installed, otherwise ("gzip",).
+    """
+
+    def __init__(self, threshold=1024, gzip_level=6, brotli_quality=4, codings=None):
+        if codings is None:
+            codings = ("br", "gzip") if brotli is not None else ("gzip",)
+        for coding in codings:
+            if coding not in ("br", "gzip"):
+                raise ValueError("content coding is not supported: %s" % coding)
+            if coding == "br" and brotli is None:
+                raise ValueError("content coding is not installed: br")
+        self.threshold = threshold
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.codings = tuple(codings)
+        # the clients send a handful of distinct headers, so the negotiation is memoized
+        self._negotiated = {}
+
+    def negotiate(self, accept_encoding):
+        """
+        Selects the content coding of a response.
+
+        :param accept_encoding: value of the `Accept-Encoding` header or None
+        :return: "br", "gzip" or None when the response is not compressed
+        """
+        if not accept_encoding:
+            return None
+        coding = self._negotiated.get(accept_encoding, False)
+        if coding is not False:
+            return coding
+
+        accepted = parse_accept_encoding(accept_encoding)
+        coding, best = None, 0.0
+        for c in self.codings:
+            q = accepted.get(c, accepted.get("*", 0.0))
+            if q > best:
+                coding, best = c, q
+        if len(self._negotiated) < 256:
+            self._negotiated[accept_encoding] = coding
+        return coding
+
+    def compress(self, body, accept_encoding):
+        """
+        Compresses an encoded response by the content coding negotiated with the client.
+
+        :param body: the response as bytes
+        :param accept_encoding: value of the `Accept-Encoding` header or None
+        :return: tuple of the body and its content coding, or None when it is not compressed
+        """
+        if len(body) < self.threshold:
+            return body, None
+        coding = self.negotiate(accept_encoding)
+        if coding == "gzip":
+            return gzip_compress(body, self.gzip_level), coding
+        if coding == "br":
+            return brotli.compress(body, quality=self.brotli_quality), coding
+        return body, None
+
+
+def read_body(read, length=None, content_encoding=None, max_body_size=None):
+    """
+    Reads the body of a request and decompresses it when it is gzip encoded.
+    The body is read and decompressed in chunks, so the size limit is enforced
+    before an oversized body is decompressed or decoded.
+
+    :param read: function which reads at most N bytes of the body, e.g. `environ["wsgi.input"].read`
+    :param length: the content length of the request or None when it is unknown
+    :param content_encoding: value of the `Content-Encoding` header or None
+    :param max_body_size: maximum size of the body in bytes, after decompression. Defaults to None, no limit.
+    :return: the body as bytes
+    :raise WebhookError: HTTP 413 when the body is larger than the limit,
+                         HTTP 415 when its content coding is not supported,
+                         HTTP 400 when it cannot be decompressed
+    """
+    coding = (content_encoding or "identity").strip().lower()
+    if coding not in ("identity", "gzip", "x-gzip"):
+        raise WebhookError(415, "content encoding is not supported: %s" % coding)
+    if max_body_size is not None and length is not None and length > max_body_size:
+        raise WebhookError(413, "request body is larger than %d bytes" % max_body_size)
+
+    if coding == "identity":
+        if length is not None:
+            return read(length)
+        return b"".join(_read_chunks(read, None, max_body_size))
+
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    chunks = []
+    size = 0
+    try:
+        for data in _read_chunks(read, length, None):
+            while data:
+                # the output of one call is bounded, a small body cannot expand unchecked
+                chunk = decompressor.decompress(data, CHUNK_SIZE)
+                size += len(chunk)
+                if max_body_size is not None and size > max_body_size:
+                    raise WebhookError(413, "request body is larger than %d bytes" % max_body_size)
+                chunks.append(chunk)
+                data = decompressor.unconsumed_tail
+        # the decompressor of Python 2 has no eof attribute, its copy is probed before flush() ends the stream
+        probe = decompressor.copy() if not hasattr(decompressor, "eof") else None
+        chunk = decompressor.flush()
+        if max_body_size is not None and size + len(chunk) > max_body_size:
+            raise WebhookError(413, "request body is larger than %d bytes" % max_body_size)
+        chunks.append(chunk)
+    except zlib.error:
+        raise WebhookError(400, "request body cannot be decompressed")
+    if not (decompressor.eof if probe is None else _probe_eof(probe)):
+        raise WebhookError(400, "request body is truncated")
+    return b"".join(chunks)
+
+
+def _probe_eof(decompressor):
+    """
+    :return: True when the decompressor reached the end of the stream, so the data after it is left unused
+    """
+    try:
+        decompressor.decompress(b"\0")
+    except zlib.error:
+        return False
+    return bool(decompressor.unused_data)
+
+
+def _read_chunks(read, length, max_size):
+    remaining = length
+    size = 0
+    while remaining is None or remaining > 0:
+        data = read(CHUNK_SIZE if remaining is None else min(remaining, CHUNK_SIZE))
+        if not data:
+            return
+        size += len(data)
+        if max_size is not None and size > max_size:
+            raise WebhookError(413, "request body is larger than %d bytes" % max_size)
+        if remaining is not None:
+            remaining -= len(data)
+        yield data
@@ -0,0 +1,111 @@
+# Copyright (C) 2017 Paoro
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import time
+
+timer = getattr(time, "perf_counter", time.time)
+
+
+class Deadline(object):
+    """
+    Time budget of a webhook request, tracked from the arrival of the request.
+    Fulfillment functions receive it when they declare a `deadline` parameter,
+    so they can skip optional backend calls when the time is short. usage::
+
+        @app.fulfillment("weather")
+        def weather(city, deadline):
+            forecast = None
+            if deadline.remaining() > 1.0:
+                forecast = backend.forecast(city, timeout=deadline.timeout(2.0))
+            return app.make_response_apiai(speech=describe(city, forecast))
+
+    :param budget:  the budget in seconds, None when the request has no deadline
+    :param started: the arrival of the request as `perf_counter()` value. Defaults to now.
+    """
+
+    __slots__ = ("budget", "started")
+
+    def __init__(self, budget=None, started=None):
+        self.budget = budget
+        self.started = started if started is not None else timer()
+
+    def elapsed(self):
+        """
+        :return: seconds since the arrival of the request
+        """
+        return timer() - self.started
+
+    def remaining(self):
+        """
+        :return: remaining seconds of the budget, it is negative when the budget ran out.
+                 `float("inf")` when the request has no deadline.
+        """
+        if self.budget is None:
+            return float("inf")
+        return self.budget - (timer() - self.started)
+
+    def expired(self):
+        return self.remaining() <= 0
+
+    def timeout(self, default=None):
+        """
+        Timeout of a backend call which ends before the deadline.
+
+        :param default: the timeout of the call in seconds when the request has enough time
+        :return: the smaller of the default and the remaining seconds (at least 0),
+                 or the default when the request has no deadline
+        """
+        if self.budget is None:
+            return default
+        remaining = max(self.remaining(), 0.0)
+        return remaining if default is None else min(default, remaining)
+
+    def __repr__(self):
+        return "<Deadline %.3fs remaining>" % self.remaining()
+
+
+class FulfillmentContext(object):
+    """
+    State of a webhook request while it is dispatched.
+    The values of the injected parameters of the fulfillment functions are taken from it.
+
+    :param payload:         the request as :class:`WebhookPayload`
+    :param deadline:        the :class:`Deadline` of the request
+    :param request_timer:   A RequestTimer object when the phases of the request are measured
+    :param profile:         the name of the profile of the request when it is profiled, see :class:`Profiler`
+    """
+
+    __slots__ = ("payload", "deadline", "request_timer", "session", "profile", "rule")
+
+    def __init__(self, payload, deadline=None, request_timer=None, profile=None):
+        self.payload = payload
+        self.deadline = deadline if deadline is not None else Deadline()
+        self.request_timer = request_timer
+        self.session = None
+        self.profile = profile
+        # the rule of the fulfillment function which the action matched, see `WebhookEngine.resolve_fulfillment()`
+        self.rule = None
+
+    @property
+    def action(self):
+        return self.payload.action
+
+    @property
+    def label(self):
+        """
+        The action label of the metrics: the rule of the fulfillment function, so the actions matched
+        by a pattern do not create a series per action.
+        """
+        return self.rule if self.rule is not None else self.payload.action
@@ -0,0 +1,178 @@
+# Copyright (C) 2017 Paoro
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import threading
+
+from apiaiwebhook.batch import ordered_map
+from apiaiwebhook.exceptions import WebhookError
+from apiaiwebhook.payload import WebhookPayload
+from apiaiwebhook.response import StaticResponse
+
+_default = object()
+
+
+class ParityError(AssertionError):
+    """
+    Raised in parity mode when the result of the direct dispatch differs from the result of the HTTP path.
+    """
+
+
+class DirectResult(object):
+    """
+    The result of a request dispatched by :class:`DirectClient`.
+
+    :param status:      the HTTP status code the webhook would respond with
+    :param response:    the return value of the fulfillment function, usually a :class:`WebhookResponse`,
+                        or None when the request failed
+    :param error:       the error message when the request failed
+    """
+
+    __slots__ = ("status", "response", "error")
+
+    def __init__(self, status, response=None, error=None):
+        self.status = status
+        self.response = response
+        self.error = error
+
+    @property
+    def ok(self):
+        return self.status == 200
+
+    def __repr__(self):
+        return "<DirectResult %d %r>" % (self.status, self.response if self.ok else self.error)
+
+
+class DirectClient(object):
+    """
+    Dispatches decoded requests to the fulfillment functions of a webhook without the HTTP stack:
+    the requests are not encoded, the responses are not encoded and decoded. The authentication,
+    the routing, the binding of the parameters, the admission control and the sessions work as they
+    do for the HTTP requests. usage::
+
+        client = app.direct_client()
+        result = client.webhook("hello-world", {"name": "World"})
+        assert result.response["speech"] == "Hello, World!"
+
+        for result in client.call_many(cases):
+            ...
+
+    The exceptions of the fulfillment functions are raised, they are not converted to HTTP 500.
+
+    :param webhook: the :class:`WebhookEngine` object, e.g. an :class:`APIAIWebhook`
+    :param api_key: the value of the authentication header. Defaults to the first key of the webhook.
+    :param workers: number of threads which dispatch the requests of `call_many()` in parallel.
+                    Defaults to None, the requests are dispatched one by one.
+    :param parity:  when True, every request is sent through the HTTP path as well and :class:`ParityError`
+                    is raised when the results differ. The fulfillment functions are called twice per request,
+                    so the functions which keep state between the requests (e.g. in a session) can differ.
+    """
+
+    def __init__(self, webhook, api_key=_default, workers=None, parity=False):
+        self.app = webhook
+        self.api_key = webhook.api_key_value if api_key is _default else api_key
+        self.parity = parity
+        self.executor = None
+        self.window = None
+        if workers is not None:
+            from concurrent.futures import ThreadPoolExecutor
+            self.executor = ThreadPoolExecutor(workers)
+            self.window = 2 * workers
+        self._local = threading.local()
+
+    def webhook(self, action=None, parameters=None, session_id=None, contexts=None):
+        """
+        Dispatches a request of the action, see `APIAIWebhookClient.webhook()`.
+
+        :return: A DirectResult object
+        """
+        req = {"result": {"action": action, "parameters": parameters or {}}}
+        if session_id is not None:
+            req["sessionId"] = session_id
+        if contexts is not None:
+            req["result"]["contexts"] = contexts
+        return self.call(req)
+
+    def call(self, payload):
+        """
+        Dispatches one request.
+
+        :param payload: the request as dictionary or :class:`WebhookPayload`
+        :return: A DirectResult object
+        """
+        if not isinstance(payload, WebhookPayload):
+            payload = WebhookPayload(data=payload)
+        result = self.dispatch(payload)
+        if self.parity:
+            self.check_parity(payload, result)
+        return result
+
+    def call_many(self, payloads):
+        """
+        Dispatches the requests, in parallel when `workers` is defined.
+
+        :param payloads: iterable of the requests as dictionaries or :class:`WebhookPayload` objects
+        :return: iterator of the DirectResult objects in the order of the requests
+        """
+        return ordered_map(self.call, payloads, self.executor, self.window)
+
+    def dispatch(self, payload):
+        webhook = self.app
+        try:
+            webhook.check_api_key(self.api_key)
+            res = webhook.dispatch(payload)
+        except WebhookError as e:
+            return DirectResult(e.status, error=e.message)
+        if isinstance(res, StaticResponse):
+            res = webhook.json_backend.loads(res.body)
+        return DirectResult(200, res)
+
+    def check_parity(self, payload, result):
+        """
+        Sends the request through the HTTP path and compares its result.
+
+        :raise ParityError: when the status codes or the decoded responses differ
+        """
+        from apiaiwebhook.replay import diff_json
+
+        webhook = self.app
+        body = payload.body
+        if body is None:
+            body = webhook.json_backend.dumps(payload.data)
+        status, data = self.http_driver().fetch(body)
+        if status != result.status:
+            raise ParityError("%s: status %d != %d over HTTP" % (payload.action, result.status, status))
+        if status != 200:
+            return
+        expected = webhook.json_backend.loads(webhook.encode_response(result.response))
+        diffs = diff_json(expected, webhook.json_backend.loads(data))
+        if diffs:
+            raise ParityError("%s: %s" % (payload.action, "; ".join(diffs)))
+
+    def http_driver(self):
+        driver = getattr(self._local, "driver", None)
+        if driver is None:
+            from apiaiwebhook.benchmark import RawWSGIDriver, TestClientDriver
+
+            headers = {}
+            if self.api_key is not None:
+                headers[self.app.api_key_header] = self.api_key
+            driver_class = TestClientDriver if hasattr(self.app, "test_client") else RawWSGIDriver
+            driver = self._local.driver = driver_class(self.app, headers)
+        return driver
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
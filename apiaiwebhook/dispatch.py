@@ -0,0 +1,266 @@
+# Copyright (C) 2017 Paoro
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import inspect
+import threading
+
+from apiaiwebhook.exceptions import WebhookError
+
+try:
+    _string_types = (str, unicode)
+except NameError:
+    _string_types = (str,)
+
+_missing = object()
+
+# the injected parameters which depend on the user of the request, their functions cannot be cached or coalesced
+REQUEST_INJECTIONS = frozenset(["request", "session"])
+
+_true_values = frozenset(["true", "yes", "on", "1"])
+_false_values = frozenset(["false", "no", "off", "0"])
+
+
+def to_bool(value):
+    """
+    Converts a parameter value to bool. Strings are interpreted as "true"/"false", "yes"/"no", "on"/"off", "1"/"0".
+    """
+    if isinstance(value, _string_types):
+        lower = value.strip().lower()
+        if lower in _true_values:
+            return True
+        if lower in _false_values:
+            return False
+        raise ValueError("invalid boolean: %s" % value)
+    return bool(value)
+
+
+# annotations which are used as type coercions, other annotations are ignored
+_annotation_coercions = {
+    int: int,
+    float: float,
+    bool: to_bool,
+    str: str,
+}
+
+
+def _coercion(t):
+    return to_bool if t is bool else t
+
+
+def call_function(f, kwargs):
+    """
+    Calls a fulfillment function in a worker. Coroutine functions are run to completion
+    on the event loop of the worker thread.
+    """
+    res = f(**kwargs)
+    if hasattr(res, "__await__"):
+        from apiaiwebhook.asgi import run_coroutine
+        res = run_coroutine(res)
+    return res
+
+
+class PendingCounter(object):
+    """
+    The number of the calls of a fulfillment function which are queued or run by its executor, see `max_queue`.
+    The plans rebuilt for the same function share it, see `DispatchPlan.with_injectors()`.
+    """
+
+    __slots__ = ("count", "lock")
+
+    def __init__(self):
+        self.count = 0
+        self.lock = threading.Lock()
+
+
+class DispatchPlan(object):
+    """
+    The dispatch plan of a fulfillment function. The signature of the function is inspected once,
+    when the function is registered, then every request is bound to the function by the plan.
+
+    The plan drops the parameters which are not accepted by the function (unless it takes `**kwargs`),
+    converts the parameters which have a type coercion, and validates the required parameters.
+
+    :param f:       the fulfillment function
+    :param types:   dictionary of parameter names and type coercions, e.g. {"count": int}.
+                    A coercion is any callable which takes the raw value and returns the converted value.
+                    On Python 3 the `int`, `float`, `bool` and `str` annotations are used as coercions as well.
+    :param bind:    dictionary of parameter names and dotted paths of request fields,
+                    e.g. {"session_id": "sessionId", "contexts": "result.contexts"}.
+                    Only these fields are extracted from the request besides the parameters.
+    :param cache:   a :class:`ResponseCache` object when the responses of the function are cached
+    :param executor:    name of the executor which runs the function: "inline", "thread", "process"
+                        or the name of a pool registered by `ExecutorPools.register()`
+    :param timeout:     maximum time in seconds to wait for the function when it is run by an executor
+    :param fallback:    the response which is sent when the function times out or its queue is full
+    :param max_queue:   maximum number of requests which are queued or run by the executor at the same time
+    :param rate_limit:  the :class:`RateLimit` of the action, see :class:`AdmissionControl`
+    :param coalesce:    True when the identical concurrent calls share one call, see :class:`SingleFlight`
+    :param namespace:   the prefix of the cache keys, when the responses of several webhooks share a cache
+    :param pending:     the :class:`PendingCounter` of the function. Defaults to a new counter.
+    :param injectors:   dictionary of the names of the injected parameters and the functions which return
+                        their values from the :class:`FulfillmentContext`, e.g. {"deadline": get_deadline}.
+                        The injected parameters are not taken from the request parameters.
+    """
+
+    def __init__(self, f, types=None, bind=None, cache=None,
+                 executor="inline", timeout=None, fallback=None, max_queue=None, injectors=None, rate_limit=None,
+                 coalesce=False, namespace=None, pending=None):
+        self.function = f
+        self.options = dict(types=types, bind=bind, cache=cache, executor=executor, timeout=timeout, fallback=fallback,
+                            max_queue=max_queue, rate_limit=rate_limit, coalesce=coalesce, namespace=namespace)
+        self.cache = cache
+        self.executor = executor
+        self.timeout = timeout
+        self.fallback = fallback
+        self.max_queue = max_queue
+        self.rate_limit = rate_limit
+        self.coalesce = coalesce
+        self.namespace = namespace
+        self.pending_counter = pending if pending is not None else PendingCounter()
+        names, self.defaults, self.var_keyword, annotations = self.inspect_function(f)
+        injectors = injectors or {}
+        self.injected = tuple((name, injectors[name]) for name in names if name in injectors)
+        self.injected_names = frozenset(name for name, injector in self.injected)
+        self.names = tuple(name for name in names if name not in injectors)
+        self.required = tuple(name for name in self.names if name not in self.defaults)
+        declared = sorted(self.injected_names & REQUEST_INJECTIONS)
+        if declared and (cache is not None or coalesce):
+            raise ValueError("fulfillment function which declares '%s' cannot be cached or coalesced" % declared[0])
+
+        self.fields = tuple((bind or {}).items())
+        for name, path in self.fields:
+            if name not in self.names and not self.var_keyword:
+                raise ValueError("bound parameter is not accepted by fulfillment function: %s" % name)
+
+        coercions = {}
+        for name, annotation in annotations.items():
+            if name in self.names and annotation in _annotation_coercions:
+                coercions[name] = _annotation_coercions[annotation]
+        for name, t in (types or {}).items():
+            coercions[name] = _coercion(t)
+        self.coercions = coercions
+
+        is_coroutine_function = getattr(inspect, "iscoroutinefunction", None)
+        self.is_coroutine = is_coroutine_function is not None and is_coroutine_function(f)
+        if self.is_coroutine and executor == "process":
+            raise ValueError("coroutine fulfillment function cannot be run by a process pool")
+
+    def with_injectors(self, injectors):
+        """
+        :return: a plan of the function with the same options and the given injectors
+        """
+        return DispatchPlan(self.function, injectors=injectors, pending=self.pending_counter, **self.options)
+
+    @property
+    def pending(self):
+        """
+        The number of the calls which are queued or run by the executor.
+        """
+        return self.pending_counter.count
+
+    def cache_key(self, action, kwargs):
+        """
+        The key of the cached response of a request, see :func:`cache_key`. The injected parameters are excluded,
+        they do not identify the user: the functions which declare `request` or `session` are not cached.
+        """
+        if self.injected:
+            kwargs = dict((name, value) for name, value in kwargs.items() if name not in self.injected_names)
+        if self.namespace is not None:
+            action = "%s:%s" % (self.namespace, action)
+        from apiaiwebhook.cache import cache_key
+        return cache_key(action, kwargs)
+
+    @staticmethod
+    def inspect_function(f):
+        """
+        :return: tuple of the accepted parameter names, the defaults as dictionary,
+                 whether the function takes `**kwargs`, and the annotations as dictionary
+        """
+        signature = getattr(inspect, "signature", None)
+        if signature is None:
+            spec = inspect.getargspec(f)
+            defaults = dict(zip(spec.args[len(spec.args) - len(spec.defaults or ()):], spec.defaults or ()))
+            return tuple(spec.args), defaults, spec.keywords is not None, {}
+
+        names = []
+        defaults = {}
+        annotations = {}
+        var_keyword = False
+        for name, p in signature(f).parameters.items():
+            if p.kind == p.VAR_KEYWORD:
+                var_keyword = True
+                continue
+            if p.kind == p.VAR_POSITIONAL:
+                continue
+            if p.kind == p.POSITIONAL_ONLY:
+                if p.default is p.empty:
+                    raise ValueError("positional-only parameter is not supported by fulfillment function: %s" % name)
+                continue
+            names.append(name)
+            if p.default is not p.empty:
+                defaults[name] = p.default
+            if p.annotation is not p.empty:
+                annotations[name] = p.annotation
+        return tuple(names), defaults, var_keyword, annotations
+
+    def bind(self, payload, context=None):
+        """
+        Binds the parameters, the bound fields and the injected values of a request
+        to the keyword arguments of the fulfillment function.
+
+        Empty strings are treated as missing values for the parameters with a type coercion,
+        because API.AI sends empty strings for the parameters which are not filled.
+
+        :param payload: the request as :class:`WebhookPayload`
+        :param context: the :class:`FulfillmentContext` of the request, required when the function has injected parameters
+        :return: keyword arguments as dictionary
+        :raise WebhookError: HTTP 400 when a required parameter is missing or a type coercion fails
+        """
+        parameters = payload.parameters
+        if self.var_keyword:
+            kwargs = dict(parameters)
+            for name, injector in self.injected:
+                kwargs.pop(name, None)
+        else:
+            kwargs = {}
+            for name in self.names:
+                if name in parameters:
+                    kwargs[name] = parameters[name]
+
+        for name, path in self.fields:
+            value = payload.get(path, _missing)
+            if value is not _missing:
+                kwargs[name] = value
+
+        for name, coercion in self.coercions.items():
+            if name not in kwargs:
+                continue
+            value = kwargs[name]
+            if value == "":
+                del kwargs[name]
+                continue
+            try:
+                kwargs[name] = coercion(value)
+            except (TypeError, ValueError):
+                raise WebhookError(400, "invalid value of parameter '%s': %s" % (name, value))
+
+        for name in self.required:
+            if name not in kwargs:
+                raise WebhookError(400, "parameter is required: %s" % name)
+
+        for name, injector in self.injected:
+            kwargs[name] = injector(context)
+
+        return kwargs
@@ -0,0 +1,110 @@
+# Copyright (C) 2017 Paoro
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import datetime
+import json
+import sys
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    _text_type = unicode
+except NameError:
+    _text_type = str
+
+
+def json_default(o):
+    """
+    Converts the values which are not JSON types the way `flask.json.JSONEncoder` does,
+    so the responses which Flask encoded are encoded the same way by every backend:
+    dates as HTTP dates, UUIDs as strings and the objects which have `__html__` as their markup.
+
+    :raise TypeError: when the value cannot be converted
+    """
+    if isinstance(o, datetime.date):
+        import calendar
+        from email.utils import formatdate
+        return formatdate(calendar.timegm(o.timetuple()), usegmt=True)
+    # the value is not a UUID unless the uuid module was imported
+    uuid = sys.modules.get("uuid")
+    if uuid is not None and isinstance(o, uuid.UUID):
+        return str(o)
+    if hasattr(o, "__html__"):
+        return _text_type(o.__html__())
+    raise TypeError("%r is not JSON serializable" % (o,))
+
+
+class JSONBackend(object):
+    """
+    JSON library used by the webhook dispatcher to decode the requests and to encode the responses.
+    A custom backend can be passed to :class:`APIAIWebhook` as `json_backend`.
+
+    :param name:    name of the backend
+    :param loads:   function which decodes UTF-8 encoded bytes
+    :param dumps:   function which encodes an object to UTF-8 encoded bytes
+    :param fast:    True when the backend encodes a whole response faster than the
+                    response encoder assembles it from cached fragments, see :class:`ResponseEncoder`
+    """
+
+    def __init__(self, name, loads, dumps, fast=False):
+        self.name = name
+        self.loads = loads
+        self.dumps = dumps
+        self.fast = fast
+
+    def __repr__(self):
+        return "<JSONBackend %s>" % self.name
+
+
+def _json_loads(data):
+    if isinstance(data, bytes):
+        data = data.decode("utf-8")
+    return json.loads(data)
+
+
+def _json_dumps(obj):
+    return json.dumps(obj, separators=(",", ":"), default=json_default).encode("utf-8")
+
+
+def _orjson_dumps(obj):
+    return orjson.dumps(obj, default=json_default, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME)
+
+
+_backends = {
+    "json": JSONBackend("json", _json_loads, _json_dumps),
+}
+
+if orjson is not None:
+    _backends["orjson"] = JSONBackend("orjson", orjson.loads, _orjson_dumps, fast=True)
+
+
+def get_json_backend(name=None):
+    """
+    Returns a JSON backend by its name. When the name is None, the fastest installed backend is returned:
+    `orjson` when it is installed, otherwise the standard `json` module.
+
+    :param name: "orjson", "json", None or a JSONBackend object, which is returned as it is
+    :return: A JSONBackend object
+    """
+    if isinstance(name, JSONBackend):
+        return name
+    if name is None:
+        name = "orjson" if "orjson" in _backends else "json"
+    if name not in _backends:
+        raise ValueError("JSON backend is not installed: %s" % name)
+    return _backends[name]
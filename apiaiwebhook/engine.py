@@ -0,0 +1,810 @@
+# Copyright (C) 2017 Paoro
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import logging
+import threading
+
+from apiaiwebhook.auth import APIKeyring, FailureLog
+from apiaiwebhook.compression import read_body
+from apiaiwebhook.context import Deadline, FulfillmentContext
+from apiaiwebhook.dispatch import DispatchPlan, call_function
+from apiaiwebhook.encoding import get_json_backend
+from apiaiwebhook.exceptions import FallbackResponse, Rejected, WebhookError
+from apiaiwebhook.log import PayloadLogger
+from apiaiwebhook.model import WebhookRequest, WebhookResponse
+from apiaiwebhook.payload import WebhookPayload
+from apiaiwebhook.resources import ResourceRegistry
+from apiaiwebhook.response import ResponseEncoder, StaticResponse
+from apiaiwebhook.routing import ActionRouter, is_pattern
+
+
+class WebhookEngine(object):
+    """
+    The dispatch core of the webhook: the registry of the fulfillment functions, the authentication,
+    the binding of the parameters and the encoding of the responses. It does not depend on Flask,
+    it is served by :class:`APIAIWebhook`, by the raw WSGI application of `make_wsgi_app()`
+    or by the ASGI application of `make_asgi_app()`.
+
+    A webhook which does not need Flask can be created from the engine directly::
+
+        from apiaiwebhook.engine import WebhookEngine
+        engine = WebhookEngine(__name__)
+
+        @engine.fulfillment("hello-world")
+        def hello_world():
+            return engine.make_response_apiai(speech="Hello, World!")
+
+        app = engine.make_wsgi_app()
+
+    The parameters are the same as the parameters of :class:`APIAIWebhook`.
+    """
+
+    # the prefix of the cache, coalescing and session keys, see :class:`Agent`
+    cache_namespace = None
+
+    def __init__(self,
+                 import_name,
+                 api_key_header="api-key",
+                 api_key_value=None,
+                 webhook_url="/webhook/",
+                 json_backend=None,
+                 metrics_url=None,
+                 deadline=None,
+                 session_store=None,
+                 admission=None,
+                 log_sample_rate=1,
+                 log_redact=None,
+                 log_async=False,
+                 auth_log_interval=60,
+                 compression=None,
+                 max_body_size=None,
+                 http_pool=None,
+                 profiler=None):
+        self.import_name = import_name
+        self.api_key_header = api_key_header
+        self.api_keys = None
+        if api_key_value is not None:
+            if isinstance(api_key_value, (list, tuple, set, frozenset)):
+                self.api_keys = APIKeyring(api_key_value)
+                api_key_value = next(iter(api_key_value), None)
+            else:
+                self.api_keys = APIKeyring([api_key_value])
+        self.api_key_value = api_key_value
+        self.auth_failures = FailureLog(self.logger, auth_log_interval)
+        self.admission = admission
+        self.rejections = FailureLog(self.logger, auth_log_interval, "requests rejected")
+        self.fulfillment_functions = {}
+        self.dispatch_plans = {}
+        self.router = ActionRouter()
+        self.injectors = {
+            "deadline": lambda context: context.deadline,
+            "http": lambda context: self.http_client(context.deadline),
+            "request": lambda context: WebhookRequest(context.payload),
+            "session": self.load_session,
+        }
+        self.deadline = deadline
+        self.webhook_url = webhook_url
+        self.json_backend = get_json_backend(json_backend)
+        # the session store, the executor pools and the calls in flight are created on first use,
+        # so the webhooks which do not use them do not import them on the cold start
+        self._session_store = session_store
+        self._executors = None
+        self._single_flight = None
+        self._lazy_lock = threading.Lock()
+        self.response_encoder = ResponseEncoder(self.name, self.json_backend)
+        self.metrics_url = metrics_url
+        self.metrics = None
+        if metrics_url is not None:
+            from apiaiwebhook.metrics import Metrics
+            self.metrics = Metrics()
+        self.compression = compression
+        self.max_body_size = max_body_size
+        self.resources = ResourceRegistry()
+        self.http_pool = http_pool
+        self.resources.register("http", self.create_http_pool, lambda pool: pool.close())
+        if self.metrics is not None:
+            self.metrics.gauge("apiaiwebhook_http_pool_connections", self.http_pool_gauges)
+        self.profiler = profiler
+        self.payload_logger = PayloadLogger(self.logger, log_sample_rate, log_redact)
+        if log_async:
+            self.payload_logger.start_async()
+        self.warn_api_key()
+
+    def warn_api_key(self):
+        if self.api_keys is None:
+            self.logger.warning("api-key is empty! use 'api_key_value' parameter to define it.")
+
+    @property
+    def session_store(self):
+        """
+        The :class:`SessionStore` of the webhook. Defaults to an in-process store, created on first use.
+        """
+        if self._session_store is None:
+            with self._lazy_lock:
+                if self._session_store is None:
+                    from apiaiwebhook.session import SessionStore
+                    self._session_store = SessionStore(json_backend=self.json_backend)
+        return self._session_store
+
+    @session_store.setter
+    def session_store(self, session_store):
+        self._session_store = session_store
+
+    @property
+    def executors(self):
+        """
+        The :class:`ExecutorPools` of the functions which are not run inline, created on first use.
+        """
+        if self._executors is None:
+            with self._lazy_lock:
+                if self._executors is None:
+                    from apiaiwebhook.executors import ExecutorPools
+                    self._executors = ExecutorPools()
+        return self._executors
+
+    @executors.setter
+    def executors(self, executors):
+        self._executors = executors
+
+    @property
+    def single_flight(self):
+        """
+        The :class:`SingleFlight` of the coalesced calls in flight, created on first use.
+        """
+        if self._single_flight is None:
+            with self._lazy_lock:
+                if self._single_flight is None:
+                    from apiaiwebhook.coalesce import SingleFlight
+                    self._single_flight = SingleFlight()
+        return self._single_flight
+
+    @single_flight.setter
+    def single_flight(self, single_flight):
+        self._single_flight = single_flight
+
+    @property
+    def name(self):
+        """
+        The name of the webhook, it is the `source` of the responses.
+        """
+        return self.import_name
+
+    @property
+    def logger(self):
+        return logging.getLogger(self.import_name)
+
+    def fulfillment(self, rule, types=None, bind=None, cache=None,
+                    executor="inline", timeout=None, fallback=None, max_queue=None, rate_limit=None,
+                    coalesce=False):
+        """
+        A decorator that is used to register a fulfillment function for a
+        given action. usage::
+
+            @app.fulfillment("hello-world")
+            def hello_world():
+                return "Hello, World!"
+
+        :param rule The 'action' as string.
+                    The action is extracted from::
+                        {
+                            "results": {
+                                "action": <HERE>,
+                                "parameters": {
+                                    "parameter": <EXAMPLE>
+                                    }
+                            }
+                        }
+
+                    Or a pattern of dot separated action segments, see :class:`ActionRouter`. usage::
+
+            @app.fulfillment("orders.*.cancel", bind={"action": "result.action"})
+            def cancel(action, order_id):
+                return app.make_response_apiai(speech="%s: %s cancelled" % (action, order_id))
+
+            @app.fulfillment("**")
+            def default():
+                return app.make_response_apiai(speech="Sorry, I cannot help with that.")
+
+                    An exact action is preferred to the patterns, the most specific pattern to the others.
+
+        :param types Dictionary of parameter names and type coercions. usage::
+
+            @app.fulfillment("add", types={"a": int, "b": int})
+            def add(a, b=0):
+                return app.make_response_apiai(speech="%d" % (a + b))
+
+        :param bind Dictionary of parameter names and dotted paths of request fields. usage::
+
+            @app.fulfillment("hello-world", bind={"session_id": "sessionId"})
+            def hello_world(session_id):
+                return app.make_response_apiai(speech="Hello, %s!" % session_id)
+
+        :param cache A :class:`ResponseCache` object when the responses of the function are cached
+                     by the action and the parameters declared by the function. The functions which declare
+                     a `session` or a `request` parameter cannot be cached or coalesced. usage::
+
+            @app.fulfillment("faq", cache=ResponseCache(ttl=300))
+            def faq(question):
+                return app.make_response_apiai(speech=answer(question))
+
+        :param executor "inline" (default), "thread", "process" or the name of a pool registered on `app.executors`.
+                        The function is run in the request thread or by the shared pool. usage::
+
+            @app.fulfillment("search", executor="process", timeout=3.0, max_queue=100,
+                             fallback=app.make_response_apiai(speech="Sorry, try again later."))
+            def search(query):
+                return app.make_response_apiai(speech=fuzzy_match(query))
+
+        :param timeout Maximum time in seconds to wait for a function which is run by a pool.
+        :param fallback The response which is sent when the function times out or its queue is full.
+                        Without fallback response HTTP 504 or HTTP 503 is returned.
+        :param max_queue Maximum number of requests of the function queued or run by its pool at the same time.
+        :param rate_limit A :class:`RateLimit` object when the requests of the action are limited, see `admission`.
+        :param coalesce When True, the concurrent requests with the same action and parameters share
+                        one call of the function and its encoded response. Only for the functions
+                        which depend on their parameters only.
+
+        The functions which declare a `deadline` parameter receive the :class:`Deadline` of the request,
+        the functions which declare a `session` parameter receive its :class:`Session`,
+        the functions which declare a `request` parameter receive the request as :class:`WebhookRequest`,
+        the functions which declare an `http` parameter receive an :class:`HTTPClient` of the pool of the webhook.
+        The functions which declare the name of a resource receive the resource, see `resource()`.
+
+        The signature of the function is inspected once, at registration. See :class:`DispatchPlan`.
+        """
+
+        def decorator(f):
+            self.dispatch_plans[rule] = DispatchPlan(f, types, bind, cache, executor, timeout, fallback, max_queue,
+                                                     self.injectors, rate_limit, coalesce, self.cache_namespace)
+            self.fulfillment_functions[rule] = f
+            if is_pattern(rule):
+                self.router.add(rule)
+            if rate_limit is not None and self.admission is None:
+                from apiaiwebhook.ratelimit import AdmissionControl
+                self.admission = AdmissionControl()
+            return f
+
+        return decorator
+
+    def resource(self, name, close=None):
+        """
+        A decorator that is used to register the factory of a shared resource, e.g. the client of a backend API.
+        The fulfillment functions which declare a parameter of the name receive the resource. usage::
+
+            @app.resource("db", close=lambda db: db.close())
+            def db():
+                return connect(DATABASE_URL)
+
+            @app.fulfillment("orders.status.get")
+            def status(db, order_id):
+                return app.make_response_apiai(speech=db.order_status(order_id))
+
+        The resource is created on first use in each process, a forked worker process creates its own.
+        It is closed by `shutdown()`, at exit or when the ASGI server shuts down.
+
+        :param name:  name of the resource and of the parameter
+        :param close: function which closes the resource
+        """
+
+        def decorator(factory):
+            self.resources.register(name, factory, close)
+            self.add_injector(name, lambda context: self.resources.get(name))
+            return factory
+
+        return decorator
+
+    def on_startup(self, f):
+        """
+        Registers a function which is called once per process before the first request.
+        """
+        self.resources.startup_hooks.append(f)
+        return f
+
+    def on_shutdown(self, f):
+        """
+        Registers a function which is called by `shutdown()`.
+        """
+        self.resources.shutdown_hooks.append(f)
+        return f
+
+    def add_injector(self, name, injector):
+        """
+        Registers an injected parameter and rebuilds the dispatch plans of the registered functions.
+
+        :param name: name of the parameter
+        :param injector: function which returns the value of the parameter from the :class:`FulfillmentContext`
+        """
+        self.injectors[name] = injector
+        for rule, plan in list(self.dispatch_plans.items()):
+            self.dispatch_plans[rule] = plan.with_injectors(self.injectors)
+
+    def startup(self):
+        """
+        Runs the startup hooks in the current process, unless they already ran.
+        It is called before the first request.
+        """
+        self.resources.ensure_started()
+
+    def shutdown(self):
+        """
+        Flushes the session store, closes the resources and the connections of the HTTP pool,
+        then runs the shutdown hooks.
+        """
+        session_store = self._session_store
+        if session_store is not None and session_store.backend is not None:
+            session_store.flush()
+        self.resources.shutdown()
+
+    def create_http_pool(self):
+        pool = self.http_pool
+        if pool is None:
+            from apiaiwebhook.httpclient import HTTPPool
+            pool = self.http_pool = HTTPPool()
+        pool.metrics = self.metrics
+        pool.dumps = self.json_backend.dumps
+        pool.loads = self.json_backend.loads
+        return pool
+
+    def http_client(self, deadline=None):
+        """
+        :param deadline: the :class:`Deadline` which bounds the timeouts of the requests
+        :return: A HTTPClient object of the pool of the webhook, see :class:`HTTPPool`
+        """
+        return self.resources.get("http").client(deadline)
+
+    def http_pool_gauges(self):
+        pool = self.http_pool
+        return pool.gauges() if pool is not None else {}
+
+    def fulfill_batch_item(self, payload, debug_value=None):
+        """
+        Dispatches one request of a batch.
+
+        :param payload: the :class:`WebhookPayload` of the request
+        :param debug_value: value of the debug header of the profiler or None
+        :return: tuple of the HTTP status code and the JSON encoded response or the error message
+        """
+        deadline = Deadline(self.deadline)
+        request_timer = self.metrics.start() if self.metrics is not None else None
+        try:
+            if self.profiler is None:
+                res = self.fulfill(payload, request_timer, deadline)
+            else:
+                res = self.profiler.call(self.profile_key(payload.action), debug_value,
+                                         self.fulfill, payload, request_timer, deadline)
+        except WebhookError as e:
+            if request_timer is not None:
+                request_timer.finish(e.status)
+            return e.status, e.message
+        except Exception:
+            self.logger.exception("fulfillment of batch item failed")
+            if request_timer is not None:
+                request_timer.finish(500)
+            return 500, "internal server error"
+        if request_timer is not None:
+            request_timer.finish(200)
+        return 200, res
+
+    def check_api_key(self, api_key_value):
+        """
+        Validates the value of the authentication header. It is called before the body of the request is read.
+
+        :param api_key_value: value of the `api_key_header` HTTP header or None when it is not provided
+        :raise WebhookError: HTTP 400 when the header is missing, HTTP 401 when it is invalid.
+        """
+        if self.api_keys is None:
+            return
+
+        if api_key_value is None:
+            self.auth_failure("missing")
+            raise WebhookError(400, "api-key http header is required")
+
+        if not self.api_keys.verify(api_key_value):
+            self.auth_failure("invalid")
+            raise WebhookError(401, "api-key is invalid")
+
+    def auth_failure(self, reason):
+        self.auth_failures.failure(reason)
+        if self.metrics is not None:
+            self.metrics.increment("apiaiwebhook_auth_failures_total", (("reason", reason),))
+
+    def resolve_fulfillment(self, payload, context=None):
+        """
+        Extracts the action and the parameters from the request,
+        looks up the registered fulfillment function and binds the parameters by its dispatch plan.
+
+        :param payload: the request as :class:`WebhookPayload`
+        :param context: the :class:`FulfillmentContext` of the request, the source of the injected parameters.
+                        Its `rule` is set to the rule of the fulfillment function.
+        :return: tuple of the dispatch plan and the keyword arguments of the fulfillment function
+        :raise WebhookError: HTTP 404 when neither a fulfillment function nor a pattern is defined for the action.
+                             HTTP 400 when the parameters do not match the fulfillment function.
+        """
+        self.resources.ensure_started()
+        action = payload.action
+        rule = action
+        f = self.fulfillment_functions.get(action)
+        if f is None:
+            rule = self.router.match(action)
+            f = self.fulfillment_functions.get(rule) if rule is not None else None
+        if f is None:
+            msg = "fulfillment is not implemented: %s" % action
+            self.logger.error(msg)
+            raise WebhookError(404, msg)
+
+        plan = self.dispatch_plans.get(rule)
+        if plan is None or plan.function is not f:
+            plan = self.dispatch_plans[rule] = DispatchPlan(f, injectors=self.injectors,
+                                                            namespace=self.cache_namespace)
+        if context is not None:
+            context.rule = rule
+
+        try:
+            return plan, plan.bind(payload, context)
+        except WebhookError as e:
+            self.logger.error("%s: %s" % (action, e.message))
+            raise
+
+    def dispatch(self, req):
+        """
+        Calls the fulfillment function of the decoded request and returns its result.
+        Coroutine fulfillment functions (`async def`) are run to completion on
+        the event loop of the current thread.
+
+        :param req: the request as :class:`WebhookPayload` or the decoded request as dictionary
+        :return: the return value of the fulfillment function
+        """
+        if not isinstance(req, WebhookPayload):
+            req = WebhookPayload(data=req)
+        context = FulfillmentContext(req, Deadline(self.deadline))
+        plan, kwargs = self.resolve_fulfillment(req, context)
+        try:
+            res = self.call_fulfillment(plan, kwargs, context)
+        except FallbackResponse as e:
+            return self.fallback_response(context.label, e)
+        return self.store_session(context, res)
+
+    def fulfill(self, payload, request_timer=None, deadline=None):
+        """
+        Dispatches the request and encodes the response. When the responses of the fulfillment function
+        are cached, the cached response is returned without calling the function.
+        When its calls are coalesced, the response of an identical request in flight is shared.
+
+        :param payload: the request as :class:`WebhookPayload`
+        :param request_timer: A RequestTimer object when the phases of the request are measured
+        :param deadline: the :class:`Deadline` of the request. Defaults to a deadline which starts now.
+        :return: JSON encoded response as bytes
+        """
+        context = FulfillmentContext(payload, deadline or Deadline(self.deadline), request_timer)
+        plan, kwargs = self.resolve_fulfillment(payload, context)
+        if request_timer is not None:
+            request_timer.action = context.label
+            request_timer.mark("decode")
+
+        key = None
+        if plan.cache is not None or plan.coalesce:
+            key = plan.cache_key(payload.action, kwargs)
+        if plan.cache is not None:
+            res = plan.cache.get(key)
+            if res is not None:
+                return res
+
+        if plan.coalesce:
+            res, cacheable = self.single_flight.do(key, lambda: self.respond(plan, kwargs, context),
+                                                   lambda: self.coalesced(context.label))
+        else:
+            res, cacheable = self.respond(plan, kwargs, context)
+
+        if cacheable and plan.cache is not None:
+            plan.cache.set(key, res)
+        return res
+
+    def respond(self, plan, kwargs, context):
+        """
+        Calls the fulfillment function and encodes its response.
+
+        :return: tuple of the JSON encoded response as bytes and False when it is a fallback response
+        """
+        request_timer = context.request_timer
+        cacheable = True
+        try:
+            res = self.call_fulfillment(plan, kwargs, context)
+            res = self.store_session(context, res)
+        except FallbackResponse as e:
+            res = self.fallback_response(context.label, e)
+            cacheable = False
+        if request_timer is not None:
+            request_timer.mark("handler")
+
+        res = self.encode_response(res)
+        if request_timer is not None:
+            request_timer.mark("encode")
+        return res, cacheable
+
+    def coalesced(self, action):
+        """
+        Counts a request which shared the response of an identical request in flight.
+        """
+        if self.metrics is not None:
+            self.metrics.increment("apiaiwebhook_coalesced_total", (("action", action),))
+
+    def fallback_response(self, action, fallback):
+        """
+        Logs and counts a fallback response.
+
+        :param action: the action label of the request, see `FulfillmentContext.label`
+        :param fallback: the FallbackResponse exception
+        :return: the fallback response
+        """
+        if isinstance(fallback, Rejected):
+            return fallback.response
+        self.logger.warning("%s: fallback response (%s)" % (action, fallback.reason))
+        if self.metrics is not None:
+            self.metrics.increment("apiaiwebhook_fallbacks_total", (("action", action), ("reason", fallback.reason)))
+        return fallback.response
+
+    def load_session(self, context):
+        """
+        Loads the session of the request once, when a fulfillment function declares a `session` parameter.
+
+        :param context: the :class:`FulfillmentContext` of the request
+        :return: A Session object
+        """
+        if context.session is None:
+            context.session = self.session_store.load(context.payload, self.cache_namespace)
+        return context.session
+
+    def store_session(self, context, res):
+        """
+        Stores the session of the request when the fulfillment function changed it,
+        and adds the changed values to the output contexts of the response.
+
+        :param context: the :class:`FulfillmentContext` of the request
+        :param res: the return value of the fulfillment function
+        :return: the response
+        """
+        session = context.session
+        if session is None or not session.modified:
+            return res
+        self.session_store.save(session)
+        context_out = self.session_store.context_out(session)
+        if context_out is not None and isinstance(res, dict):
+            contexts = list(res.get("contextOut") or [])
+            if not any(c.get("name") == context_out["name"] for c in contexts if isinstance(c, dict)):
+                if isinstance(res, WebhookResponse):
+                    res = res.replace(context_out=contexts + [context_out])
+                else:
+                    res = dict(res, contextOut=contexts + [context_out])
+        return res
+
+    def late_completion(self, action):
+        """
+        Logs and counts a fulfillment function which returned after the deadline of its request.
+        """
+        self.logger.warning("%s: fulfillment completed after the deadline" % action)
+        if self.metrics is not None:
+            self.metrics.increment("apiaiwebhook_late_completions_total", (("action", action),))
+
+    def admit(self, plan, context):
+        """
+        Checks the request by the admission control. The rejections are counted and logged together.
+        When it is admitted, `admission.release()` must be called after its fulfillment.
+
+        :raise Rejected: when the request is rejected and the admission control has a response for it
+        :raise WebhookError: HTTP 429 when a rate limit is exceeded, HTTP 503 when the concurrency limit is reached
+        """
+        reason = self.admission.admit(plan, context)
+        if reason is None:
+            return
+        self.rejections.failure(reason)
+        if self.metrics is not None:
+            self.metrics.increment("apiaiwebhook_rejections_total", (("action", context.label), ("reason", reason)))
+        if self.admission.response is not None:
+            raise Rejected(self.admission.response, reason)
+        if reason == "concurrency":
+            raise WebhookError(503, "too many concurrent requests")
+        raise WebhookError(429, "rate limit exceeded")
+
+    def call_fulfillment(self, plan, kwargs, context=None):
+        """
+        Calls the fulfillment function, when the request is admitted by the admission control.
+
+        :raise FallbackResponse: when the fallback response of the function is sent instead of its return value
+        """
+        admission = self.admission
+        if admission is None or context is None:
+            return self.run_fulfillment(plan, kwargs, context)
+        self.admit(plan, context)
+        try:
+            return self.run_fulfillment(plan, kwargs, context)
+        finally:
+            admission.release()
+
+    def run_fulfillment(self, plan, kwargs, context=None):
+        """
+        Calls the fulfillment function inline or by its executor.
+
+        A function run by an executor is abandoned when its timeout or the deadline of the request is over.
+        A function run inline cannot be interrupted: when it returns after the deadline it is counted as late.
+
+        :raise FallbackResponse: when the fallback response of the function is sent instead of its return value
+        """
+        timeout, reason = plan.timeout, "timeout"
+        deadline = context.deadline if context is not None else None
+        if deadline is not None and deadline.budget is not None:
+            remaining = deadline.remaining()
+            if remaining <= 0:
+                self.executors.fallback(plan, "deadline")
+            if timeout is None or remaining < timeout:
+                timeout, reason = remaining, "deadline"
+
+        if plan.executor != "inline":
+            return self.executors.run(plan, kwargs, timeout, reason,
+                                      late=lambda: self.late_completion(context.label))
+
+        res = call_function(plan.function, kwargs)
+        if deadline is not None and deadline.expired():
+            self.late_completion(context.label)
+        return res
+
+    def encode_response(self, res):
+        """
+        Encodes the return value of a fulfillment function to JSON by the response encoder.
+
+        :param res: the return value of the fulfillment function, usually created by `make_response_apiai()`
+                    or `static_response()`
+        :return: JSON encoded response as bytes
+        """
+        return self.response_encoder.encode(res)
+
+    def read_request(self, read, length=None, content_encoding=None):
+        """
+        Reads the body of a request, see :func:`read_body`. Gzip encoded bodies are decompressed in chunks,
+        the body is rejected as soon as it is larger than `max_body_size`.
+
+        :param read: function which reads at most N bytes of the body
+        :param length: the content length of the request or None when it is unknown
+        :param content_encoding: value of the `Content-Encoding` header or None
+        :return: the body as bytes
+        :raise WebhookError: HTTP 413, 415 or 400 when the body cannot be read
+        """
+        return read_body(read, length, content_encoding, self.max_body_size)
+
+    def compress_response(self, body, accept_encoding):
+        """
+        Compresses an encoded response, when `compression` is defined.
+
+        :param body: the JSON encoded response as bytes
+        :param accept_encoding: value of the `Accept-Encoding` header or None
+        :return: tuple of the body and its content coding, or None when it is not compressed
+        """
+        if self.compression is None:
+            return body, None
+        body, coding = self.compression.compress(body, accept_encoding)
+        if self.metrics is not None:
+            self.metrics.increment("apiaiwebhook_response_bytes_total", (("encoding", coding or "identity"),),
+                                   len(body))
+        return body, coding
+
+    def profile_key(self, action):
+        """
+        :return: the name of the profile of the action, see :class:`Profiler`
+        """
+        return action
+
+    def render_profile(self, query, debug_value=None, api_key_value=None):
+        """
+        Serves a request of the admin route of the profiler. It requires the debug key of the profiler
+        or, when the profiler has no debug key, the API key of the webhook.
+
+        :param query: dictionary of the query parameters: `action`, `format` and `reset`
+        :param debug_value: value of the debug header of the profiler or None
+        :param api_key_value: value of the `api_key_header` HTTP header or None
+        :return: tuple of the body as bytes and its content type
+        :raise WebhookError: when the request is not authenticated or the profile cannot be rendered
+        """
+        profiler = self.profiler
+        if profiler.debug_keys is not None:
+            profiler.check_access(debug_value)
+        elif self.api_keys is not None:
+            self.check_api_key(api_key_value)
+        else:
+            raise WebhookError(403, "profiles require the debug key of the profiler or an api-key")
+        res = profiler.render(query.get("action"), query.get("format") or "text")
+        if query.get("reset") in ("true", "1"):
+            profiler.reset()
+        return res
+
+    def make_asgi_app(self, executor=None):
+        """
+        Creates an ASGI application which shares the fulfillment functions of this webhook.
+        Coroutine fulfillment functions are awaited on the event loop of the ASGI server,
+        regular functions are run in a thread pool. Requires Python 3.5 or later. usage::
+
+            app = APIAIWebhook(__name__)
+            asgi_app = app.make_asgi_app()
+
+        Then serve it by any ASGI server, e.g. `uvicorn hello_world:asgi_app`
+
+        :param executor: `concurrent.futures.Executor` for the regular fulfillment functions.
+                         Defaults to the default executor of the event loop.
+        :return: A ASGIWebhook object
+        """
+        from apiaiwebhook.asgi import ASGIWebhook
+        return ASGIWebhook(self, executor=executor)
+
+    def make_wsgi_app(self):
+        """
+        Creates a minimal WSGI application which shares the fulfillment functions of this webhook.
+        It reads `wsgi.input` and writes the encoded response directly, without the request and response
+        objects of Flask, so its per-request overhead is lower. usage::
+
+            app = APIAIWebhook(__name__)
+            wsgi_app = app.make_wsgi_app()
+
+        Then serve it by any WSGI server, e.g. `gunicorn hello_world:wsgi_app`
+
+        :return: A WSGIWebhook object
+        """
+        from apiaiwebhook.wsgi import WSGIWebhook
+        return WSGIWebhook(self)
+
+    def direct_client(self, workers=None, parity=False, **kwargs):
+        """
+        Creates a client which dispatches decoded requests without the HTTP stack,
+        e.g. for large suites of conversation regression tests. usage::
+
+            client = app.direct_client(workers=8)
+            for result in client.call_many(cases):
+                assert result.ok, result.error
+
+        :param workers: number of threads which dispatch the requests of `call_many()` in parallel
+        :param parity: when True, the results are checked against the HTTP path
+        :return: A DirectClient object
+        """
+        from apiaiwebhook.direct import DirectClient
+        return DirectClient(self, workers=workers, parity=parity, **kwargs)
+
+    def make_response_apiai(self,
+                            speech=None,
+                            display_text=None,
+                            data=None,
+                            context_out=[],
+                            followup_event=None):
+        """
+        Convert the return value from a fulfillment function to the expected response.
+
+        :param speech: String. Response to the request.
+        :param display_text: String. Response to the request.
+        :param data: Object. Additional data required for performing the action on the client side.
+        The data is sent to the client in the original form and is not processed by API.AI.
+        :param context_out: Array of context objects. Such contexts are activated after intent completion.
+        Example: "contextOut": [{"name":"weather", "lifespan":2, "parameters":{"city":"Rome"}}]
+        :param followup_event: Object. Event name and optional parameters sent from the web service to API.AI.
+        Example: {"followupEvent":{"name":"<event_name>","data":{"<parameter_name>":"<parameter_value>"}}}
+        :return: A WebhookResponse object, i.e. the dictionary of the JSON keys of the response,
+                 whose fields can be read and written as attributes as well.
+        """
+        return WebhookResponse(speech, display_text, data, context_out, self.name, followup_event)
+
+    def static_response(self, *args, **kwargs):
+        """
+        Creates a prebuilt response for canned replies. It takes the same parameters as `make_response_apiai()`,
+        but the response is encoded only once, so returning it from a fulfillment function skips encoding entirely.
+
+        :return: A StaticResponse object
+        """
+        return StaticResponse(self.encode_response(self.make_response_apiai(*args, **kwargs)))
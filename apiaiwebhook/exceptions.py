@@ -0,0 +1,52 @@
+# Copyright (C) 2017 Paoro
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+class WebhookError(Exception):
+    """
+    Raised by the webhook dispatcher when a request cannot be fulfilled.
+    It carries the HTTP status code and the message that is sent back to API.AI,
+    so the same dispatcher can be used by the Flask view and by the ASGI application.
+
+    :param status:  HTTP status code, e.g. 404
+    :param message: human readable error message
+    """
+
+    def __init__(self, status, message):
+        super(WebhookError, self).__init__(message)
+        self.status = status
+        self.message = message
+
+
+class FallbackResponse(Exception):
+    """
+    Raised by the webhook dispatcher when the fallback response of a fulfillment function is sent
+    instead of its return value, e.g. when the function timed out.
+
+    :param response:    the fallback response, e.g. created by `make_response_apiai()`
+    :param reason:      the reason of the fallback, e.g. "timeout"
+    """
+
+    def __init__(self, response, reason):
+        super(FallbackResponse, self).__init__(reason)
+        self.response = response
+        self.reason = reason
+
+
+class Rejected(FallbackResponse):
+    """
+    Raised by the admission control when the response for the rejected requests is sent
+    instead of calling the fulfillment function.
+    """
@@ -0,0 +1,169 @@
+# Copyright (C) 2017 Paoro
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import threading
+
+from apiaiwebhook.dispatch import call_function
+from apiaiwebhook.exceptions import FallbackResponse, WebhookError
+
+try:
+    from concurrent.futures import ThreadPoolExecutor, TimeoutError
+except ImportError:
+    ThreadPoolExecutor = TimeoutError = None
+
+
+def process_pool(max_workers=None):
+    # imported on first use: it imports multiprocessing, which slows down the cold start
+    from concurrent.futures import ProcessPoolExecutor
+    return ProcessPoolExecutor(max_workers)
+
+
+class ExecutorPools(object):
+    """
+    The shared pools which run the fulfillment functions registered with
+    `executor="thread"` or `executor="process"`. The pools are created on first use
+    and they are created again in forked worker processes. usage::
+
+        app.executors.configure("thread", max_workers=32)
+        app.executors.register("catalog", ProcessPoolExecutor(4))
+
+        @app.fulfillment("search", executor="catalog", timeout=3.0,
+                         fallback=app.make_response_apiai(speech="Sorry, try again later."), max_queue=100)
+        def search(query):
+            ...
+
+    :param thread_workers:  maximum number of threads of the "thread" pool. Defaults to None, see `ThreadPoolExecutor`.
+    :param process_workers: maximum number of processes of the "process" pool. Defaults to None, the number of CPUs.
+    """
+
+    def __init__(self, thread_workers=None, process_workers=None):
+        self.factories = {
+            "thread": lambda: ThreadPoolExecutor(thread_workers),
+            "process": lambda: process_pool(process_workers),
+        }
+        self.pools = {}
+        self.pid = os.getpid()
+        self._lock = threading.Lock()
+
+    def configure(self, name, max_workers=None):
+        """
+        Sets the size of the "thread" or the "process" pool. It is effective for the pools which are not created yet.
+        """
+        if name == "thread":
+            self.factories[name] = lambda: ThreadPoolExecutor(max_workers)
+        elif name == "process":
+            self.factories[name] = lambda: process_pool(max_workers)
+        else:
+            raise ValueError("unknown executor: %s" % name)
+
+    def register(self, name, executor):
+        """
+        Registers a named pool, e.g. a dedicated process pool of CPU-heavy fulfillment functions.
+
+        :param name:        the name of the pool, which is used as `executor` of the fulfillment functions
+        :param executor:    `concurrent.futures.Executor` object or a function which creates it
+        """
+        with self._lock:
+            if callable(executor) and not hasattr(executor, "submit"):
+                self.factories[name] = executor
+                self.pools.pop(name, None)
+            else:
+                self.pools[name] = executor
+
+    def get(self, name):
+        """
+        :return: the `concurrent.futures.Executor` of the name, it is created on first use
+        """
+        if self.pid != os.getpid():
+            with self._lock:
+                if self.pid != os.getpid():
+                    self.pools = dict((k, v) for k, v in self.pools.items() if k not in self.factories)
+                    self.pid = os.getpid()
+
+        pool = self.pools.get(name)
+        if pool is None:
+            with self._lock:
+                pool = self.pools.get(name)
+                if pool is None:
+                    if name not in self.factories:
+                        raise ValueError("unknown executor: %s" % name)
+                    if ThreadPoolExecutor is None:
+                        raise RuntimeError("executors require the concurrent.futures module")
+                    pool = self.pools[name] = self.factories[name]()
+        return pool
+
+    def submit(self, plan, kwargs):
+        """
+        Submits the fulfillment function to its pool.
+
+        :return: `concurrent.futures.Future` of the return value of the function
+        :raise FallbackResponse: when the queue of the function is full and it has a fallback response
+        :raise WebhookError: HTTP 503 when the queue of the function is full and it has no fallback response
+        """
+        pending = plan.pending_counter
+        with pending.lock:
+            if plan.max_queue is not None and pending.count >= plan.max_queue:
+                self.fallback(plan, "overload")
+            pending.count += 1
+
+        def done(future):
+            with pending.lock:
+                pending.count -= 1
+
+        try:
+            future = self.get(plan.executor).submit(call_function, plan.function, kwargs)
+        except Exception:
+            done(None)
+            raise
+        future.add_done_callback(done)
+        return future
+
+    def run(self, plan, kwargs, timeout=None, reason="timeout", late=None):
+        """
+        Runs the fulfillment function by its pool and waits for its return value at most `timeout` seconds.
+        A function which timed out cannot be interrupted, it is abandoned and its return value is dropped.
+
+        :param timeout: seconds to wait for the function, None when it is not limited
+        :param reason:  the reason of the fallback response when the function timed out, "timeout" or "deadline"
+        :param late:    function which is called when an abandoned function completes
+        :raise FallbackResponse: when the function timed out or its queue is full and it has a fallback response
+        :raise WebhookError: HTTP 503 or 504 when the function has no fallback response
+        """
+        future = self.submit(plan, kwargs)
+        try:
+            return future.result(timeout)
+        except TimeoutError:
+            if not future.cancel() and late is not None:
+                future.add_done_callback(lambda f: late())
+            self.fallback(plan, reason)
+
+    @staticmethod
+    def fallback(plan, reason):
+        """
+        :raise FallbackResponse: when the function has a fallback response
+        :raise WebhookError: HTTP 503 when the queue of the function is full, otherwise HTTP 504
+        """
+        if plan.fallback is not None:
+            raise FallbackResponse(plan.fallback, reason)
+        if reason == "overload":
+            raise WebhookError(503, "fulfillment is overloaded")
+        raise WebhookError(504, "fulfillment timed out")
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            pools, self.pools = self.pools, {}
+        for pool in pools.values():
+            pool.shutdown(wait)
@@ -0,0 +1,368 @@
+# Copyright (C) 2017 Paoro
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import collections
+import json
+import select
+import socket
+import threading
+
+from apiaiwebhook.context import timer
+from apiaiwebhook.resources import ForkAware
+
+try:
+    import http.client as httplib
+    from urllib.parse import urlencode, urlsplit
+except ImportError:
+    import httplib
+    from urllib import urlencode
+    from urlparse import urlsplit
+
+try:
+    _connection_errors = (httplib.HTTPException, ConnectionError)
+except NameError:
+    _connection_errors = (httplib.HTTPException, socket.error)
+
+# methods whose request can be sent again when its response was lost
+_idempotent_methods = frozenset(["GET", "HEAD", "OPTIONS", "PUT", "DELETE", "TRACE"])
+
+
+def _is_dropped(connection):
+    """
+    :return: True when the server closed the idle connection, so it cannot be reused
+    """
+    if connection.sock is None:
+        return False
+    try:
+        # an idle connection is readable only when the server closed it
+        return bool(select.select([connection.sock], [], [], 0)[0])
+    except (ValueError, socket.error):
+        return True
+
+
+class PoolTimeout(socket.timeout):
+    """
+    Raised when no connection of the host became free within the timeout.
+    """
+
+
+class HTTPResponse(object):
+    """
+    The response of an outbound HTTP request, read completely.
+
+    :param status:  the HTTP status code
+    :param headers: the headers as dictionary with lower case names
+    :param body:    the body as bytes
+    """
+
+    __slots__ = ("status", "headers", "body", "loads")
+
+    def __init__(self, status, headers, body, loads=json.loads):
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.loads = loads
+
+    @property
+    def ok(self):
+        return 200 <= self.status < 300
+
+    @property
+    def text(self):
+        return self.body.decode("utf-8")
+
+    def json(self):
+        return self.loads(self.body)
+
+    def __repr__(self):
+        return "<HTTPResponse %d>" % self.status
+
+
+class _HostPool(object):
+    """
+    The connections of one host: the idle connections, most recently used first,
+    and the number of the connections in use.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.idle = collections.deque()
+        self.active = 0
+        self.condition = threading.Condition(threading.Lock())
+
+    def acquire(self, timeout):
+        """
+        :return: tuple of an idle connection or None when a new connection can be opened, and whether it waited
+        :raise PoolTimeout: when every connection is in use until the timeout
+        """
+        waited = False
+        with self.condition:
+            deadline = None
+            while not self.idle and self.active >= self.max_size:
+                waited = True
+                if deadline is None:
+                    deadline = timer() + timeout
+                remaining = deadline - timer()
+                if remaining <= 0:
+                    raise PoolTimeout("connection pool is exhausted")
+                self.condition.wait(remaining)
+            self.active += 1
+            return (self.idle.popleft() if self.idle else None), waited
+
+    def release(self, connection):
+        """
+        :param connection: the connection which can be reused or None when it was closed
+        """
+        with self.condition:
+            self.active -= 1
+            if connection is not None:
+                self.idle.appendleft(connection)
+            self.condition.notify()
+
+    def close(self):
+        with self.condition:
+            idle = list(self.idle)
+            self.idle.clear()
+        for connection in idle:
+            connection.close()
+
+
+class HTTPPool(ForkAware):
+    """
+    Keep-alive connection pool of the outbound HTTP requests of the fulfillment functions.
+    The functions which declare an `http` parameter receive an :class:`HTTPClient` of the pool,
+    whose timeouts are bounded by the deadline of the webhook request. usage::
+
+        app = APIAIWebhook(__name__, deadline=4.5, http_pool=HTTPPool(max_per_host=20))
+
+        @app.fulfillment("weather")
+        def weather(http, city):
+            forecast = http.get("https://weather.example.com/forecast", params={"city": city}).json()
+            return app.make_response_apiai(speech=forecast["summary"])
+
+    The connections are opened on demand and kept open for the next requests of the same host.
+    When every connection of a host is in use, the requests wait for a free connection.
+    A forked worker process drops the connections of its parent and opens its own.
+
+    :param max_per_host:    maximum number of connections per host. Defaults to 10.
+    :param timeout:         timeout of the requests in seconds, including the wait for a free connection.
+                            Defaults to 10.
+    :param headers:         the default headers of the requests, e.g. {"User-Agent": "my-agent"}
+    """
+
+    def __init__(self, max_per_host=10, timeout=10.0, headers=None):
+        super(HTTPPool, self).__init__()
+        self.max_per_host = max_per_host
+        self.timeout = timeout
+        self.headers = dict(headers or {})
+        self.metrics = None
+        self.dumps = None
+        self.loads = json.loads
+        self.hosts = {}
+        self.lock = threading.Lock()
+
+    def client(self, deadline=None):
+        """
+        :param deadline: the :class:`Deadline` of the webhook request which bounds the timeouts
+        :return: A HTTPClient object
+        """
+        return HTTPClient(self, deadline)
+
+    def host_pool(self, key):
+        self.check_fork()
+        pool = self.hosts.get(key)
+        if pool is None:
+            with self.lock:
+                pool = self.hosts.get(key)
+                if pool is None:
+                    pool = self.hosts[key] = _HostPool(self.max_per_host)
+        return pool
+
+    def request(self, method, url, body=None, headers=None, timeout=None):
+        """
+        Sends a request by a pooled connection and reads its response.
+        A reused connection which was closed by the server is replaced. When a reused connection fails,
+        the request is sent again by a new connection only if it was not sent completely
+        or its method is idempotent, so e.g. a POST is never processed twice.
+
+        :param timeout: timeout in seconds. Defaults to the timeout of the pool.
+        :return: A HTTPResponse object
+        :raise socket.timeout: when the request or the wait for a connection timed out
+        :raise Exception: any other error of the connection, its slot is released
+        """
+        if timeout is None:
+            timeout = self.timeout
+        parts = urlsplit(url)
+        scheme = parts.scheme or "http"
+        port = parts.port or (443 if scheme == "https" else 80)
+        host = "%s:%d" % (parts.hostname, port)
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+        request_headers = dict(self.headers)
+        request_headers.update(headers or {})
+
+        pool = self.host_pool((scheme, parts.hostname, port))
+        connection, waited = pool.acquire(timeout)
+        if waited:
+            self.increment("apiaiwebhook_http_pool_waits_total", (("host", host),))
+        while True:
+            if connection is not None and _is_dropped(connection):
+                connection.close()
+                connection = None
+            reused = connection is not None
+            if connection is None:
+                connection_class = httplib.HTTPSConnection if scheme == "https" else httplib.HTTPConnection
+                connection = connection_class(parts.hostname, port, timeout=timeout)
+                self.increment("apiaiwebhook_http_connections_total", (("host", host),))
+            elif connection.sock is not None:
+                connection.sock.settimeout(timeout)
+            sent = False
+            try:
+                connection.request(method, path, body, request_headers)
+                sent = True
+                r = connection.getresponse()
+                data = r.read()
+            except socket.timeout:
+                connection.close()
+                pool.release(None)
+                self.increment("apiaiwebhook_http_requests_total", (("host", host), ("status", "timeout")))
+                raise
+            except _connection_errors:
+                connection.close()
+                if reused and (not sent or method.upper() in _idempotent_methods):
+                    # the server closed the idle connection, the request is sent by a new connection
+                    connection = None
+                    continue
+                pool.release(None)
+                self.increment("apiaiwebhook_http_requests_total", (("host", host), ("status", "error")))
+                raise
+            except Exception:
+                # e.g. the host name cannot be resolved or the TLS handshake failed
+                connection.close()
+                pool.release(None)
+                self.increment("apiaiwebhook_http_requests_total", (("host", host), ("status", "error")))
+                raise
+            break
+
+        if r.will_close:
+            connection.close()
+            connection = None
+        pool.release(connection)
+        self.increment("apiaiwebhook_http_requests_total", (("host", host), ("status", str(r.status))))
+        return HTTPResponse(r.status, dict((k.lower(), v) for k, v in r.getheaders()), data, self.loads)
+
+    def increment(self, name, labels):
+        if self.metrics is not None:
+            self.metrics.increment(name, labels)
+
+    def stats(self):
+        """
+        :return: dictionary of the hosts and the numbers of their active and idle connections
+        """
+        return dict(("%s:%d" % (key[1], key[2]), (pool.active, len(pool.idle))) for key, pool in
+                    list(self.hosts.items()))
+
+    def gauges(self):
+        """
+        The utilization of the pool as gauges, see `Metrics.gauge()`.
+        """
+        values = {}
+        for host, (active, idle) in self.stats().items():
+            values[(("host", host), ("state", "active"))] = active
+            values[(("host", host), ("state", "idle"))] = idle
+        return values
+
+    def close(self):
+        """
+        Closes the idle connections.
+        """
+        with self.lock:
+            hosts = list(self.hosts.values())
+        for pool in hosts:
+            pool.close()
+
+    def after_fork(self):
+        super(HTTPPool, self).after_fork()
+        # the sockets are shared with the parent process, they are dropped without closing
+        self.hosts = {}
+        self.lock = threading.Lock()
+
+
+class HTTPClient(object):
+    """
+    The HTTP client of one webhook request. The timeouts of its requests are bounded
+    by the remaining time of the deadline of the webhook request.
+
+    :param pool:        the :class:`HTTPPool`
+    :param deadline:    the :class:`Deadline` of the webhook request or None
+    """
+
+    __slots__ = ("pool", "deadline")
+
+    def __init__(self, pool, deadline=None):
+        self.pool = pool
+        self.deadline = deadline
+
+    def timeout(self, timeout=None):
+        """
+        :return: the timeout of a request, bounded by the deadline
+        :raise socket.timeout: when the deadline is over
+        """
+        if timeout is None:
+            timeout = self.pool.timeout
+        deadline = self.deadline
+        if deadline is not None and deadline.budget is not None:
+            remaining = deadline.remaining()
+            if remaining <= 0:
+                raise socket.timeout("deadline of the webhook request is over")
+            timeout = min(timeout, remaining)
+        return timeout
+
+    def request(self, method, url, params=None, json=None, body=None, headers=None, timeout=None):
+        """
+        Sends a request.
+
+        :param params:  the query parameters as dictionary
+        :param json:    an object which is sent as JSON body
+        :param body:    the body as bytes
+        :param timeout: timeout in seconds. Defaults to the timeout of the pool, bounded by the deadline.
+        :return: A HTTPResponse object
+        """
+        if params:
+            url += ("&" if "?" in url else "?") + urlencode(params)
+        if json is not None:
+            dumps = self.pool.dumps or _json_dumps
+            body = dumps(json)
+            headers = dict(headers or {})
+            headers.setdefault("Content-Type", "application/json")
+        return self.pool.request(method, url, body, headers, self.timeout(timeout))
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.request("PUT", url, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request("DELETE", url, **kwargs)
+
+
+def _json_dumps(obj):
+    return json.dumps(obj).encode("utf-8")
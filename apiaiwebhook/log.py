@@ -0,0 +1,145 @@
+# Copyright (C) 2017 Paoro
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import atexit
+import itertools
+import json
+import logging
+
+REDACTED = "***"
+
+try:
+    _string_types = (str, unicode)
+except NameError:
+    _string_types = (str,)
+
+
+class LazyPayload(object):
+    """
+    Formats a request or response body only when the log record is formatted.
+    The values of the redacted parameters are replaced in `result.parameters`,
+    in the parameters of `result.contexts` and in `contextOut`.
+
+    :param body:    the body as bytes, or the decoded item of a JSON array batch
+    :param redact:  set of parameter names whose values are replaced
+    """
+
+    __slots__ = ("body", "redact")
+
+    def __init__(self, body, redact):
+        self.body = body
+        self.redact = redact
+
+    def __str__(self):
+        body = self.body
+        if isinstance(body, bytes):
+            body = body.decode("utf-8", "replace")
+        elif not isinstance(body, _string_types):
+            body = json.dumps(body)
+        if not self.redact:
+            return body
+        try:
+            data = json.loads(body)
+        except ValueError:
+            return body
+        if isinstance(data, dict):
+            result = data.get("result")
+            if isinstance(result, dict):
+                self.redact_parameters(result.get("parameters"))
+                for context in result.get("contexts") or ():
+                    self.redact_parameters(context.get("parameters"))
+            for context in data.get("contextOut") or ():
+                self.redact_parameters(context.get("parameters"))
+        return json.dumps(data)
+
+    def redact_parameters(self, parameters):
+        if not isinstance(parameters, dict):
+            return
+        for name in parameters:
+            if name in self.redact:
+                parameters[name] = REDACTED
+
+
+class PayloadLogger(object):
+    """
+    Logs the request and response bodies of the webhook dispatcher at DEBUG level.
+
+    Nothing is formatted when DEBUG level is disabled. When it is enabled, the bodies are logged
+    for one in every `sample_rate` requests and they are formatted only when the records are emitted.
+
+    :param logger:      the logger, e.g. the logger of the Flask application
+    :param sample_rate: log the bodies of one in every N requests. Defaults to 1, i.e. every request.
+    :param redact:      names of the parameters whose values are not logged, e.g. ["password"]
+    """
+
+    def __init__(self, logger, sample_rate=1, redact=None):
+        self.logger = logger
+        self.sample_rate = sample_rate
+        self.redact = frozenset(redact or ())
+        self.listener = None
+        self._counter = itertools.count()
+
+    def sample(self):
+        """
+        :return: True when the bodies of the current request are logged
+        """
+        if self.logger.getEffectiveLevel() > logging.DEBUG:
+            return False
+        return self.sample_rate <= 1 or next(self._counter) % self.sample_rate == 0
+
+    def request(self, body):
+        self.logger.debug("request: %s", LazyPayload(body, self.redact))
+
+    def response(self, body):
+        self.logger.debug("response: %s", LazyPayload(body, self.redact))
+
+    def start_async(self):
+        """
+        Moves the handlers of the logger behind a queue, so the records are written by a background thread
+        and the request threads never wait for the log I/O. Requires Python 3.2 or later.
+        """
+        if self.listener is not None:
+            return
+        # imported on first use: logging.handlers slows down the cold start
+        try:
+            from logging.handlers import QueueHandler, QueueListener
+        except ImportError:
+            raise RuntimeError("asynchronous logging requires Python 3.2 or later")
+        import queue
+
+        records = queue.Queue(-1)
+        handlers = list(self.logger.handlers)
+        for handler in handlers:
+            self.logger.removeHandler(handler)
+        self.logger.addHandler(QueueHandler(records))
+        self.listener = QueueListener(records, *handlers, respect_handler_level=True)
+        self.listener.start()
+        atexit.register(self.stop_async)
+
+    def stop_async(self):
+        """
+        Writes the queued records and restores the handlers of the logger.
+        """
+        listener = self.listener
+        if listener is None:
+            return
+        from logging.handlers import QueueHandler
+        self.listener = None
+        listener.stop()
+        for handler in list(self.logger.handlers):
+            if isinstance(handler, QueueHandler):
+                self.logger.removeHandler(handler)
+        for handler in listener.handlers:
+            self.logger.addHandler(handler)
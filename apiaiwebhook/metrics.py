@@ -0,0 +1,265 @@
+# Copyright (C) 2017 Paoro
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import threading
+import time
+import weakref
+
+timer = getattr(time, "perf_counter", time.time)
+
+# upper bounds of the histogram buckets in seconds
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+PHASES = ("auth", "decode", "handler", "encode")
+
+
+class RequestTimer(object):
+    """
+    Measures the phases of one webhook request. The dispatcher marks the end of each phase,
+    then the durations are recorded by :class:`Metrics` when the request is finished.
+    """
+
+    __slots__ = ("metrics", "action", "started", "wall_started", "last", "phases")
+
+    def __init__(self, metrics):
+        self.metrics = metrics
+        self.action = ""
+        self.started = self.last = timer()
+        self.wall_started = time.time()
+        self.phases = []
+
+    def mark(self, phase):
+        now = timer()
+        self.phases.append((phase, now - self.last))
+        self.last = now
+
+    def finish(self, status):
+        self.metrics.observe(self, status, self.last - self.started)
+
+
+class _Shard(object):
+    """
+    Counters and histograms of one thread. Only the owner thread writes them, so no lock is required.
+    """
+
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+
+
+class Metrics(object):
+    """
+    Per-action metrics of the webhook dispatcher: the number of requests by status code
+    and the latency histograms of the phases of the requests (auth, decode, handler, encode).
+
+    Every thread records to its own shard, the shards are summed when the metrics are exported,
+    so the request threads never wait for each other. The shards of the finished threads are folded
+    into one shard, so a server which starts a thread per request does not keep a shard per request.
+
+    :param buckets:     upper bounds of the histogram buckets in seconds
+    :param span_hook:   function which is called with the :class:`RequestTimer` and the status code
+                        of every finished request, e.g. :func:`opentelemetry_span_hook`
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, span_hook=None):
+        self.buckets = tuple(buckets)
+        self.span_hook = span_hook
+        self._local = threading.local()
+        # list of the weak references of the owner threads and their shards
+        self._shards = []
+        # the summed shards of the finished threads
+        self._retired = _Shard()
+        self._lock = threading.Lock()
+        self._gauges = []
+
+    def start(self):
+        """
+        :return: A RequestTimer object of a new request
+        """
+        return RequestTimer(self)
+
+    def _shard(self):
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = self._local.shard = _Shard()
+            owner = weakref.ref(threading.current_thread())
+            with self._lock:
+                self._retire()
+                self._shards.append((owner, shard))
+        return shard
+
+    def _retire(self):
+        """
+        Folds the shards of the finished threads into the retired shard. The lock must be held.
+        """
+        shards = []
+        for owner, shard in self._shards:
+            thread = owner()
+            if thread is not None and thread.is_alive():
+                shards.append((owner, shard))
+            else:
+                _add_shard(self._retired.counters, self._retired.histograms, shard)
+        self._shards = shards
+
+    def increment(self, name, labels, value=1):
+        """
+        Increments a counter.
+
+        :param name:    name of the counter
+        :param labels:  tuple of label name and value pairs
+        """
+        counters = self._shard().counters
+        key = (name, labels)
+        counters[key] = counters.get(key, 0) + value
+
+    def gauge(self, name, f):
+        """
+        Registers a gauge which is read when the metrics are exported.
+
+        :param name:    name of the gauge
+        :param f:       function which returns a dictionary of the label tuples and the values
+        """
+        with self._lock:
+            self._gauges.append((name, f))
+
+    def _observe_histogram(self, histograms, key, seconds):
+        histogram = histograms.get(key)
+        if histogram is None:
+            histogram = histograms[key] = [0] * (len(self.buckets) + 2)
+        for i, bound in enumerate(self.buckets):
+            if seconds <= bound:
+                histogram[i] += 1
+                break
+        else:
+            histogram[len(self.buckets)] += 1
+        histogram[-1] += seconds
+
+    def observe(self, request_timer, status, seconds):
+        shard = self._shard()
+        action = request_timer.action
+        key = ("apiaiwebhook_requests_total", (("action", action), ("status", str(status))))
+        shard.counters[key] = shard.counters.get(key, 0) + 1
+        self._observe_histogram(shard.histograms, ("apiaiwebhook_request_seconds", (("action", action),)), seconds)
+        for phase, phase_seconds in request_timer.phases:
+            self._observe_histogram(shard.histograms,
+                                    ("apiaiwebhook_phase_seconds", (("action", action), ("phase", phase))),
+                                    phase_seconds)
+        if self.span_hook is not None:
+            self.span_hook(request_timer, status)
+
+    def collect(self):
+        """
+        Sums the shards of the threads.
+
+        :return: tuple of the counters and the histograms as dictionaries
+        """
+        counters = {}
+        histograms = {}
+        with self._lock:
+            self._retire()
+            shards = [shard for owner, shard in self._shards]
+            _add_shard(counters, histograms, self._retired)
+        for shard in shards:
+            _add_shard(counters, histograms, shard)
+        return counters, histograms
+
+    def render_prometheus(self):
+        """
+        :return: the metrics in the Prometheus text exposition format
+        """
+        counters, histograms = self.collect()
+        lines = []
+
+        for name in sorted(set(key[0] for key in counters)):
+            lines.append("# TYPE %s counter" % name)
+            for key in sorted(key for key in counters if key[0] == name):
+                lines.append("%s%s %s" % (name, _format_labels(key[1]), counters[key]))
+
+        for name in sorted(set(key[0] for key in histograms)):
+            lines.append("# TYPE %s histogram" % name)
+            for key in sorted(key for key in histograms if key[0] == name):
+                histogram = histograms[key]
+                cumulative = 0
+                for bound, count in zip(self.buckets + ("+Inf",), histogram):
+                    cumulative += count
+                    lines.append("%s_bucket%s %d" % (name, _format_labels(key[1] + (("le", str(bound)),)), cumulative))
+                lines.append("%s_sum%s %r" % (name, _format_labels(key[1]), histogram[-1]))
+                lines.append("%s_count%s %d" % (name, _format_labels(key[1]), cumulative))
+
+        with self._lock:
+            gauges = list(self._gauges)
+        for name, f in gauges:
+            values = f()
+            if not values:
+                continue
+            lines.append("# TYPE %s gauge" % name)
+            for labels in sorted(values):
+                lines.append("%s%s %s" % (name, _format_labels(labels), values[labels]))
+
+        return "\n".join(lines) + "\n"
+
+
+def _add_shard(counters, histograms, shard):
+    """
+    Adds the counters and histograms of a shard to the dictionaries.
+    """
+    for key, value in list(shard.counters.items()):
+        counters[key] = counters.get(key, 0) + value
+    for key, value in list(shard.histograms.items()):
+        total = histograms.get(key)
+        if total is None:
+            histograms[key] = list(value)
+        else:
+            histograms[key] = [a + b for a, b in zip(total, value)]
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{%s}" % ",".join('%s="%s"' % (name, value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+                             for name, value in labels)
+
+
+def opentelemetry_span_hook(tracer):
+    """
+    Creates a span hook for :class:`Metrics` which reports every request as an OpenTelemetry span
+    with a child span per phase. usage::
+
+        from opentelemetry import trace
+        app.metrics.span_hook = opentelemetry_span_hook(trace.get_tracer("apiaiwebhook"))
+
+    :param tracer: an OpenTelemetry tracer
+    """
+
+    def span_hook(request_timer, status):
+        start = int(request_timer.wall_started * 1e9)
+        end = start + int((request_timer.last - request_timer.started) * 1e9)
+        span = tracer.start_span("webhook %s" % request_timer.action, start_time=start,
+                                 attributes={"apiai.action": request_timer.action, "http.status_code": status})
+        try:
+            from opentelemetry import trace
+            context = trace.set_span_in_context(span)
+        except ImportError:
+            context = None
+        phase_start = start
+        elapsed = 0.0
+        for i, (phase, seconds) in enumerate(request_timer.phases):
+            elapsed += seconds
+            phase_end = end if i == len(request_timer.phases) - 1 else start + int(elapsed * 1e9)
+            tracer.start_span(phase, context=context, start_time=phase_start).end(end_time=phase_end)
+            phase_start = phase_end
+        span.end(end_time=end)
+
+    return span_hook
@@ -0,0 +1,283 @@
+# Copyright (C) 2017 Paoro
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from apiaiwebhook.payload import WebhookPayload
+
+
+class Context(object):
+    """
+    A context of a request (`result.contexts`) or of a response (`contextOut`).
+
+    :param name:        name of the context
+    :param lifespan:    number of requests the context is active for, or None
+    :param parameters:  parameters of the context as dictionary, or None
+    """
+
+    __slots__ = ("name", "lifespan", "parameters")
+
+    def __init__(self, name, lifespan=None, parameters=None):
+        self.name = name
+        self.lifespan = lifespan
+        self.parameters = parameters
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data.get("name"), data.get("lifespan"), data.get("parameters"))
+
+    def to_dict(self):
+        res = {"name": self.name}
+        if self.lifespan is not None:
+            res["lifespan"] = self.lifespan
+        if self.parameters is not None:
+            res["parameters"] = self.parameters
+        return res
+
+    def __eq__(self, other):
+        if isinstance(other, Context):
+            other = other.to_dict()
+        return self.to_dict() == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return "<Context %s>" % self.name
+
+
+class Metadata(object):
+    """
+    The metadata of the matched intent (`result.metadata`).
+    """
+
+    __slots__ = ("intent_id", "intent_name", "webhook_used")
+
+    def __init__(self, intent_id=None, intent_name=None, webhook_used=None):
+        self.intent_id = intent_id
+        self.intent_name = intent_name
+        self.webhook_used = webhook_used
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data.get("intentId"), data.get("intentName"), data.get("webhookUsed"))
+
+
+class OriginalRequest(object):
+    """
+    The request of the integration which called API.AI (`originalRequest`), e.g. Google Assistant.
+    """
+
+    __slots__ = ("source", "version", "data")
+
+    def __init__(self, source=None, version=None, data=None):
+        self.source = source
+        self.version = version
+        self.data = data
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data.get("source"), data.get("version"), data.get("data"))
+
+
+class WebhookRequest(object):
+    """
+    Typed view of a webhook request. The fields are read from the decoded request when they are accessed,
+    and the contexts, the metadata and the original request are built only when they are accessed.
+    The fulfillment functions which declare a `request` parameter receive the request of the call. usage::
+
+        @app.fulfillment("weather")
+        def weather(request, city=None):
+            context = request.context("location")
+            return app.make_response_apiai(speech=forecast(city or context.parameters["city"]))
+
+    :param payload: the request as :class:`WebhookPayload` or as decoded dictionary
+    """
+
+    __slots__ = ("payload", "_contexts", "_metadata", "_original_request")
+
+    def __init__(self, payload):
+        if not isinstance(payload, WebhookPayload):
+            payload = WebhookPayload(data=payload)
+        self.payload = payload
+        self._contexts = None
+        self._metadata = None
+        self._original_request = None
+
+    @property
+    def id(self):
+        return self.payload.data.get("id")
+
+    @property
+    def session_id(self):
+        return self.payload.data.get("sessionId")
+
+    @property
+    def timestamp(self):
+        return self.payload.data.get("timestamp")
+
+    @property
+    def lang(self):
+        return self.payload.data.get("lang")
+
+    @property
+    def action(self):
+        return self.payload.action
+
+    @property
+    def parameters(self):
+        return self.payload.parameters
+
+    @property
+    def resolved_query(self):
+        return self.payload.result.get("resolvedQuery")
+
+    @property
+    def score(self):
+        return self.payload.result.get("score")
+
+    @property
+    def contexts(self):
+        """
+        The contexts of the request as a list of :class:`Context` objects.
+        """
+        if self._contexts is None:
+            contexts = self.payload.result.get("contexts") or ()
+            self._contexts = [Context.from_dict(c) for c in contexts if isinstance(c, dict)]
+        return self._contexts
+
+    def context(self, name):
+        """
+        :return: the :class:`Context` of the name or None when the request does not have it
+        """
+        for c in self.contexts:
+            if c.name == name:
+                return c
+        return None
+
+    @property
+    def metadata(self):
+        if self._metadata is None:
+            self._metadata = Metadata.from_dict(self.payload.result.get("metadata") or {})
+        return self._metadata
+
+    @property
+    def original_request(self):
+        """
+        The :class:`OriginalRequest` or None when the request was not forwarded by an integration.
+        """
+        if self._original_request is None:
+            data = self.payload.data.get("originalRequest")
+            if not isinstance(data, dict):
+                return None
+            self._original_request = OriginalRequest.from_dict(data)
+        return self._original_request
+
+    def get(self, path, default=None):
+        """
+        Extracts a field by its dotted path, see `WebhookPayload.get()`.
+        """
+        return self.payload.get(path, default)
+
+    def __repr__(self):
+        return "<WebhookRequest %s>" % self.action
+
+
+def _contexts(context_out):
+    # the contexts are stored as dictionaries, so the response can be encoded as any dictionary
+    if not context_out:
+        return []
+    if type(context_out) is not list or any(isinstance(c, Context) for c in context_out):
+        return [c.to_dict() if isinstance(c, Context) else c for c in context_out]
+    return context_out
+
+
+def _field(key):
+    def getter(self):
+        return self.get(key)
+
+    def setter(self, value):
+        self[key] = value
+
+    return property(getter, setter)
+
+
+class WebhookResponse(dict):
+    """
+    The response of a fulfillment function. It is the dictionary of its JSON keys, e.g. `res["speech"]`
+    or `res["contextOut"]`, so it can be used wherever a dictionary can, and its fields can be read
+    and written as attributes as well, e.g. `res.speech` or `res.context_out`. :class:`ResponseEncoder`
+    encodes it without copying.
+
+    :param speech:          response to the request
+    :param display_text:    text displayed on the user device screen
+    :param data:            additional data for the client, it is not processed by API.AI
+    :param context_out:     list of the output contexts as dictionaries or :class:`Context` objects
+    :param source:          source of the response. Defaults to None, i.e. the name of the application
+    :param followup_event:  event name and parameters sent to API.AI
+    """
+
+    __slots__ = ()
+
+    speech = _field("speech")
+    display_text = _field("displayText")
+    data = _field("data")
+    context_out = _field("contextOut")
+    source = _field("source")
+    followup_event = _field("followupEvent")
+
+    def __init__(self, speech=None, display_text=None, data=None, context_out=(), source=None, followup_event=None):
+        # dict.__init__ is called directly, the lookup of super() costs a third of the construction
+        dict.__init__(self, speech=speech, displayText=display_text, data=data,
+                      contextOut=_contexts(context_out) if context_out else [], source=source,
+                      followupEvent=followup_event)
+
+    def replace(self, **kwargs):
+        """
+        :return: a copy of the response with the attributes given as keyword arguments
+        """
+        res = self.copy()
+        for attribute, value in kwargs.items():
+            setattr(res, attribute, value)
+        return res
+
+    def to_dict(self):
+        return dict(self)
+
+    def __setitem__(self, key, value):
+        if key == "contextOut":
+            value = _contexts(value)
+        super(WebhookResponse, self).__setitem__(key, value)
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def copy(self):
+        res = WebhookResponse.__new__(WebhookResponse)
+        dict.update(res, self)
+        return res
+
+    def __reduce__(self):
+        return WebhookResponse, (), None, None, iter(self.items())
+
+    def __repr__(self):
+        return "<WebhookResponse %r>" % self.speech
@@ -0,0 +1,115 @@
+# Copyright (C) 2017 Paoro
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from apiaiwebhook.exceptions import WebhookError
+
+_missing = object()
+
+try:
+    _string_types = (str, unicode)
+except NameError:
+    _string_types = (str,)
+
+
+class WebhookPayload(object):
+    """
+    Lazy view of a webhook request. The request body is kept as bytes and
+    it is decoded only when a field is accessed for the first time.
+    The dispatcher routes on `result.action` and reads `result.parameters`,
+    any other field is extracted only when a fulfillment function binds it.
+
+    :param body:    the request body as bytes
+    :param loads:   function which decodes the body, see :func:`get_json_backend`
+    :param data:    the already decoded request, when the body is not available
+    """
+
+    __slots__ = ("body", "loads", "_data", "_result")
+
+    def __init__(self, body=None, loads=None, data=None):
+        if data is not None and not isinstance(data, dict):
+            # e.g. an item of a batch, it is rejected on first access like a body which is not a JSON object
+            data = None
+        self.body = body
+        self.loads = loads
+        self._data = data
+        self._result = None
+
+    @property
+    def data(self):
+        """
+        The decoded request as dictionary.
+
+        :raise WebhookError: HTTP 400 when the body is not a valid JSON object.
+        """
+        if self._data is None:
+            if self.loads is None:
+                raise WebhookError(400, "request is not a JSON object")
+            try:
+                data = self.loads(self.body)
+            except ValueError:
+                raise WebhookError(400, "request body is not a valid JSON document")
+            if not isinstance(data, dict):
+                raise WebhookError(400, "request body is not a JSON object")
+            self._data = data
+        return self._data
+
+    @property
+    def result(self):
+        if self._result is None:
+            result = self.data.get("result")
+            if not isinstance(result, dict):
+                raise WebhookError(400, "result is required")
+            self._result = result
+        return self._result
+
+    @property
+    def action(self):
+        """
+        :raise WebhookError: HTTP 400 when the action is not a string.
+        """
+        action = self.result.get("action") or ""
+        if not isinstance(action, _string_types):
+            raise WebhookError(400, "action is not a string")
+        return action
+
+    @property
+    def parameters(self):
+        """
+        :raise WebhookError: HTTP 400 when the parameters are not a JSON object.
+        """
+        parameters = self.result.get("parameters") or {}
+        if not isinstance(parameters, dict):
+            raise WebhookError(400, "parameters is not a JSON object")
+        return parameters
+
+    def get(self, path, default=None):
+        """
+        Extracts a field by its dotted path, e.g. "sessionId" or "result.contexts".
+        The items of lists can be addressed by their index, e.g. "result.contexts.0.name".
+
+        :param path:    dotted path of the field
+        :param default: returned when the field does not exist
+        """
+        value = self.data
+        for key in path.split("."):
+            if isinstance(value, dict):
+                value = value.get(key, _missing)
+            elif isinstance(value, list) and key.isdigit() and int(key) < len(value):
+                value = value[int(key)]
+            else:
+                value = _missing
+            if value is _missing:
+                return default
+        return value
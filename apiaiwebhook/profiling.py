@@ -0,0 +1,329 @@
+# Copyright (C) 2017 Paoro
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import itertools
+import marshal
+import sys
+import threading
+import time
+
+from apiaiwebhook.auth import APIKeyring
+from apiaiwebhook.exceptions import WebhookError
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+FORMATS = ("text", "pstats", "collapsed")
+
+
+def frame_name(code):
+    return "%s (%s:%d)" % (code.co_name, code.co_filename, code.co_firstlineno)
+
+
+def collapse(frame, max_depth=64):
+    """
+    :return: the stack of the frame in the collapsed format of the flame graph tools,
+             the names of the frames from the outermost to the innermost separated by semicolons
+    """
+    names = []
+    while frame is not None and len(names) < max_depth:
+        names.append(frame_name(frame.f_code))
+        frame = frame.f_back
+    names.reverse()
+    return ";".join(names)
+
+
+class StackSampler(object):
+    """
+    Wall-clock sampling collector. A background thread takes the stack of every profiled request thread
+    once per interval and counts the collapsed stacks by action. The profiled code is not instrumented,
+    so the overhead of a profiled request does not depend on the number of its function calls.
+    The thread waits without sampling while no request is profiled.
+
+    :param interval:  seconds between two samples
+    :param max_depth: maximum number of frames of a stack
+    """
+
+    def __init__(self, interval=0.005, max_depth=64):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.threads = {}
+        self.stacks = {}
+        self.condition = threading.Condition(threading.Lock())
+        self.thread = None
+
+    def start(self, action):
+        """
+        Starts sampling the current thread for the action.
+
+        :return: the token which stops the sampling, see `stop()`
+        """
+        ident = threading.current_thread().ident
+        with self.condition:
+            self.threads.setdefault(ident, []).append(action)
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, name="apiaiwebhook-profiler")
+                self.thread.daemon = True
+                self.thread.start()
+            self.condition.notify()
+        return ident, action
+
+    def stop(self, token):
+        ident, action = token
+        with self.condition:
+            actions = self.threads.get(ident)
+            if actions is not None:
+                actions.remove(action)
+                if not actions:
+                    del self.threads[ident]
+
+    def sample(self):
+        """
+        Takes one sample of the profiled threads. The stack of a thread which serves several requests,
+        e.g. the event loop of an ASGI server, is counted for the last started request.
+        """
+        with self.condition:
+            threads = [(ident, actions[-1]) for ident, actions in self.threads.items()]
+        frames = sys._current_frames()
+        for ident, action in threads:
+            frame = frames.get(ident)
+            if frame is None:
+                continue
+            stack = collapse(frame, self.max_depth)
+            with self.condition:
+                counts = self.stacks.setdefault(action, {})
+                counts[stack] = counts.get(stack, 0) + 1
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.threads:
+                    self.condition.wait()
+            self.sample()
+            time.sleep(self.interval)
+
+    def reset(self):
+        with self.condition:
+            self.stacks = {}
+
+
+class Profiler(object):
+    """
+    On-demand profiler of the fulfillment of the webhook requests. The selected requests are profiled
+    and their profiles are aggregated by action, then they are downloaded from the admin route. usage::
+
+        app = APIAIWebhook(__name__, api_key_value="secret",
+                           profiler=Profiler(sample_rate=1000, debug_key="profiling-secret"))
+
+    A request is profiled when it is one in every `sample_rate` requests, or when its `debug_header`
+    carries the `debug_key`. The other requests are not instrumented. Without a profiler the webhook
+    dispatcher does not check anything but the `profiler` attribute.
+
+    The "cprofile" collector records every function call of the profiled requests, the profiles are
+    downloaded as text or in the binary format of `pstats`. Only one request is profiled at a time,
+    the requests selected meanwhile are not profiled. The "sampling" collector takes the stacks
+    of the profiled requests periodically, they are downloaded as collapsed stacks for flame graphs.
+
+    The admin route is `GET <url>?action=<action>&format=<text|pstats|collapsed>&reset=true`.
+    It requires the `debug_key` in the `debug_header` or, when the `debug_key` is not defined,
+    the API key of the webhook.
+
+    :param url:             the URL rule of the admin route. Defaults to '/profile/'.
+    :param sample_rate:     profile one in every N requests. Defaults to None, only the requests with the debug header.
+    :param debug_key:       the key or the list of the keys of the debug header. Defaults to None.
+    :param debug_header:    the name of the debug header. Defaults to 'x-profile'.
+    :param collector:       "cprofile" or "sampling". Defaults to "cprofile".
+    :param interval:        seconds between two samples of the "sampling" collector
+    :param max_actions:     maximum number of actions whose profiles are kept
+    """
+
+    def __init__(self, url="/profile/", sample_rate=None, debug_key=None, debug_header="x-profile",
+                 collector="cprofile", interval=0.005, max_actions=256):
+        if collector not in ("cprofile", "sampling"):
+            raise ValueError("unknown profile collector: %s" % collector)
+        self.url = url
+        self.sample_rate = sample_rate
+        self.debug_keys = None
+        if debug_key is not None:
+            self.debug_keys = APIKeyring(debug_key if isinstance(debug_key, (list, tuple, set, frozenset))
+                                         else [debug_key])
+        self.debug_header = debug_header
+        self.collector = collector
+        self.max_actions = max_actions
+        self.sampler = StackSampler(interval) if collector == "sampling" else None
+        self.profiles = {}
+        self.requests = {}
+        self._counter = itertools.count()
+        self._busy = threading.Lock()
+        self._lock = threading.Lock()
+
+    def select(self, debug_value=None):
+        """
+        :param debug_value: value of the debug header or None when it is not provided
+        :return: True when the request is profiled
+        """
+        if debug_value is not None and self.debug_keys is not None and self.debug_keys.verify(debug_value):
+            return True
+        return self.sample_rate is not None and next(self._counter) % self.sample_rate == 0
+
+    def start(self, action, debug_value=None):
+        """
+        Starts profiling a request, when it is selected.
+
+        :param action: the action of the request, the profiles are aggregated by it
+        :param debug_value: value of the debug header or None when it is not provided
+        :return: the token of the profile, see `stop()`, or None when the request is not profiled
+        """
+        if not self.select(debug_value):
+            return None
+        return self.enable(action)
+
+    def enable(self, action):
+        """
+        Starts profiling a selected request in the current thread, see `select()`.
+
+        :return: the token of the profile, see `stop()`, or None when the request cannot be profiled
+        """
+        if len(self.requests) >= self.max_actions and action not in self.requests:
+            return None
+        if self.sampler is not None:
+            return self.sampler.start(action)
+        if not self._busy.acquire(False):
+            return None
+        import cProfile
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # another profiler or debugger is active
+            self._busy.release()
+            return None
+        return action, profile
+
+    def stop(self, token):
+        """
+        Stops profiling a request and adds its profile to the profile of its action.
+        """
+        if self.sampler is not None:
+            self.sampler.stop(token)
+            action = token[1]
+        else:
+            action, profile = token
+            profile.disable()
+            self._busy.release()
+            import pstats
+            stats = pstats.Stats(profile)
+            with self._lock:
+                aggregated = self.profiles.get(action)
+                if aggregated is None:
+                    self.profiles[action] = stats
+                else:
+                    aggregated.add(stats)
+        with self._lock:
+            self.requests[action] = self.requests.get(action, 0) + 1
+
+    def call(self, action, debug_value, f, *args):
+        """
+        Calls the function, profiled when the request is selected.
+
+        :return: the return value of the function
+        """
+        token = self.start(action, debug_value)
+        if token is None:
+            return f(*args)
+        try:
+            return f(*args)
+        finally:
+            self.stop(token)
+
+    def reset(self):
+        with self._lock:
+            self.profiles = {}
+            self.requests = {}
+        if self.sampler is not None:
+            self.sampler.reset()
+
+    def check_access(self, debug_value):
+        """
+        Validates the debug header of a request of the admin route.
+
+        :raise WebhookError: HTTP 400 when the header is missing, HTTP 401 when it is invalid
+        """
+        if debug_value is None:
+            raise WebhookError(400, "%s http header is required" % self.debug_header)
+        if not self.debug_keys.verify(debug_value):
+            raise WebhookError(401, "%s is invalid" % self.debug_header)
+
+    def render(self, action=None, format="text"):
+        """
+        Renders the aggregated profiles.
+
+        :param action: the action, or None for every action
+        :param format: "text", "pstats" (the format of `pstats.Stats.dump_stats()`, one action only)
+                       or "collapsed" (collapsed stacks of the "sampling" collector)
+        :return: tuple of the body as bytes and its content type
+        :raise WebhookError: HTTP 400 when the format is not available, HTTP 404 when the action has no profile
+        """
+        if format not in FORMATS:
+            raise WebhookError(400, "unknown profile format: %s" % format)
+        with self._lock:
+            requests = dict(self.requests)
+        if action is not None and action not in requests:
+            raise WebhookError(404, "no profile of action: %s" % action)
+        actions = [action] if action is not None else sorted(requests)
+
+        if format == "collapsed":
+            if self.sampler is None:
+                raise WebhookError(400, "collapsed stacks require the sampling collector")
+            return self.render_collapsed(actions, action is None), "text/plain; charset=utf-8"
+        if format == "pstats":
+            if self.sampler is not None:
+                raise WebhookError(400, "pstats format requires the cprofile collector")
+            if action is None:
+                raise WebhookError(400, "pstats format requires an action")
+            with self._lock:
+                body = marshal.dumps(self.profiles[action].stats)
+            return body, "application/octet-stream"
+
+        out = StringIO()
+        for name in actions:
+            out.write(u"%s: %d requests\n" % (name, requests[name]))
+            if self.sampler is None:
+                with self._lock:
+                    stats = self.profiles[name]
+                    stats.stream = out
+                    stats.sort_stats("cumulative").print_stats(30)
+            else:
+                # the samples by the innermost frame
+                frames = {}
+                with self.sampler.condition:
+                    for stack, count in self.sampler.stacks.get(name, {}).items():
+                        frame = stack.rsplit(";", 1)[-1]
+                        frames[frame] = frames.get(frame, 0) + count
+                for frame, count in sorted(frames.items(), key=lambda item: -item[1])[:30]:
+                    out.write(u"%6d  %s\n" % (count, frame))
+                out.write(u"\n")
+        return out.getvalue().encode("utf-8"), "text/plain; charset=utf-8"
+
+    def render_collapsed(self, actions, prefix):
+        lines = []
+        with self.sampler.condition:
+            for name in actions:
+                for stack, count in sorted(self.sampler.stacks.get(name, {}).items()):
+                    lines.append("%s%s %d" % (name + ";" if prefix else "", stack, count))
+        return ("\n".join(lines) + "\n").encode("utf-8")
@@ -0,0 +1,208 @@
+# Copyright (C) 2017 Paoro
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from apiaiwebhook.context import timer
+
+
+class RateLimit(object):
+    """
+    Token bucket limit: `rate` requests per second on average, with bursts of at most `burst` requests.
+
+    :param rate:    the refill rate of the bucket in tokens per second
+    :param burst:   the capacity of the bucket. Defaults to the rate (at least 1).
+    """
+
+    __slots__ = ("rate", "burst")
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else max(rate, 1))
+
+    def __repr__(self):
+        return "<RateLimit %g/s burst %g>" % (self.rate, self.burst)
+
+
+class RateLimitBackend(object):
+    """
+    Interface of the stores of the token buckets.
+    Implement it to share the limits between the worker processes, e.g. by a Redis script.
+    """
+
+    def acquire(self, key, limit):
+        """
+        Takes a token from the bucket of the key. The bucket is created full.
+
+        :param key:     the key of the bucket, e.g. "session:<sessionId>"
+        :param limit:   the :class:`RateLimit` of the bucket
+        :return: True when the bucket had a token, False when the request is rejected
+        """
+        raise NotImplementedError()
+
+
+class MemoryRateLimitBackend(RateLimitBackend):
+    """
+    In-process token buckets. Every bucket is a pair of floats (tokens, updated) in an LRU ordered dictionary,
+    so a request costs O(1) and the memory is bounded by `max_keys`. An evicted bucket is recreated full.
+
+    :param max_keys: maximum number of buckets
+    """
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def acquire(self, key, limit):
+        now = timer()
+        with self._lock:
+            bucket = self._buckets.pop(key, None)
+            if bucket is None:
+                tokens = limit.burst
+            else:
+                tokens = min(limit.burst, bucket[0] + (now - bucket[1]) * limit.rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return allowed
+
+
+class SQLiteRateLimitBackend(RateLimitBackend):
+    """
+    Token buckets in an SQLite database file, shared by the worker processes of one host.
+    The buckets which have not been used for `max_idle` seconds are full again, they are deleted periodically.
+
+    :param path:        path of the database file
+    :param max_idle:    seconds after which an unused bucket is deleted
+    """
+
+    def __init__(self, path, max_idle=3600):
+        self.path = path
+        self.max_idle = max_idle
+        self._connection = None
+        self._pid = None
+        self._pruned = 0
+        self._lock = threading.Lock()
+
+    def connection(self):
+        # connections must not be shared by forked worker processes
+        if self._connection is None or self._pid != os.getpid():
+            import sqlite3
+            self._connection = sqlite3.connect(self.path, timeout=10, check_same_thread=False,
+                                               isolation_level=None)
+            self._connection.execute("CREATE TABLE IF NOT EXISTS buckets "
+                                     "(key TEXT PRIMARY KEY, tokens REAL, updated REAL)")
+            self._pid = os.getpid()
+        return self._connection
+
+    def acquire(self, key, limit):
+        with self._lock:
+            connection = self.connection()
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                row = connection.execute("SELECT tokens, updated FROM buckets WHERE key = ?", (key,)).fetchone()
+                if row is None:
+                    tokens = limit.burst
+                else:
+                    tokens = min(limit.burst, row[0] + (now - row[1]) * limit.rate)
+                allowed = tokens >= 1
+                if allowed:
+                    tokens -= 1
+                connection.execute("INSERT OR REPLACE INTO buckets (key, tokens, updated) VALUES (?, ?, ?)",
+                                   (key, tokens, now))
+                if now - self._pruned >= self.max_idle:
+                    connection.execute("DELETE FROM buckets WHERE updated < ?", (now - self.max_idle,))
+                    self._pruned = now
+            except Exception:
+                connection.execute("ROLLBACK")
+                raise
+            connection.execute("COMMIT")
+        return allowed
+
+
+class AdmissionControl(object):
+    """
+    Admission control of the webhook dispatcher, checked before the fulfillment function is called.
+    A request is rejected when the token bucket of its action or its `sessionId` is empty,
+    or when `max_concurrency` requests are already being fulfilled by the process. usage::
+
+        app = APIAIWebhook(__name__, admission=AdmissionControl(session_limit=RateLimit(1, burst=5),
+                                                                max_concurrency=64))
+
+        @app.fulfillment("search", rate_limit=RateLimit(20, burst=40))
+        def search(query):
+            ...
+
+    :param action_limit:    the default :class:`RateLimit` of the actions, None when they are not limited.
+                            It is overridden by the `rate_limit` of the fulfillment functions.
+    :param session_limit:   the :class:`RateLimit` of every session, None when the sessions are not limited
+    :param max_concurrency: maximum number of requests which are fulfilled by the process at the same time
+    :param backend:         a :class:`RateLimitBackend` object. Defaults to a :class:`MemoryRateLimitBackend`.
+    :param response:        the response which is sent to the rejected requests, e.g. created by
+                            `make_response_apiai()`. Without it HTTP 429 (rate limit) or HTTP 503 (concurrency)
+                            is returned.
+    """
+
+    def __init__(self, action_limit=None, session_limit=None, max_concurrency=None, backend=None, response=None):
+        self.action_limit = action_limit
+        self.session_limit = session_limit
+        self.max_concurrency = max_concurrency
+        self.backend = backend if backend is not None else MemoryRateLimitBackend()
+        self.response = response
+        self.running = 0
+        self._lock = threading.Lock()
+
+    def admit(self, plan, context):
+        """
+        Checks the limits of a request. When it is admitted, `release()` must be called after its fulfillment.
+
+        :param plan: the :class:`DispatchPlan` of the fulfillment function
+        :param context: the :class:`FulfillmentContext` of the request
+        :return: None when the request is admitted, otherwise the reason of the rejection:
+                 "action_rate", "session_rate" or "concurrency"
+        """
+        # the agents of a host share its admission control, their buckets are prefixed by their names
+        prefix = "%s:" % plan.namespace if plan.namespace is not None else ""
+        limit = plan.rate_limit or self.action_limit
+        if limit is not None and not self.backend.acquire(prefix + "action:" + context.action, limit):
+            return "action_rate"
+
+        if self.session_limit is not None:
+            session_id = context.payload.get("sessionId")
+            if session_id and not self.backend.acquire("%ssession:%s" % (prefix, session_id), self.session_limit):
+                return "session_rate"
+
+        if self.max_concurrency is not None:
+            with self._lock:
+                if self.running >= self.max_concurrency:
+                    return "concurrency"
+                self.running += 1
+        return None
+
+    def release(self):
+        if self.max_concurrency is not None:
+            with self._lock:
+                self.running -= 1
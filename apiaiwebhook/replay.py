@@ -0,0 +1,442 @@
+# Copyright (C) 2017 Paoro
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Replay of recorded webhook traffic against an application. usage::
+
+    python -m apiaiwebhook.replay traffic.ndjson.gz --app hello_world:app --concurrency 8
+    python -m apiaiwebhook.replay traffic.ndjson --url http://127.0.0.1:5000/webhook/ --rate 200
+
+Every line of the recording is a webhook request body, or a JSON object with the request
+and the recorded response, which is compared to the response of the application::
+
+    {"request": {"sessionId": "...", "result": {...}}, "response": {"speech": "...", ...}}
+
+The recordings are streamed: gzip files are decompressed in chunks and plain files are memory-mapped,
+so large recordings are not loaded into the memory.
+"""
+
+import argparse
+import gzip
+import io
+import json
+import mmap
+import os
+import sys
+import threading
+import time
+
+from apiaiwebhook.batch import iter_ndjson, ordered_map
+from apiaiwebhook.benchmark import DRIVERS, load_app, percentile
+from apiaiwebhook.encoding import get_json_backend
+
+try:
+    import http.client as httplib
+    from urllib.parse import urlsplit
+except ImportError:
+    import httplib
+    from urlparse import urlsplit
+
+try:
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError:
+    ThreadPoolExecutor = None
+
+CHUNK_SIZE = 1024 * 1024
+
+timer = getattr(time, "perf_counter", time.time)
+
+
+def iter_lines(path):
+    """
+    Reads the lines of a recording. "-" reads the standard input.
+
+    :param path: path of an NDJSON file, optionally gzip compressed
+    :return: iterator of the non-empty lines as bytes
+    """
+    if path == "-":
+        for line in iter_ndjson(getattr(sys.stdin, "buffer", sys.stdin)):
+            yield line
+        return
+
+    with open(path, "rb") as f:
+        compressed = f.read(2) == b"\x1f\x8b"
+        if not compressed:
+            for line in iter_mapped_lines(f):
+                yield line
+            return
+
+    with gzip.open(path, "rb") as f:
+        for line in iter_ndjson(io.BufferedReader(f, CHUNK_SIZE)):
+            yield line
+
+
+def iter_mapped_lines(f):
+    """
+    Reads the lines of a file by memory mapping, the pages are loaded by the OS as they are read.
+    """
+    size = os.fstat(f.fileno()).st_size
+    if size == 0:
+        return
+    mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        start = 0
+        while start < size:
+            end = mapped.find(b"\n", start)
+            if end < 0:
+                end = size
+            line = mapped[start:end].strip()
+            if line:
+                yield line
+            start = end + 1
+    finally:
+        mapped.close()
+
+
+class ReplayRecord(object):
+    """
+    A recorded request.
+
+    :param body:        the request body as bytes
+    :param action:      the action of the request
+    :param expected:    the recorded response as dictionary, None when it is not recorded
+    """
+
+    __slots__ = ("body", "action", "expected")
+
+    def __init__(self, body, action, expected=None):
+        self.body = body
+        self.action = action
+        self.expected = expected
+
+
+def parse_record(line, json_backend):
+    """
+    :param line: a line of the recording as bytes
+    :param json_backend: a JSONBackend object
+    :return: A ReplayRecord object
+    """
+    data = json_backend.loads(line)
+    expected = None
+    if "request" in data:
+        expected = data.get("response")
+        data = data["request"]
+        line = json_backend.dumps(data)
+    result = data.get("result")
+    action = (result.get("action") if isinstance(result, dict) else None) or ""
+    return ReplayRecord(line, action, expected)
+
+
+def diff_json(expected, actual, ignore=(), path=""):
+    """
+    Compares two decoded JSON documents.
+
+    :param ignore: the dotted paths of the fields which are not compared, e.g. "source"
+    :return: list of the differences as strings, e.g. "speech: 'a' != 'b'"
+    """
+    if path in ignore:
+        return []
+    if isinstance(expected, dict) and isinstance(actual, dict):
+        diffs = []
+        for key in sorted(set(expected) | set(actual), key=str):
+            child = "%s.%s" % (path, key) if path else str(key)
+            if key not in actual:
+                diffs.append("%s: missing" % child)
+            elif key not in expected:
+                diffs.append("%s: unexpected" % child)
+            else:
+                diffs.extend(diff_json(expected[key], actual[key], ignore, child))
+        return diffs
+    if isinstance(expected, list) and isinstance(actual, list) and len(expected) == len(actual):
+        diffs = []
+        for i, (e, a) in enumerate(zip(expected, actual)):
+            diffs.extend(diff_json(e, a, ignore, "%s.%d" % (path, i) if path else str(i)))
+        return diffs
+    if expected != actual:
+        return ["%s: %r != %r" % (path or "<root>", expected, actual)]
+    return []
+
+
+class HTTPDriver(object):
+    """
+    Sends the requests to a running webhook over a keep-alive HTTP connection.
+
+    :param url:     the URL of the webhook, e.g. "http://127.0.0.1:5000/webhook/"
+    :param headers: the HTTP headers of the requests, e.g. the authentication header
+    """
+
+    name = "http"
+
+    def __init__(self, url, headers=None):
+        parts = urlsplit(url)
+        connection_class = httplib.HTTPSConnection if parts.scheme == "https" else httplib.HTTPConnection
+        self.connection = connection_class(parts.hostname, parts.port)
+        self.path = parts.path or "/"
+        if parts.query:
+            self.path += "?" + parts.query
+        self.headers = {"Content-Type": "application/json"}
+        self.headers.update(headers or {})
+
+    def request(self, body):
+        return self.fetch(body)[0]
+
+    def fetch(self, body):
+        self.connection.request("POST", self.path, body, self.headers)
+        r = self.connection.getresponse()
+        return r.status, r.read()
+
+    def close(self):
+        self.connection.close()
+
+
+class ActionReport(object):
+    """
+    Latencies, status codes and response mismatches of the replayed requests of an action.
+    """
+
+    def __init__(self, action):
+        self.action = action
+        self.latencies = []
+        self.statuses = {}
+        self.compared = 0
+        self.mismatches = 0
+
+    @property
+    def requests(self):
+        return sum(self.statuses.values())
+
+    def to_dict(self):
+        latencies = sorted(self.latencies)
+        return {
+            "action": self.action,
+            "requests": self.requests,
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99),
+            "max": latencies[-1] if latencies else None,
+            "statuses": dict((str(k), v) for k, v in self.statuses.items()),
+            "compared": self.compared,
+            "mismatches": self.mismatches,
+        }
+
+    def __str__(self):
+        report = self.to_dict()
+        return "%-24s %8d requests   p50 %8.3f ms   p95 %8.3f ms   p99 %8.3f ms   max %8.3f ms   " \
+               "mismatches %d/%d   %s" % (
+                   self.action or "<none>", report["requests"],
+                   (report["p50"] or 0) * 1000, (report["p95"] or 0) * 1000, (report["p99"] or 0) * 1000,
+                   (report["max"] or 0) * 1000,
+                   self.mismatches, self.compared, self.statuses)
+
+
+class ReplayReport(object):
+    """
+    Report of a replay, by action. The records which cannot be parsed or sent are counted
+    by the "error" status, the replay goes on with the next record.
+
+    :param ignore:      the dotted paths of the response fields which are not compared
+    :param max_diffs:   maximum number of the kept response differences and errors
+    :param json_backend: the JSON backend which decodes the responses
+    """
+
+    def __init__(self, ignore=(), max_diffs=10, json_backend=None):
+        self.ignore = frozenset(ignore)
+        self.max_diffs = max_diffs
+        self.json_backend = get_json_backend(json_backend)
+        self.actions = {}
+        self.diffs = []
+        self.errors = []
+        self.seconds = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def requests(self):
+        return sum(report.requests for report in self.actions.values())
+
+    def action_report(self, action):
+        report = self.actions.get(action)
+        if report is None:
+            report = self.actions[action] = ActionReport(action)
+        return report
+
+    def add_error(self, action, error):
+        """
+        Counts a record which could not be parsed or sent.
+
+        :param action: the action of the record, "" when it is not known
+        :param error: the exception
+        """
+        with self._lock:
+            report = self.action_report(action)
+            report.statuses["error"] = report.statuses.get("error", 0) + 1
+            if len(self.errors) < self.max_diffs:
+                self.errors.append((action, "%s: %s" % (type(error).__name__, error)))
+
+    def add(self, record, status, body, latency):
+        diffs = None
+        if record.expected is not None:
+            try:
+                actual = self.json_backend.loads(body)
+            except ValueError:
+                actual = body.decode("utf-8", "replace")
+            diffs = diff_json(record.expected, actual, self.ignore)
+
+        with self._lock:
+            report = self.action_report(record.action)
+            report.latencies.append(latency)
+            report.statuses[status] = report.statuses.get(status, 0) + 1
+            if diffs is not None:
+                report.compared += 1
+                if diffs:
+                    report.mismatches += 1
+                    if len(self.diffs) < self.max_diffs:
+                        self.diffs.append((record.action, diffs))
+
+    def to_dict(self):
+        return {
+            "requests": self.requests,
+            "seconds": self.seconds,
+            "actions": [self.actions[action].to_dict() for action in sorted(self.actions)],
+            "diffs": [{"action": action, "diffs": diffs} for action, diffs in self.diffs],
+            "errors": [{"action": action, "error": error} for action, error in self.errors],
+        }
+
+    def __str__(self):
+        throughput = self.requests / self.seconds if self.seconds else 0.0
+        lines = ["%d requests in %.1f s, %.1f req/s" % (self.requests, self.seconds, throughput)]
+        lines.extend(str(self.actions[action]) for action in sorted(self.actions))
+        for action, diffs in self.diffs:
+            lines.append("DIFF %s: %s" % (action or "<none>", "; ".join(diffs)))
+        for action, error in self.errors:
+            lines.append("ERROR %s: %s" % (action or "<none>", error))
+        return "\n".join(lines)
+
+
+def paced(iterable, rate):
+    """
+    Yields the items at most `rate` items per second, on a fixed schedule from the first item.
+    """
+    started = timer()
+    for i, item in enumerate(iterable):
+        delay = started + i / float(rate) - timer()
+        if delay > 0:
+            time.sleep(delay)
+        yield item
+
+
+def replay(lines, make_driver, concurrency=1, rate=None, report=None):
+    """
+    Replays the recorded requests.
+
+    :param lines:       the lines of the recording, see :func:`iter_lines`
+    :param make_driver: function which creates a driver, e.g. a :class:`WSGIDriver`. Every thread has its own driver.
+    :param concurrency: number of requests sent at the same time
+    :param rate:        maximum number of requests per second, None when it is not limited
+    :param report:      a ReplayReport object. Defaults to a new report.
+    :return: the ReplayReport object. The records which cannot be parsed or sent are counted as errors.
+             The driver which failed to send a record is closed and replaced.
+    :raise RuntimeError: when `concurrency` is more than 1 and the concurrent.futures module is not available
+    """
+    if concurrency > 1 and ThreadPoolExecutor is None:
+        raise RuntimeError("concurrent replays require the concurrent.futures module")
+    report = report if report is not None else ReplayReport()
+    local = threading.local()
+    drivers = []
+    drivers_lock = threading.Lock()
+
+    def send(line):
+        try:
+            record = parse_record(line, report.json_backend)
+        except Exception as e:
+            report.add_error("", e)
+            return
+        driver = getattr(local, "driver", None)
+        if driver is None:
+            driver = local.driver = make_driver()
+            with drivers_lock:
+                drivers.append(driver)
+        t = timer()
+        try:
+            status, body = driver.fetch(record.body)
+        except Exception as e:
+            # e.g. a dropped keep-alive connection, the next record is sent by a new driver
+            report.add_error(record.action, e)
+            local.driver = None
+            driver.close()
+            return
+        report.add(record, status, body, timer() - t)
+
+    if rate:
+        lines = paced(lines, rate)
+    executor = ThreadPoolExecutor(concurrency) if concurrency > 1 else None
+    started = timer()
+    try:
+        for _ in ordered_map(send, lines, executor, 2 * concurrency):
+            pass
+    finally:
+        report.seconds = timer() - started
+        if executor is not None:
+            executor.shutdown()
+        for driver in drivers:
+            driver.close()
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay of recorded API.AI webhook traffic.")
+    parser.add_argument("recording", nargs="+", help="NDJSON recording, optionally gzip compressed, - for stdin")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--app", help="replay in-process to the application as module:attribute")
+    target.add_argument("--url", help="replay over HTTP to the webhook URL")
+    parser.add_argument("--driver", choices=["test-client", "wsgi"], default="wsgi",
+                        help="the in-process driver. Defaults to wsgi.")
+    parser.add_argument("--header", action="append", default=[], help="HTTP header as name:value, it can be repeated")
+    parser.add_argument("--concurrency", type=int, default=1, help="number of requests sent at the same time")
+    parser.add_argument("--rate", type=float, default=None, help="maximum number of requests per second")
+    parser.add_argument("--ignore", action="append", default=[],
+                        help="dotted path of a response field which is not compared, it can be repeated")
+    parser.add_argument("--diffs", type=int, default=10, help="maximum number of the reported response differences")
+    parser.add_argument("--output", help="save the report as JSON to this file")
+    args = parser.parse_args(argv)
+
+    headers = dict(header.split(":", 1) for header in args.header)
+    headers = dict((name.strip(), value.strip()) for name, value in headers.items())
+    if args.app:
+        sys.path.insert(0, ".")
+        app = load_app(args.app)
+        if getattr(app, "api_key_value", None) is not None:
+            headers.setdefault(app.api_key_header, app.api_key_value)
+
+        def make_driver():
+            return DRIVERS[args.driver](app, headers)
+    else:
+        def make_driver():
+            return HTTPDriver(args.url, headers)
+
+    def lines():
+        for path in args.recording:
+            for line in iter_lines(path):
+                yield line
+
+    report = replay(lines(), make_driver, args.concurrency, args.rate, ReplayReport(args.ignore, args.diffs))
+    print(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report.to_dict(), f, indent=2, sort_keys=True)
+    return 1 if report.diffs or report.errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,162 @@
+# Copyright (C) 2017 Paoro
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import atexit
+import collections
+import logging
+import os
+import threading
+import weakref
+
+logger = logging.getLogger(__name__)
+
+# the objects which drop their per-process state in a forked child, see ForkAware
+_fork_aware = weakref.WeakSet()
+
+
+def _after_fork_in_child():
+    for obj in list(_fork_aware):
+        obj.after_fork()
+
+
+_at_fork = hasattr(os, "register_at_fork")
+if _at_fork:
+    os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+class ForkAware(object):
+    """
+    Base class of the objects whose state belongs to one process, e.g. open connections.
+    When the process is forked (e.g. by gunicorn after the application is loaded), the child
+    drops the state inherited from the parent by `after_fork()`, without closing it.
+
+    On Python 3.7 or later the state is dropped by a fork hook, on older versions by `check_fork()`,
+    which compares the process id.
+    """
+
+    def __init__(self):
+        self.pid = os.getpid()
+        _fork_aware.add(self)
+
+    def check_fork(self):
+        if not _at_fork and self.pid != os.getpid():
+            self.after_fork()
+
+    def after_fork(self):
+        self.pid = os.getpid()
+
+
+def _shutdown(ref):
+    registry = ref()
+    if registry is not None:
+        registry.shutdown()
+
+
+class ResourceRegistry(ForkAware):
+    """
+    The shared resources of the fulfillment functions, e.g. the clients of backend APIs, and the
+    startup and shutdown hooks of the application.
+
+    The resources are created on first use in each process and closed at shutdown in the reverse order.
+    The startup hooks run once per process before the first request, so they run in the worker processes
+    of a pre-forking server rather than in its master. The shutdown hooks run when the process exits
+    or when the ASGI server shuts down.
+    """
+
+    def __init__(self):
+        super(ResourceRegistry, self).__init__()
+        self.factories = collections.OrderedDict()
+        self.startup_hooks = []
+        self.shutdown_hooks = []
+        self.started = False
+        self._instances = collections.OrderedDict()
+        self._lock = threading.RLock()
+        self._atexit_pid = None
+
+    def register(self, name, factory, close=None):
+        """
+        :param name:    name of the resource, the fulfillment functions which declare it receive the resource
+        :param factory: function which creates the resource
+        :param close:   function which closes the resource, or None
+        """
+        with self._lock:
+            self.factories[name] = (factory, close)
+            self._instances.pop(name, None)
+
+    def get(self, name):
+        """
+        :return: the resource of the current process, it is created on first use
+        """
+        self.check_fork()
+        try:
+            return self._instances[name]
+        except KeyError:
+            pass
+        with self._lock:
+            if name not in self._instances:
+                factory, close = self.factories[name]
+                self._instances[name] = factory()
+            return self._instances[name]
+
+    def ensure_started(self):
+        """
+        Runs the startup hooks, unless they already ran in the current process.
+        """
+        self.check_fork()
+        if not self.started:
+            self.startup()
+
+    def startup(self):
+        with self._lock:
+            if self.started:
+                return
+            if self._atexit_pid != os.getpid():
+                atexit.register(_shutdown, weakref.ref(self))
+                self._atexit_pid = os.getpid()
+            for hook in self.startup_hooks:
+                hook()
+            self.started = True
+
+    def shutdown(self):
+        """
+        Closes the resources of the current process and runs the shutdown hooks.
+        The errors are logged, they do not stop the other resources from closing.
+        """
+        with self._lock:
+            instances = list(self._instances.items())
+            self._instances.clear()
+            started, self.started = self.started, False
+        for name, instance in reversed(instances):
+            factory, close = self.factories.get(name, (None, None))
+            if close is None:
+                continue
+            try:
+                close(instance)
+            except Exception:
+                logger.exception("closing resource failed: %s" % name)
+        if not started:
+            return
+        for hook in self.shutdown_hooks:
+            try:
+                hook()
+            except Exception:
+                logger.exception("shutdown hook failed")
+
+    def after_fork(self):
+        super(ResourceRegistry, self).after_fork()
+        self._instances = collections.OrderedDict()
+        self._lock = threading.RLock()
+        self.started = False
@@ -0,0 +1,142 @@
+# Copyright (C) 2017 Paoro
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from json.encoder import encode_basestring_ascii
+
+from apiaiwebhook.model import Context, WebhookResponse
+
+try:
+    _string_types = (str, unicode)
+except NameError:
+    _string_types = (str,)
+
+# the keys of the response created by `make_response_apiai()`, in order
+RESPONSE_KEYS = ("speech", "displayText", "data", "contextOut", "source", "followupEvent")
+
+
+class StaticResponse(object):
+    """
+    Prebuilt response for canned replies. The response is encoded once, when it is created,
+    then the webhook dispatcher sends its bytes as they are. usage::
+
+        GREETING = app.static_response(speech="Hello, World!")
+
+        @app.fulfillment("hello-world")
+        def hello_world():
+            return GREETING
+
+    :param body: the JSON encoded response as bytes
+    """
+
+    __slots__ = ("body",)
+
+    def __init__(self, body):
+        self.body = body
+
+    def __repr__(self):
+        return "<StaticResponse %r>" % self.body
+
+
+class ResponseEncoder(object):
+    """
+    Encodes the return values of the fulfillment functions to bytes.
+
+    The :class:`WebhookResponse` objects created by `make_response_apiai()` are assembled from fragments:
+    the keys and the `source` field, which is the same for every response of an application, are encoded
+    once and cached, the empty `data`, `contextOut` and `followupEvent` fields
+    are constants. Only the other fields are encoded per response. The dictionaries with the same keys
+    are assembled the same way.
+
+    Backends which encode a whole response faster than it can be assembled (see `JSONBackend.fast`)
+    encode the dictionaries and the WebhookResponse objects directly.
+
+    :param source:  the source of the responses, i.e. the name of the application
+    :param backend: the :class:`JSONBackend` which encodes the variable fields
+    """
+
+    def __init__(self, source, backend):
+        self.source = source
+        self.backend = backend
+        self.key_fragments = dict((key, ('"%s":' % key).encode("ascii")) for key in RESPONSE_KEYS)
+        self.constant_fragments = {
+            "source": self.key_fragments["source"] + backend.dumps(source),
+        }
+        self.model_fragments = (b"{" + self.key_fragments["speech"],) + tuple(
+            b"," + self.key_fragments[key] for key in RESPONSE_KEYS[1:])
+        self.model_source = b"," + self.constant_fragments["source"]
+
+    def encode(self, res):
+        """
+        :param res: a :class:`StaticResponse` or any object which can be encoded by the backend
+        :return: the JSON encoded response as bytes
+        """
+        if isinstance(res, StaticResponse):
+            return res.body
+        if type(res) is WebhookResponse:
+            return self.encode_model(res)
+        if not self.backend.fast and type(res) is dict and len(res) == len(RESPONSE_KEYS) \
+                and res.get("source", None) == self.source and all(key in res for key in RESPONSE_KEYS):
+            return self.encode_fragments(res)
+        return self.backend.dumps(res)
+
+    def encode_fragments(self, res):
+        fragments = []
+        for key in RESPONSE_KEYS:
+            fragment = self.constant_fragments.get(key)
+            if fragment is None:
+                fragment = self.key_fragments[key] + self.encode_value(res[key])
+            fragments.append(fragment)
+        return b"{" + b",".join(fragments) + b"}"
+
+    def encode_model(self, res):
+        """
+        Encodes a :class:`WebhookResponse`, the `source` field defaults to the source of the encoder.
+        """
+        source = res.get("source")
+        if self.backend.fast or len(res) != len(RESPONSE_KEYS):
+            # the C encoders are faster with the dictionary itself than the assembly in Python
+            return self.backend.dumps(dict(res, source=self.source) if source is None else res)
+        encode_value = self.encode_value
+        speech, display_text, data, context_out, source_fragment, followup_event = self.model_fragments
+        if source is None or source == self.source:
+            source_fragment = self.model_source
+        else:
+            source_fragment += encode_value(source)
+        contexts = res.get("contextOut")
+        if not contexts:
+            contexts = b"[]"
+        else:
+            contexts = self.backend.dumps(self.encode_contexts(contexts))
+        return b"".join((
+            speech, encode_value(res.get("speech")),
+            display_text, encode_value(res.get("displayText")),
+            data, encode_value(res.get("data")),
+            context_out, contexts,
+            source_fragment,
+            followup_event, encode_value(res.get("followupEvent")),
+            b"}"))
+
+    @staticmethod
+    def encode_contexts(contexts):
+        return [c.to_dict() if isinstance(c, Context) else c for c in contexts]
+
+    def encode_value(self, value):
+        if value is None:
+            return b"null"
+        if isinstance(value, _string_types):
+            return encode_basestring_ascii(value).encode("ascii")
+        if type(value) is list and not value:
+            return b"[]"
+        return self.backend.dumps(value)
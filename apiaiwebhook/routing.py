@@ -0,0 +1,119 @@
+# Copyright (C) 2017 Paoro
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+SEPARATOR = "."
+WILDCARD = "*"
+PREFIX = "**"
+
+
+def is_pattern(rule):
+    """
+    :return: True when the rule is a wildcard or a prefix pattern, False when it is an exact action
+    """
+    return WILDCARD in rule
+
+
+class _Node(object):
+    __slots__ = ("children", "wildcard", "rule", "prefix_rule")
+
+    def __init__(self):
+        self.children = {}
+        self.wildcard = None
+        self.rule = None
+        self.prefix_rule = None
+
+
+class ActionRouter(object):
+    """
+    Matches the actions to the patterns of the fulfillment functions. The actions and the patterns are
+    split to dot separated segments, e.g. `orders.status.get`:
+
+        * `orders.*.get` - `*` matches exactly one segment
+        * `orders.**` - `**` as the last segment matches the remaining segments, zero or more
+        * `**` - matches every action, it is the default fulfillment
+
+    The patterns are compiled to a trie of segments when they are added. When more than one pattern matches
+    an action, the most specific wins: at each segment a literal is preferred to `*` and `*` to `**`.
+    The results are memoized per action, so the recurring actions are matched by a single dictionary lookup.
+
+    :param memo_size: maximum number of memoized actions. Defaults to 4096.
+    """
+
+    def __init__(self, memo_size=4096):
+        self.root = _Node()
+        self.patterns = set()
+        self.memo_size = memo_size
+        self._memo = {}
+
+    def add(self, pattern):
+        """
+        Adds a pattern.
+
+        :raise ValueError: when `*` is a part of a segment or `**` is not the last segment
+        """
+        segments = pattern.split(SEPARATOR)
+        node = self.root
+        for i, segment in enumerate(segments):
+            if segment == PREFIX:
+                if i != len(segments) - 1:
+                    raise ValueError("'**' must be the last segment of the pattern: %s" % pattern)
+                node.prefix_rule = pattern
+                break
+            if segment == WILDCARD:
+                if node.wildcard is None:
+                    node.wildcard = _Node()
+                node = node.wildcard
+            elif WILDCARD in segment:
+                raise ValueError("'*' must be a whole segment of the pattern: %s" % pattern)
+            else:
+                node = node.children.setdefault(segment, _Node())
+        else:
+            node.rule = pattern
+        self.patterns.add(pattern)
+        self._memo = {}
+
+    def match(self, action):
+        """
+        :param action: the action of the request
+        :return: the most specific pattern which matches the action or None
+        """
+        try:
+            return self._memo[action]
+        except KeyError:
+            pass
+        rule = self._match(self.root, action.split(SEPARATOR), 0) if self.patterns else None
+        memo = self._memo
+        if len(memo) >= self.memo_size:
+            memo.clear()
+        memo[action] = rule
+        return rule
+
+    def _match(self, node, segments, i):
+        if i == len(segments):
+            return node.rule if node.rule is not None else node.prefix_rule
+        child = node.children.get(segments[i])
+        if child is not None:
+            rule = self._match(child, segments, i + 1)
+            if rule is not None:
+                return rule
+        if node.wildcard is not None and segments[i]:
+            rule = self._match(node.wildcard, segments, i + 1)
+            if rule is not None:
+                return rule
+        return node.prefix_rule
+
+    def __len__(self):
+        return len(self.patterns)
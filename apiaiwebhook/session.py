@@ -0,0 +1,202 @@
+# Copyright (C) 2017 Paoro
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import threading
+
+from apiaiwebhook.cache import LRUCache
+from apiaiwebhook.context import timer
+from apiaiwebhook.encoding import get_json_backend
+
+
+class Session(dict):
+    """
+    State of a conversation, keyed by the `sessionId` of the requests.
+    It is a dictionary which records the keys set or deleted by the fulfillment function,
+    only the changed sessions are written back. Nested values are not tracked,
+    assign them again after changing them, e.g. `session["cart"] = cart`.
+
+    :param session_id:  the `sessionId` of the request, None when the request has no session
+    :param state:       the stored state as dictionary
+    :param contexts:    the active contexts of the request (`result.contexts`) by their names
+    :param key:         the key of the state in the store. Defaults to the session id.
+    """
+
+    __slots__ = ("id", "key", "contexts", "changed")
+
+    def __init__(self, session_id=None, state=None, contexts=None, key=None):
+        super(Session, self).__init__(state or {})
+        self.id = session_id
+        self.key = key if key is not None else session_id
+        self.contexts = contexts or {}
+        self.changed = set()
+
+    @property
+    def modified(self):
+        return bool(self.changed)
+
+    def context(self, name):
+        """
+        :return: the parameters of an active context of the request as dictionary, None when it is not active
+        """
+        context = self.contexts.get(name)
+        if context is None:
+            return None
+        return context.get("parameters") or {}
+
+    def __setitem__(self, key, value):
+        super(Session, self).__setitem__(key, value)
+        self.changed.add(key)
+
+    def __delitem__(self, key):
+        super(Session, self).__delitem__(key)
+        self.changed.add(key)
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def pop(self, key, *args):
+        if key in self:
+            self.changed.add(key)
+        return super(Session, self).pop(key, *args)
+
+    def popitem(self):
+        key, value = super(Session, self).popitem()
+        self.changed.add(key)
+        return key, value
+
+    def clear(self):
+        self.changed.update(self)
+        super(Session, self).clear()
+
+    def __repr__(self):
+        return "<Session %s %s>" % (self.id, dict.__repr__(self))
+
+
+class SessionStore(object):
+    """
+    Store of the session states. The states are kept in a bounded in-process LRU cache with TTL,
+    or in an optional shared backend, e.g. :class:`SQLiteCache` or a :class:`CacheBackend`
+    implemented by Redis. The changed states are written back at the end of the requests. usage::
+
+        app = APIAIWebhook(__name__, session_store=SessionStore(backend=SQLiteCache("sessions.db"),
+                                                                write_behind=1.0))
+
+        @app.fulfillment("add-to-cart")
+        def add_to_cart(product, session):
+            session["cart"] = session.get("cart", []) + [product]
+            return app.make_response_apiai(speech="%d items in your cart" % len(session["cart"]))
+
+    :param backend:             a :class:`CacheBackend` object, None when the states are kept in-process only
+    :param ttl:                 time to live of the states in seconds since their last change
+    :param max_entries:         maximum number of states of the in-process cache
+    :param cache_ttl:           seconds a state of the backend is served from the in-process cache.
+                                Defaults to 0 with a backend: the states are read from the backend by every request,
+                                so the worker processes never serve a state changed by another worker.
+                                A positive value saves backend reads when the requests of a conversation
+                                are served by the same process. Without a backend `ttl` is used.
+    :param write_behind:        the changed states are collected and written to the backend in one batch
+                                at most this often, in seconds. 0 writes them at the end of every request.
+    :param context_name:        name of the output context which carries the changed values, None to disable it
+    :param context_lifespan:    lifespan of the output context
+    :param json_backend:        the JSON backend which encodes the states, see :func:`get_json_backend`
+    """
+
+    def __init__(self, backend=None, ttl=1800, max_entries=10000, write_behind=0,
+                 context_name="session", context_lifespan=5, json_backend=None, cache_ttl=0):
+        self.backend = backend
+        self.ttl = ttl
+        self.cache_ttl = cache_ttl if backend is not None else ttl
+        self.cache = LRUCache(max_entries)
+        self.write_behind = write_behind
+        self.context_name = context_name
+        self.context_lifespan = context_lifespan
+        self.json_backend = get_json_backend(json_backend)
+        self._dirty = {}
+        self._flushed = timer()
+        self._lock = threading.Lock()
+
+    def load(self, payload, namespace=None):
+        """
+        Loads the session of a request. The in-process cache is checked first (unless `cache_ttl` is 0),
+        then the pending writes and the backend.
+
+        :param payload:     the request as :class:`WebhookPayload`
+        :param namespace:   the prefix of the key of the state, when the sessions of several webhooks share a store
+        :return: A Session object
+        """
+        contexts = {}
+        for context in payload.get("result.contexts") or ():
+            if isinstance(context, dict) and context.get("name"):
+                contexts[context["name"]] = context
+
+        session_id = payload.get("sessionId")
+        if not session_id:
+            return Session(None, None, contexts)
+
+        key = session_id if namespace is None else "%s:%s" % (namespace, session_id)
+        value = self.cache.get(key) if self.cache_ttl else None
+        if value is None and self.backend is not None:
+            with self._lock:
+                value = self._dirty.get(key)
+            if value is None:
+                value = self.backend.get(key)
+            if value is not None and self.cache_ttl:
+                self.cache.set(key, value, self.cache_ttl)
+        state = self.json_backend.loads(value) if value is not None else None
+        return Session(session_id, state, contexts, key)
+
+    def save(self, session):
+        """
+        Stores a changed session. It is written to the backend now or by the next batch, see `write_behind`.
+        """
+        if not session.modified or session.id is None:
+            return
+        value = self.json_backend.dumps(dict(session))
+        if self.cache_ttl:
+            self.cache.set(session.key, value, self.cache_ttl)
+        if self.backend is None:
+            return
+        with self._lock:
+            self._dirty[session.key] = value
+            flush = timer() - self._flushed >= self.write_behind
+        if flush:
+            self.flush()
+
+    def flush(self):
+        """
+        Writes the pending states to the backend in one batch.
+        """
+        with self._lock:
+            dirty, self._dirty = self._dirty, {}
+            self._flushed = timer()
+        if dirty:
+            self.backend.set_many(dirty, self.ttl)
+
+    def context_out(self, session):
+        """
+        :return: the output context of the changed values of the session, None when no value was set
+        """
+        if self.context_name is None:
+            return None
+        parameters = dict((key, session[key]) for key in session.changed if key in session)
+        if not parameters:
+            return None
+        return {"name": self.context_name, "lifespan": self.context_lifespan, "parameters": parameters}
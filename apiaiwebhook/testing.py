@@ -0,0 +1,63 @@
+# Copyright (C) 2017 Paoro
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import flask.json as json
+import flask.testing
+
+
+class APIAIWebhookClient(flask.testing.FlaskClient):
+    """
+    The API.AI Webhook Client extends the Flask Client in order to post valid webhook messages.
+
+        app.testing = True
+        app.debug = True
+        r = app.test_client_apiai().webhook(action="hello-world",
+                                            parameters={"param": "value"})
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(APIAIWebhookClient, self).__init__(*args, **kwargs)
+        self.apiai_webhook = None
+
+    def webhook(self,
+                action=None,
+                parameters={},
+                session_id=None,
+                contexts=None):
+        """
+        Uses a regular Flask test client in order to post valid webhook messages.
+
+        :param action: action to tested
+        :param parameters: parameters of the action as dictionary
+        :param session_id: the sessionId of the request
+        :param contexts: the active contexts of the request as list
+        :return: returns a response object as a regular Flask test client
+        """
+        req = {
+            "result": {
+                "action": action,
+                "parameters": parameters
+            }
+        }
+        if session_id is not None:
+            req["sessionId"] = session_id
+        if contexts is not None:
+            req["result"]["contexts"] = contexts
+
+        return self.post(
+            self.apiai_webhook.webhook_url,
+            data=json.dumps(req),
+            content_type="application/json",
+            headers={self.apiai_webhook.api_key_header: self.apiai_webhook.api_key_value})
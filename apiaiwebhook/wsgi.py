@@ -0,0 +1,230 @@
+# Copyright (C) 2017 Paoro
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+try:
+    from urllib.parse import parse_qsl
+except ImportError:
+    from urlparse import parse_qsl
+
+from apiaiwebhook.context import Deadline
+from apiaiwebhook.exceptions import WebhookError
+from apiaiwebhook.payload import WebhookPayload
+
+REASONS = {
+    200: "200 OK",
+    400: "400 Bad Request",
+    401: "401 Unauthorized",
+    403: "403 Forbidden",
+    404: "404 Not Found",
+    405: "405 Method Not Allowed",
+    413: "413 Request Entity Too Large",
+    415: "415 Unsupported Media Type",
+    429: "429 Too Many Requests",
+    500: "500 Internal Server Error",
+    503: "503 Service Unavailable",
+    504: "504 Gateway Timeout",
+}
+
+
+def status_line(status):
+    return REASONS.get(status) or "%d Error" % status
+
+
+def environ_key(header_name):
+    return "HTTP_" + header_name.upper().replace("-", "_")
+
+
+class WSGIWebhook(object):
+    """
+    Minimal WSGI application which dispatches the webhook requests of a :class:`WebhookEngine`.
+    It reads the body from `wsgi.input` and returns the encoded response as a single chunk,
+    without creating the request and response objects of Flask.
+    It shares the `fulfillment_functions` registry, the authentication settings,
+    the `webhook_url` and the `metrics_url` of the engine.
+
+    :param webhook: the :class:`WebhookEngine` object, e.g. an :class:`APIAIWebhook`
+    """
+
+    def __init__(self, webhook):
+        self.webhook = webhook
+        self.webhook_url = webhook.webhook_url
+        self.path = webhook.webhook_url.rstrip("/")
+        self.auth_environ_key = environ_key(webhook.api_key_header)
+        self.profile_environ_key = None
+        if webhook.profiler is not None:
+            self.profile_environ_key = environ_key(webhook.profiler.debug_header)
+
+    def __call__(self, environ, start_response):
+        webhook = self.webhook
+        metrics = webhook.metrics
+        if metrics is not None and environ.get("PATH_INFO") == webhook.metrics_url \
+                and environ["REQUEST_METHOD"] == "GET":
+            return self.send_response(start_response, 200, metrics.render_prometheus().encode("utf-8"),
+                                      "text/plain; version=0.0.4")
+        if webhook.profiler is not None and environ.get("PATH_INFO") == webhook.profiler.url \
+                and environ["REQUEST_METHOD"] == "GET":
+            return self.profile(environ, start_response)
+
+        deadline = Deadline(webhook.deadline)
+        request_timer = metrics.start() if metrics is not None else None
+        try:
+            res = self.handle(environ, request_timer, deadline)
+        except WebhookError as e:
+            if request_timer is not None:
+                request_timer.finish(e.status)
+            return self.send_response(start_response, e.status, e.message.encode("utf-8"),
+                                      "text/plain; charset=utf-8")
+        except Exception:
+            if request_timer is not None:
+                request_timer.finish(500)
+            webhook.logger.exception("fulfillment failed")
+            return self.send_response(start_response, 500, b"internal server error", "text/plain; charset=utf-8")
+
+        if request_timer is not None:
+            request_timer.finish(200)
+        res, coding = webhook.compress_response(res, environ.get("HTTP_ACCEPT_ENCODING"))
+        headers = None
+        if webhook.compression is not None:
+            headers = [("Vary", "Accept-Encoding")]
+            if coding is not None:
+                headers.append(("Content-Encoding", coding))
+        return self.send_response(start_response, 200, res, "application/json", headers)
+
+    def handle(self, environ, request_timer=None, deadline=None):
+        """
+        Validates and dispatches one HTTP request.
+
+        :param environ: the WSGI environment of the request
+        :param request_timer: A RequestTimer object when the phases of the request are measured
+        :param deadline: the :class:`Deadline` of the request
+        :return: the JSON encoded response as bytes
+        :raise WebhookError: when the request cannot be fulfilled
+        """
+        path = environ.get("PATH_INFO", "")
+        if path.rstrip("/") != self.path:
+            raise WebhookError(404, "not found: %s" % path)
+
+        if environ["REQUEST_METHOD"] != "POST":
+            raise WebhookError(405, "method is not allowed: %s" % environ["REQUEST_METHOD"])
+
+        return self.handle_request(environ, request_timer, deadline)
+
+    def handle_request(self, environ, request_timer=None, deadline=None):
+        """
+        Authenticates, reads and dispatches a POST request of the webhook URL.
+
+        :return: the JSON encoded response as bytes
+        :raise WebhookError: when the request cannot be fulfilled
+        """
+        webhook = self.webhook
+        webhook.check_api_key(environ.get(self.auth_environ_key))
+        if request_timer is not None:
+            request_timer.mark("auth")
+
+        body = self.read_body(environ, webhook)
+        log_payload = webhook.payload_logger.sample()
+        if log_payload:
+            webhook.payload_logger.request(body)
+
+        payload = WebhookPayload(body, webhook.json_backend.loads)
+        if webhook.profiler is None:
+            res = webhook.fulfill(payload, request_timer, deadline)
+        else:
+            res = webhook.profiler.call(webhook.profile_key(payload.action), environ.get(self.profile_environ_key),
+                                        webhook.fulfill, payload, request_timer, deadline)
+        if log_payload:
+            webhook.payload_logger.response(res)
+        return res
+
+    def profile(self, environ, start_response):
+        """
+        Serves the profiles of the profiler, see `WebhookEngine.render_profile()`.
+        """
+        try:
+            body, content_type = self.webhook.render_profile(dict(parse_qsl(environ.get("QUERY_STRING", ""))),
+                                                             environ.get(self.profile_environ_key),
+                                                             environ.get(self.auth_environ_key))
+        except WebhookError as e:
+            return self.send_response(start_response, e.status, e.message.encode("utf-8"),
+                                      "text/plain; charset=utf-8")
+        return self.send_response(start_response, 200, body, content_type)
+
+    @staticmethod
+    def read_body(environ, webhook):
+        try:
+            length = int(environ.get("CONTENT_LENGTH") or 0)
+        except ValueError:
+            raise WebhookError(400, "invalid content length")
+        return webhook.read_request(environ["wsgi.input"].read, max(length, 0), environ.get("HTTP_CONTENT_ENCODING"))
+
+    @staticmethod
+    def send_response(start_response, status, body, content_type, headers=None):
+        response_headers = [
+            ("Content-Type", content_type),
+            ("Content-Length", str(len(body))),
+        ]
+        if headers:
+            response_headers.extend(headers)
+        start_response(status_line(status), response_headers)
+        return [body]
+
+
+class WSGIAgentHost(WSGIWebhook):
+    """
+    WSGI application which serves the agents of an :class:`AgentHost`. Each request is routed to its agent
+    by its URL or its API key, then it is dispatched by the :class:`WSGIWebhook` of the agent.
+
+    :param host: the :class:`AgentHost` object
+    """
+
+    def __init__(self, host):
+        super(WSGIAgentHost, self).__init__(host)
+        self.apps = {}
+        host.frontends.add(self)
+
+    def agent_app(self, agent):
+        """
+        :return: the WSGIWebhook of the agent, it is created on first use
+        """
+        app = self.apps.get(agent.agent_name)
+        if app is None or app.webhook is not agent:
+            app = self.apps[agent.agent_name] = WSGIWebhook(agent)
+            if self.webhook.agents.get(agent.agent_name) is not agent:
+                # the agent was removed while its request was routed
+                self.discard_agent(agent.agent_name)
+        return app
+
+    def discard_agent(self, name):
+        """
+        Drops the application of a removed agent, see `AgentHost.remove_agent()`.
+        """
+        self.apps.pop(name, None)
+
+    def handle(self, environ, request_timer=None, deadline=None):
+        host = self.webhook
+        agent = host.find_agent(environ.get("PATH_INFO", ""), environ.get(self.auth_environ_key))
+        try:
+            if environ["REQUEST_METHOD"] != "POST":
+                raise WebhookError(405, "method is not allowed: %s" % environ["REQUEST_METHOD"])
+            res = self.agent_app(agent).handle_request(environ, request_timer, deadline)
+        except WebhookError as e:
+            host.agent_request(agent, e.status)
+            raise
+        except Exception:
+            host.agent_request(agent, 500)
+            raise
+        host.agent_request(agent, 200)
+        return res
@@ -0,0 +1,84 @@
+# Copyright (C) 2017 Paoro
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Compares the memory of hosting 40 agents as 40 Flask processes and as the agents of one AgentHost process,
+and measures the routing of a request to its agent by its API key.
+
+    python benchmarks/agents_benchmark.py
+"""
+
+import subprocess
+import sys
+import timeit
+
+SETUP = """
+import resource, sys, tracemalloc
+tracemalloc.start()
+
+def handler(**kwargs):
+    return None
+
+def register(webhook):
+    for i in range(20):
+        webhook.fulfillment("action%d" % i)(handler)
+    return webhook
+"""
+
+FLASK = SETUP + """
+from apiaiwebhook import APIAIWebhook
+webhook = register(APIAIWebhook("agent", api_key_value="secret"))
+webhook.make_wsgi_app()
+"""
+
+HOST = SETUP + """
+from apiaiwebhook.agents import AgentHost
+host = AgentHost("agents")
+for i in range(int(sys.argv[1])):
+    register(host.agent("agent%d" % i, api_key_value="secret%d" % i))
+host.make_wsgi_app()
+"""
+
+REPORT = """
+print("%d %d" % (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, tracemalloc.get_traced_memory()[0]))
+"""
+
+
+def measure(script, *args):
+    """
+    :return: tuple of the maximum resident set size and the traced Python allocations in kilobytes
+    """
+    output = subprocess.check_output([sys.executable, "-c", script + REPORT] + list(args))
+    rss, traced = output.decode("utf-8").split()
+    return int(rss), int(traced) // 1024
+
+
+def main(agents=40, number=100000):
+    rss, traced = measure(FLASK)
+    print("1 Flask process:            %8d kB RSS %8d kB allocated" % (rss, traced))
+    print("%d Flask processes:         %8d kB RSS" % (agents, rss * agents))
+    rss, traced = measure(HOST, str(agents))
+    print("1 host process, %d agents:  %8d kB RSS %8d kB allocated" % (agents, rss, traced))
+
+    from apiaiwebhook.agents import AgentHost
+    for count in (40, 1000):
+        host = AgentHost("agents")
+        for i in range(count):
+            host.agent("agent%d" % i, api_key_value="secret%d" % i)
+        seconds = min(timeit.repeat(lambda: host.find_agent("/webhook/", "secret7"), number=number, repeat=3))
+        print("find agent by key, %4d agents: %6.3f us" % (count, seconds / number * 1e6))
+
+
+if __name__ == '__main__':
+    main()
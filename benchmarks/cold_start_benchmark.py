@@ -0,0 +1,105 @@
+# Copyright (C) 2017 Paoro
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Measures the cold start of a webhook instance: the import of the package, the construction of the application
+and its first request, each in a fresh interpreter. The default and the slim construction are compared
+with a baseline, the package of an earlier version checked out in another directory, e.g.:
+
+    git worktree add /tmp/apiaiwebhook-baseline <commit>
+    python benchmarks/cold_start_benchmark.py --baseline /tmp/apiaiwebhook-baseline
+
+Run it with the bytecode cache enabled (PYTHONDONTWRITEBYTECODE unset), as the instances are deployed,
+otherwise the compilation of the modules is measured as well.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+# the script only uses the API of the first versions: the constructor, `fulfillment()`, `make_response_apiai()`
+# and the WSGI application, so it measures the same work in every version
+SCRIPT = """
+import io, json, time
+timer = getattr(time, "perf_counter", time.time)
+started = timer()
+from apiaiwebhook import APIAIWebhook
+imported = timer()
+app = APIAIWebhook("cold_start", api_key_value="secret", **%(kwargs)r)
+
+@app.fulfillment("hello-world")
+def hello_world():
+    return app.make_response_apiai(speech="Hello, World!")
+
+constructed = timer()
+body = b'{"result": {"action": "hello-world"}}'
+environ = {"REQUEST_METHOD": "POST", "PATH_INFO": "/webhook/", "SCRIPT_NAME": "", "QUERY_STRING": "",
+           "SERVER_NAME": "localhost", "SERVER_PORT": "80", "SERVER_PROTOCOL": "HTTP/1.1",
+           "CONTENT_TYPE": "application/json", "CONTENT_LENGTH": str(len(body)), "HTTP_API_KEY": "secret",
+           "wsgi.version": (1, 0), "wsgi.url_scheme": "http", "wsgi.input": io.BytesIO(body),
+           "wsgi.errors": io.BytesIO(), "wsgi.multithread": False, "wsgi.multiprocess": False,
+           "wsgi.run_once": False}
+statuses = []
+b"".join(app(environ, lambda status, headers, exc_info=None: statuses.append(status)))
+finished = timer()
+assert statuses[0].startswith("200"), statuses
+print(json.dumps({"import": imported - started, "construct": constructed - imported,
+                  "first request": finished - constructed, "total": finished - started}))
+"""
+
+
+def cold_start(path, kwargs):
+    # the package is imported from the working directory of the interpreter
+    output = subprocess.check_output([sys.executable, "-c", SCRIPT % {"kwargs": kwargs}], cwd=path)
+    return json.loads(output.decode("utf-8").strip().splitlines()[-1])
+
+
+def report(name, samples):
+    medians = {}
+    for key in samples[0]:
+        values = sorted(sample[key] for sample in samples)
+        medians[key] = values[len(values) // 2]
+    print("%-8s import %7.1f ms   construct %6.2f ms   first request %6.2f ms   total %7.1f ms" % (
+        name, medians["import"] * 1000, medians["construct"] * 1000, medians["first request"] * 1000,
+        medians["total"] * 1000))
+    return medians
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Cold start of a webhook instance.")
+    parser.add_argument("--baseline", help="directory of an earlier version of the package to compare with")
+    parser.add_argument("--runs", type=int, default=15, help="number of the fresh interpreters of each variant")
+    args = parser.parse_args(argv)
+
+    path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    variants = [("default", path, {}), ("slim", path, {"slim": True})]
+    if args.baseline:
+        variants.insert(0, ("baseline", os.path.abspath(args.baseline), {}))
+    # the variants are run in turns, so a drift of the machine affects each of them the same way
+    samples = dict((name, []) for name, variant_path, kwargs in variants)
+    for _ in range(args.runs):
+        for name, variant_path, kwargs in variants:
+            samples[name].append(cold_start(variant_path, kwargs))
+    results = dict((name, report(name, samples[name])) for name, variant_path, kwargs in variants)
+    if args.baseline:
+        for name in ("default", "slim"):
+            print("%-8s %+.1f ms total against the baseline" % (
+                name, (results[name]["total"] - results["baseline"]["total"]) * 1000))
+
+
+if __name__ == '__main__':
+    main()
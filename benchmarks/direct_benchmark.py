@@ -0,0 +1,58 @@
+# Copyright (C) 2017 Paoro
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+Compares a suite of conversation cases run by the Flask test client with the direct client.
+
+    python benchmarks/direct_benchmark.py
+"""
+
+import json
+import time
+
+from apiaiwebhook import APIAIWebhook
+
+
+def main(count=15000):
+    app = APIAIWebhook(__name__, api_key_value="secret", slim=True)
+    app.testing = True
+
+    @app.fulfillment("orders.status.get")
+    def status(order_id, session_id):
+        return app.make_response_apiai(speech="Order %s is on its way." % order_id)
+
+    cases = [{"sessionId": "s%d" % i, "result": {"action": "orders.status.get",
+                                                 "parameters": {"order_id": str(i), "session_id": "s%d" % i}}}
+             for i in range(count)]
+
+    client = app.test_client_apiai()
+    start = time.time()
+    for case in cases:
+        r = client.post(app.webhook_url, data=json.dumps(case), content_type="application/json",
+                        headers={"api-key": "secret"})
+        json.loads(r.data.decode("utf-8"))
+    print("%-24s %6.2f s" % ("test client", time.time() - start))
+
+    for name, direct in (("direct", app.direct_client()), ("direct (4 workers)", app.direct_client(workers=4))):
+        start = time.time()
+        for result in direct.call_many(cases):
+            assert result.ok
+        print("%-24s %6.2f s" % (name, time.time() - start))
+        direct.close()
+
+
+if __name__ == '__main__':
+    main()
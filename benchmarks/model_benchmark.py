@@ -0,0 +1,77 @@
+# Copyright (C) 2017 Paoro
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+Compares the responses built as dictionaries with the WebhookResponse objects
+created by `make_response_apiai()`, for both JSON backends. The "encode" lines
+encode a response which was built once, so they exclude the construction.
+
+    python benchmarks/model_benchmark.py
+"""
+
+import gc
+import timeit
+import tracemalloc
+
+from apiaiwebhook.encoding import get_json_backend
+from apiaiwebhook.model import WebhookResponse
+from apiaiwebhook.response import ResponseEncoder
+
+
+def as_dict(speech, data):
+    return {
+        "speech": speech,
+        "displayText": None,
+        "data": data,
+        "contextOut": [],
+        "source": "app",
+        "followupEvent": None
+    }
+
+
+def measure(name, f, number):
+    seconds = min(timeit.repeat(f, number=number, repeat=7)) / number
+
+    gc.collect()
+    tracemalloc.start()
+    for _ in range(100):
+        f()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print("%-32s %8.2f us/response %8.1f KiB peak allocation / 100 responses"
+          % (name, seconds * 1e6, peak / 1024.0))
+
+
+def main(number=50000):
+    data = {"google": {"richResponse": {"items": [{"simpleResponse": {"textToSpeech": "Hello"}}]}}}
+    for backend_name in ("json", "orjson"):
+        try:
+            encoder = ResponseEncoder("app", get_json_backend(backend_name))
+        except ValueError:
+            print("%s is not installed" % backend_name)
+            continue
+        measure("dict (%s)" % backend_name, lambda: encoder.encode(as_dict("Hello, World!", data)), number)
+        measure("WebhookResponse (%s)" % backend_name,
+                lambda: encoder.encode(WebhookResponse("Hello, World!", None, data, [], "app")), number)
+        res = as_dict("Hello, World!", data)
+        measure("encode dict (%s)" % backend_name, lambda: encoder.encode(res), number)
+        model = WebhookResponse("Hello, World!", None, data, [], "app")
+        measure("encode WebhookResponse (%s)" % backend_name, lambda: encoder.encode(model), number)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+# Copyright (C) 2017 Paoro
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Compares the request decoding of the webhook dispatcher with the previous
+`flask.request.get_json(force=True)` path, which decoded the body and re-encoded it for the debug log.
+
+    python benchmarks/payload_benchmark.py
+"""
+
+import timeit
+import tracemalloc
+
+import flask
+import flask.json
+
+from apiaiwebhook.benchmark import PayloadGenerator
+from apiaiwebhook.encoding import get_json_backend
+from apiaiwebhook.payload import WebhookPayload
+
+
+def previous_path(app, body):
+    with app.test_request_context(method="POST", data=body, content_type="application/json"):
+        req = flask.request.get_json(force=True)
+        flask.json.dumps(req)
+        result = req["result"]
+        return result.get("action", ""), result.get("parameters", {})
+
+
+def lazy_path(app, body, loads):
+    with app.test_request_context(method="POST", data=body, content_type="application/json"):
+        payload = WebhookPayload(flask.request.get_data(), loads)
+        return payload.action, payload.parameters
+
+
+def measure(name, f, number):
+    seconds = min(timeit.repeat(f, number=number, repeat=3)) / number
+
+    tracemalloc.start()
+    f()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print("%-24s %8.1f us/request %8.1f KiB peak allocation" % (name, seconds * 1e6, peak / 1024.0))
+
+
+def main(number=500):
+    app = flask.Flask(__name__)
+    body = PayloadGenerator({"weather.get": 1}, parameter_count=30, context_count=10, size=20000).generate(1)[0]
+    print("request body: %.1f KiB" % (len(body) / 1024.0))
+
+    measure("get_json + dumps", lambda: previous_path(app, body), number)
+    measure("lazy (json)", lambda: lazy_path(app, body, get_json_backend("json").loads), number)
+    try:
+        loads = get_json_backend("orjson").loads
+    except ValueError:
+        print("orjson is not installed")
+    else:
+        measure("lazy (orjson)", lambda: lazy_path(app, body, loads), number)
+
+
+if __name__ == '__main__':
+    main()
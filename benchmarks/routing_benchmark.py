@@ -0,0 +1,70 @@
+# Copyright (C) 2017 Paoro
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+Measures the action routing with 1k and 10k registered actions and patterns.
+The lookup time does not depend on the number of registered functions.
+
+    python benchmarks/routing_benchmark.py
+"""
+
+import timeit
+
+from apiaiwebhook.engine import WebhookEngine
+from apiaiwebhook.payload import WebhookPayload
+
+
+def make_engine(count):
+    engine = WebhookEngine(__name__, api_key_value="secret")
+
+    def handler(**kwargs):
+        return None
+
+    for i in range(count):
+        engine.fulfillment("service%d.resource%d.get" % (i % 100, i))(handler)
+    for i in range(count // 10):
+        engine.fulfillment("service%d.*.cancel" % i)(handler)
+        engine.fulfillment("service%d.resource%d.**" % (i, i))(handler)
+    engine.fulfillment("**")(handler)
+    return engine
+
+
+def measure(name, f, number):
+    seconds = min(timeit.repeat(f, number=number, repeat=3)) / number
+    print("%-38s %8.3f us/lookup" % (name, seconds * 1e6))
+
+
+def main(number=20000):
+    for count in (1000, 10000):
+        engine = make_engine(count)
+        router = engine.router
+        print("%d actions, %d patterns" % (len(engine.fulfillment_functions) - len(router), len(router)))
+        cases = [
+            ("exact", "service7.resource7.get"),
+            ("wildcard", "service7.resource8.cancel"),
+            ("prefix", "service7.resource7.history.list"),
+            ("default", "unknown.action"),
+        ]
+        for name, action in cases:
+            payload = WebhookPayload(data={"result": {"action": action}})
+            measure("  resolve %s" % name, lambda: engine.resolve_fulfillment(payload), number)
+        for name, action in cases[1:]:
+            segments = action.split(".")
+            measure("  trie match %s (not memoized)" % name, lambda: router._match(router.root, segments, 0), number)
+
+
+if __name__ == '__main__':
+    main()
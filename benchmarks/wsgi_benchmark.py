@@ -0,0 +1,53 @@
+# Copyright (C) 2017 Paoro
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""
+Compares the per-request overhead of the Flask application with the raw WSGI application
+of the same webhook engine. Both are called in process, without a server, so the difference
+is the cost of the Flask request handling.
+
+    python benchmarks/wsgi_benchmark.py
+"""
+
+from apiaiwebhook import APIAIWebhook
+from apiaiwebhook.benchmark import PayloadGenerator, RawWSGIDriver, WSGIDriver, run_benchmark
+
+
+def main(requests=5000):
+    app = APIAIWebhook(__name__, api_key_value="secret", slim=True)
+
+    @app.fulfillment("hello-world")
+    def hello_world(name=None):
+        return app.make_response_apiai(speech="Hello, %s!" % name)
+
+    bodies = PayloadGenerator({"hello-world": 1}, parameters={"hello-world": {"name": "World"}},
+                              parameter_count=5, context_count=1).generate(requests)
+    results = []
+    for driver_class in (WSGIDriver, RawWSGIDriver):
+        driver = driver_class(app, {"api-key": "secret"})
+        try:
+            result = run_benchmark(driver, bodies)
+        finally:
+            driver.close()
+        print(result)
+        results.append(result)
+
+    flask_result, raw_result = results
+    print("overhead of Flask: %.1f us/request" % ((flask_result.p50 - raw_result.p50) * 1e6))
+
+
+if __name__ == '__main__':
+    main()
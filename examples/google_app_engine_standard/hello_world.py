@@ -15,7 +15,7 @@
 
 from apiaiwebhook import APIAIWebhook
 
-app = APIAIWebhook(__name__)
+app = APIAIWebhook(__name__, slim=True)
 
 
 @app.fulfillment("hello-world")
@@ -0,0 +1,172 @@
+# Copyright (C) 2017 Paoro
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import json
+import unittest
+
+from apiaiwebhook.agents import AgentHost
+from apiaiwebhook.cache import ResponseCache
+from apiaiwebhook.ratelimit import AdmissionControl, RateLimit
+from tests.wsgi_test import call_wsgi, webhook_body
+
+
+class AgentHostTest(unittest.TestCase):
+    def setUp(self):
+        self.host = AgentHost(__name__, metrics_url="/metrics/")
+        self.wsgi_app = self.host.make_wsgi_app()
+        self.support = self.host.agent("support", api_key_value="support-secret")
+        self.sales = self.host.agent("sales", api_key_value=["sales-secret", "sales-old"])
+
+        @self.support.fulfillment("hello-world")
+        def my_fulfillment_support():
+            return self.support.make_response_apiai(speech="support")
+
+        @self.sales.fulfillment("hello-world")
+        def my_fulfillment_sales():
+            return self.sales.make_response_apiai(speech="sales")
+
+    def call(self, path="/webhook/", key=None, action="hello-world", method="POST"):
+        headers = {"api-key": key} if key is not None else {}
+        status, body = call_wsgi(self.wsgi_app, method, path, headers, webhook_body(action))
+        return status, json.loads(body) if status == 200 else body
+
+    def test_url(self):
+        status, res = self.call("/agents/support/", "support-secret")
+        assert status == 200
+        assert res["speech"] == "support"
+        assert res["source"] == "support"
+        status, res = self.call("/agents/sales", "sales-old")
+        assert status == 200
+        assert res["speech"] == "sales"
+        assert self.call("/agents/sales/", "support-secret")[0] == 401
+        assert self.call("/agents/sales/")[0] == 400
+        assert self.call("/agents/unknown/", "support-secret")[0] == 404
+        assert self.call("/agents/sales/", "sales-secret", method="GET")[0] == 405
+
+    def test_key(self):
+        assert self.call(key="support-secret")[1]["speech"] == "support"
+        assert self.call(key="sales-secret")[1]["speech"] == "sales"
+        assert self.call(key="sales-old")[1]["speech"] == "sales"
+        assert self.call(key="invalid")[0] == 401
+        assert self.call()[0] == 400
+        assert self.call(key="support-secret", action="unknown")[0] == 404
+
+    def test_runtime(self):
+        self.call(key="sales-secret")
+        assert sorted(self.wsgi_app.apps) == ["sales"]
+        assert self.host.remove_agent("sales") is self.sales
+        assert self.wsgi_app.apps == {}
+        assert self.call(key="sales-secret")[0] == 401
+        assert self.call("/agents/sales/", "sales-secret")[0] == 404
+        assert self.call(key="support-secret")[0] == 200
+
+        billing = self.host.agent("billing", api_key_value="billing-secret", webhook_url="/billing/")
+
+        @billing.fulfillment("hello-world")
+        def my_fulfillment_billing():
+            return billing.make_response_apiai(speech="billing")
+
+        assert self.call("/billing/", "billing-secret")[1]["speech"] == "billing"
+        assert self.call(key="billing-secret")[1]["speech"] == "billing"
+
+        self.host.rotate_keys("billing", ["billing-new"])
+        assert self.call(key="billing-secret")[0] == 401
+        assert self.call(key="billing-new")[1]["speech"] == "billing"
+
+    def test_conflict(self):
+        with self.assertRaises(ValueError):
+            self.host.agent("other", api_key_value="support-secret")
+        with self.assertRaises(ValueError):
+            self.host.agent("other", webhook_url="/agents/support/")
+        with self.assertRaises(ValueError):
+            self.host.rotate_keys("sales", ["support-secret"])
+        with self.assertRaises(ValueError):
+            self.host.agent("a/b")
+        assert sorted(self.host.agents) == ["sales", "support"]
+        assert self.call(key="sales-secret")[0] == 200
+
+    def test_shared(self):
+        assert self.support.metrics is self.host.metrics
+        assert self.support.executors is self.sales.executors
+        assert self.support.resources is self.sales.resources
+        assert self.support.json_backend is self.host.json_backend
+        with self.assertRaises(TypeError):
+            self.host.fulfillment("hello-world")
+
+        @self.support.fulfillment("count")
+        def my_fulfillment_count(counter):
+            counter.append(1)
+            return self.support.make_response_apiai(speech="%d" % len(counter))
+
+        # the resource is registered after the function, it is injected by the host
+        @self.host.resource("counter")
+        def counter():
+            return []
+
+        assert self.call(key="support-secret", action="count")[1]["speech"] == "1"
+        assert self.call(key="support-secret", action="count")[1]["speech"] == "2"
+
+    def test_cache(self):
+        cache = ResponseCache()
+        for agent in (self.support, self.sales):
+            @agent.fulfillment("faq", cache=cache)
+            def my_fulfillment_faq(agent=agent):
+                return agent.make_response_apiai(speech=agent.name)
+
+        assert self.call(key="support-secret", action="faq")[1]["speech"] == "support"
+        assert self.call(key="sales-secret", action="faq")[1]["speech"] == "sales"
+        assert self.call(key="sales-secret", action="faq")[1]["speech"] == "sales"
+        assert cache.hits == 1
+
+    def test_session(self):
+        for agent in (self.support, self.sales):
+            @agent.fulfillment("remember")
+            def my_fulfillment_remember(session, agent=agent):
+                previous = session.get("agent")
+                session["agent"] = agent.name
+                return agent.make_response_apiai(speech="%s" % previous)
+
+        body = json.dumps({"sessionId": "s1", "result": {"action": "remember"}}).encode("utf-8")
+        for key, speech in (("support-secret", "None"), ("sales-secret", "None"), ("support-secret", "support")):
+            status, res = call_wsgi(self.wsgi_app, "POST", "/webhook/", {"api-key": key}, body)
+            assert status == 200 and json.loads(res)["speech"] == speech
+
+    def test_rate_limit(self):
+        host = AgentHost(__name__, admission=AdmissionControl(action_limit=RateLimit(0.01, burst=1),
+                                                              session_limit=RateLimit(0.01, burst=1)))
+        wsgi_app = host.make_wsgi_app()
+        for name in ("support", "sales"):
+            agent = host.agent(name, api_key_value=name + "-secret")
+
+            @agent.fulfillment("hello-world")
+            def my_fulfillment_hello(agent=agent):
+                return agent.make_response_apiai(speech=agent.name)
+
+        body = json.dumps({"sessionId": "s1", "result": {"action": "hello-world"}}).encode("utf-8")
+        for key, status in (("support-secret", 200), ("sales-secret", 200), ("support-secret", 429)):
+            assert call_wsgi(wsgi_app, "POST", "/webhook/", {"api-key": key}, body)[0] == status
+
+    def test_metrics(self):
+        self.call(key="support-secret")
+        self.call("/agents/sales/", "invalid")
+        status, body = call_wsgi(self.wsgi_app, "GET", "/metrics/")
+        assert status == 200
+        assert 'apiaiwebhook_agent_requests_total{agent="support",status="200"} 1' in body
+        assert 'apiaiwebhook_agent_requests_total{agent="sales",status="401"} 1' in body
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -13,6 +13,8 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import subprocess
+import sys
 import unittest
 
 import flask.json as json
@@ -51,6 +53,11 @@ class APIAIWebhookTest(unittest.TestCase):
         r = self.test_client.webhook(action="unknown")
         assert r.status_code == 404
 
+    def test_invalid_parameters(self):
+        for parameters in (["first parameter"], "first parameter"):
+            r = self.test_client.webhook(action="one", parameters=parameters)
+            assert r.status_code == 400
+
     def test_none(self):
         r = self.test_client.webhook(action="none")
         assert r.status_code == 200
@@ -124,5 +131,34 @@ class APIAIWebhookSecuredTest(unittest.TestCase):
         assert r.status_code == 401
 
 
+class APIAIWebhookSlimTest(unittest.TestCase):
+    def test_slim(self):
+        app = APIAIWebhook(__name__, slim=True)
+        app.testing = True
+
+        @app.fulfillment("none")
+        def my_fullfillment_none():
+            return app.make_response_apiai(speech="Test with no parameter")
+
+        assert [rule.endpoint for rule in app.url_map.iter_rules()] == ["webhook"]
+        assert app.test_client_apiai().webhook(action="none").status_code == 200
+
+    @unittest.skipIf(sys.version_info < (3, 7), "lazy imports require Python 3.7")
+    def test_lazy_import(self):
+        code = "import sys, apiaiwebhook; assert 'flask' not in sys.modules; " \
+               "apiaiwebhook.APIAIWebhook; assert 'flask' in sys.modules"
+        subprocess.check_call([sys.executable, "-c", code])
+
+    @unittest.skipIf(sys.version_info < (3, 7), "lazy imports require Python 3.7")
+    def test_lazy_features(self):
+        code = "import sys; from apiaiwebhook import APIAIWebhook; app = APIAIWebhook('test'); " \
+               "app.fulfillment('hello-world')(lambda: app.make_response_apiai(speech='Hello')); " \
+               "assert app.test_client_apiai().webhook(action='hello-world').status_code == 200; " \
+               "modules = ['apiaiwebhook.metrics', 'apiaiwebhook.ratelimit', 'apiaiwebhook.session', " \
+               "'apiaiwebhook.executors', 'apiaiwebhook.coalesce', 'apiaiwebhook.cache', 'apiaiwebhook.batch', " \
+               "'logging.handlers']; loaded = [m for m in modules if m in sys.modules]; assert not loaded, loaded"
+        subprocess.check_call([sys.executable, "-c", code])
+
+
 if __name__ == '__main__':
     unittest.main(verbosity=2)
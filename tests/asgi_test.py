@@ -0,0 +1,297 @@
+# Copyright (C) 2017 Paoro
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+import time
+import unittest
+import zlib
+
+import flask.json as json
+
+from apiaiwebhook import APIAIWebhook, Compression
+from apiaiwebhook.agents import AgentHost
+from apiaiwebhook.profiling import Profiler
+from apiaiwebhook.compression import gzip_compress
+from apiaiwebhook.payload import WebhookPayload
+
+
+def call_asgi(asgi_app, method="POST", path="/webhook/", headers=None, body=b""):
+    """
+    Calls the ASGI application with a single HTTP request and collects the response.
+
+    :return: tuple of the status code and the response body
+    """
+    messages = [{"type": "http.request", "body": body, "more_body": False}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {
+        "type": "http",
+        "method": method,
+        "path": path,
+        "headers": [(k.encode("latin-1"), v.encode("latin-1")) for k, v in (headers or {}).items()],
+    }
+    asyncio.run(asgi_app(scope, receive, send))
+    return sent[0]["status"], sent[1]["body"].decode("utf-8")
+
+
+def webhook_body(action, parameters=None):
+    return json.dumps({"result": {"action": action, "parameters": parameters or {}}}).encode("utf-8")
+
+
+class ASGIWebhookTest(unittest.TestCase):
+    def setUp(self):
+        app = APIAIWebhook(__name__)
+        app.testing = True
+        self.app = app
+        self.asgi_app = app.make_asgi_app()
+
+        @app.fulfillment("sync")
+        def my_fulfillment_sync(one=None):
+            return app.make_response_apiai(speech="Test sync: %s" % one)
+
+        @app.fulfillment("async")
+        async def my_fulfillment_async(one=None):
+            await asyncio.sleep(0)
+            return app.make_response_apiai(speech="Test async: %s" % one)
+
+    def test_sync(self):
+        status, body = call_asgi(self.asgi_app, body=webhook_body("sync", {"one": "first"}))
+        assert status == 200
+        assert "Test sync: first" in body
+
+    def test_async(self):
+        status, body = call_asgi(self.asgi_app, body=webhook_body("async", {"one": "first"}))
+        assert status == 200
+        assert "Test async: first" in body
+
+    def test_async_flask(self):
+        r = self.app.test_client_apiai().webhook(action="async", parameters={"one": "first"})
+        assert r.status_code == 200
+        assert "Test async: first" in r.data.decode("utf-8")
+
+    def test_concurrent(self):
+        async def run_all():
+            sent = []
+
+            async def receive():
+                return {"type": "http.request", "body": webhook_body("async"), "more_body": False}
+
+            async def send(message):
+                sent.append(message)
+
+            scope = {"type": "http", "method": "POST", "path": "/webhook/", "headers": []}
+            await asyncio.gather(*[self.asgi_app(scope, receive, send) for _ in range(10)])
+            return sent
+
+        sent = asyncio.run(run_all())
+        assert [m["status"] for m in sent if m["type"] == "http.response.start"] == [200] * 10
+
+    def test_timeout(self):
+        @self.app.fulfillment("slow", timeout=0.01, fallback=self.app.make_response_apiai(speech="Fallback"))
+        async def my_fulfillment_slow():
+            await asyncio.sleep(1)
+
+        @self.app.fulfillment("slow-thread", executor="thread", timeout=0.01)
+        def my_fulfillment_slow_thread():
+            time.sleep(0.1)
+
+        status, body = call_asgi(self.asgi_app, body=webhook_body("slow"))
+        assert status == 200
+        assert "Fallback" in body
+        status, body = call_asgi(self.asgi_app, body=webhook_body("slow-thread"))
+        assert status == 504
+
+    def test_deadline(self):
+        self.app.deadline = 0.01
+
+        @self.app.fulfillment("slow-deadline", fallback=self.app.make_response_apiai(speech="Fallback"))
+        async def my_fulfillment_slow_deadline(deadline):
+            assert deadline.budget == 0.01
+            await asyncio.sleep(1)
+
+        status, body = call_asgi(self.asgi_app, body=webhook_body("slow-deadline"))
+        assert status == 200
+        assert "Fallback" in body
+
+    def test_coalesce(self):
+        calls = []
+
+        @self.app.fulfillment("hours", coalesce=True)
+        async def my_fulfillment_hours(location):
+            calls.append(location)
+            await asyncio.sleep(0.05)
+            return self.app.make_response_apiai(speech="%s: 9-17" % location)
+
+        async def run_all():
+            body = webhook_body("hours", {"location": "Budapest"})
+            return await asyncio.gather(*[self.asgi_app.fulfill(WebhookPayload(body, json.loads))
+                                          for _ in range(5)])
+
+        responses = asyncio.run(run_all())
+        assert calls == ["Budapest"]
+        assert len(set(responses)) == 1
+        assert self.app.single_flight.saved == 4
+
+    def test_unknown(self):
+        status, body = call_asgi(self.asgi_app, body=webhook_body("unknown"))
+        assert status == 404
+
+    def test_invalid_json(self):
+        status, body = call_asgi(self.asgi_app, body=b"{")
+        assert status == 400
+
+    def test_method(self):
+        status, body = call_asgi(self.asgi_app, method="GET")
+        assert status == 405
+
+    def test_path(self):
+        status, body = call_asgi(self.asgi_app, path="/other/", body=webhook_body("sync"))
+        assert status == 404
+
+
+class ASGIWebhookMetricsTest(unittest.TestCase):
+    def test_metrics(self):
+        app = APIAIWebhook(__name__, metrics_url="/metrics/")
+        asgi_app = app.make_asgi_app()
+
+        @app.fulfillment("none")
+        async def my_fulfillment_none():
+            return app.make_response_apiai(speech="Test with no parameter")
+
+        call_asgi(asgi_app, body=webhook_body("none"))
+        status, body = call_asgi(asgi_app, method="GET", path="/metrics/")
+        assert status == 200
+        assert 'apiaiwebhook_requests_total{action="none",status="200"} 1' in body
+
+
+class ASGIWebhookCompressionTest(unittest.TestCase):
+    def test_compression(self):
+        app = APIAIWebhook(__name__, compression=Compression(threshold=0, codings=("gzip",)), max_body_size=1000)
+        asgi_app = app.make_asgi_app()
+
+        @app.fulfillment("one")
+        async def my_fulfillment_one(one=None):
+            return app.make_response_apiai(speech="Test one: %s" % one)
+
+        headers = {"content-encoding": "gzip", "accept-encoding": "gzip"}
+        messages = []
+
+        async def receive():
+            return {"type": "http.request", "body": gzip_compress(webhook_body("one", {"one": "first"})),
+                    "more_body": False}
+
+        async def send(message):
+            messages.append(message)
+
+        scope = {"type": "http", "method": "POST", "path": "/webhook/",
+                 "headers": [(k.encode("latin-1"), v.encode("latin-1")) for k, v in headers.items()]}
+        asyncio.run(asgi_app(scope, receive, send))
+        assert messages[0]["status"] == 200
+        assert (b"content-encoding", b"gzip") in messages[0]["headers"]
+        assert b"Test one: first" in zlib.decompress(messages[1]["body"], 16 + zlib.MAX_WBITS)
+
+        status, body = call_asgi(asgi_app, body=webhook_body("one", {"one": "x" * 2000}))
+        assert status == 413
+
+
+class ASGIWebhookSecuredTest(unittest.TestCase):
+    def setUp(self):
+        app = APIAIWebhook(__name__, api_key_value="secret")
+        self.asgi_app = app.make_asgi_app()
+
+        @app.fulfillment("none")
+        async def my_fulfillment_none():
+            return app.make_response_apiai(speech="Test with no parameter")
+
+    def test_valid_api_key_value(self):
+        status, body = call_asgi(self.asgi_app, headers={"api-key": "secret"}, body=webhook_body("none"))
+        assert status == 200
+
+    def test_invalid_api_key_header(self):
+        status, body = call_asgi(self.asgi_app, body=webhook_body("none"))
+        assert status == 400
+
+    def test_invalid_api_key_value(self):
+        status, body = call_asgi(self.asgi_app, headers={"api-key": "terces"}, body=webhook_body("none"))
+        assert status == 401
+
+
+class ASGIAgentHostTest(unittest.TestCase):
+    def test_agents(self):
+        host = AgentHost(__name__)
+        asgi_app = host.make_asgi_app()
+        for name in ("support", "sales"):
+            agent = host.agent(name, api_key_value=name + "-secret")
+
+            @agent.fulfillment("hello-world")
+            async def my_fulfillment_hello(agent=agent):
+                return agent.make_response_apiai(speech=agent.name)
+
+        status, body = call_asgi(asgi_app, path="/agents/sales/", headers={"api-key": "sales-secret"},
+                                 body=webhook_body("hello-world"))
+        assert status == 200
+        assert json.loads(body)["speech"] == "sales"
+        status, body = call_asgi(asgi_app, headers={"api-key": "support-secret"}, body=webhook_body("hello-world"))
+        assert status == 200
+        assert json.loads(body)["speech"] == "support"
+
+        assert sorted(asgi_app.apps) == ["sales", "support"]
+        host.remove_agent("support")
+        assert sorted(asgi_app.apps) == ["sales"]
+        assert call_asgi(asgi_app, headers={"api-key": "support-secret"}, body=webhook_body("hello-world"))[0] == 401
+        assert call_asgi(asgi_app, path="/agents/support/", headers={"api-key": "support-secret"},
+                         body=webhook_body("hello-world"))[0] == 404
+
+
+class ASGIProfilerTest(unittest.TestCase):
+    def test_profile(self):
+        host = AgentHost(__name__, profiler=Profiler(debug_key="debug-secret"))
+        asgi_app = host.make_asgi_app()
+        agent = host.agent("support", api_key_value="secret")
+
+        @agent.fulfillment("hello-world")
+        async def my_fulfillment_profiled():
+            return agent.make_response_apiai(speech="Hello, World!")
+
+        assert call_asgi(asgi_app, headers={"api-key": "secret", "x-profile": "debug-secret"},
+                         body=webhook_body("hello-world"))[0] == 200
+        status, body = call_asgi(asgi_app, "GET", "/profile/", {"x-profile": "debug-secret"})
+        assert status == 200
+        assert "support:hello-world: 1 requests" in body
+        assert call_asgi(asgi_app, "GET", "/profile/", {"x-profile": "invalid"})[0] == 401
+
+    def test_profile_sync(self):
+        app = APIAIWebhook(__name__, api_key_value="secret", profiler=Profiler(debug_key="debug-secret"))
+        asgi_app = app.make_asgi_app()
+
+        @app.fulfillment("hello-world")
+        def my_fulfillment_profiled_sync():
+            return app.make_response_apiai(speech="Hello, World!")
+
+        assert call_asgi(asgi_app, headers={"api-key": "secret", "x-profile": "debug-secret"},
+                         body=webhook_body("hello-world"))[0] == 200
+        status, body = call_asgi(asgi_app, "GET", "/profile/", {"x-profile": "debug-secret"})
+        assert status == 200
+        assert "my_fulfillment_profiled_sync" in body
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,107 @@
+# Copyright (C) 2017 Paoro
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+import logging
+import unittest
+
+from apiaiwebhook import APIAIWebhook
+from apiaiwebhook.auth import APIKeyring, FailureLog
+
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        super(ListHandler, self).__init__()
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+class APIKeyringTest(unittest.TestCase):
+    def test_verify(self):
+        keyring = APIKeyring(["one", "two"])
+        assert keyring.verify("one")
+        assert keyring.verify("two")
+        assert not keyring.verify("three")
+        assert not keyring.verify("")
+
+    def test_rotate(self):
+        keyring = APIKeyring(["old"])
+        keyring.add("new")
+        assert len(keyring) == 2
+        keyring.remove("old")
+        assert not keyring.verify("old")
+        assert keyring.verify("new")
+        keyring.rotate(["newer"])
+        assert not keyring.verify("new")
+        assert keyring.verify("newer")
+
+    def test_empty(self):
+        assert not APIKeyring().verify("one")
+
+
+class FailureLogTest(unittest.TestCase):
+    def test_rate_limit(self):
+        logger = logging.getLogger("apiaiwebhook.auth_test")
+        handler = ListHandler()
+        logger.addHandler(handler)
+        try:
+            log = FailureLog(logger, interval=60)
+            for _ in range(100):
+                log.failure("invalid")
+            log.failure("missing")
+            assert handler.messages == ["api-key authentication failed: 1 invalid"]
+            assert log.counts == {"invalid": 99, "missing": 1}
+
+            log.interval = 0
+            log.failure("invalid")
+            assert handler.messages[-1] == "api-key authentication failed: 100 invalid, 1 missing"
+        finally:
+            logger.removeHandler(handler)
+
+
+class AuthWebhookTest(unittest.TestCase):
+    def setUp(self):
+        app = APIAIWebhook(__name__, api_key_value=["new", "old"], metrics_url="/metrics/")
+        app.testing = True
+        self.app = app
+        self.test_client = app.test_client()
+
+        @app.fulfillment("none")
+        def none():
+            return app.make_response_apiai(speech="Test")
+
+    def post(self, data, api_key):
+        return self.test_client.post(self.app.webhook_url, data=data, content_type="application/json",
+                                     headers={"api-key": api_key})
+
+    def test_keys(self):
+        data = json.dumps({"result": {"action": "none"}})
+        assert self.post(data, "new").status_code == 200
+        assert self.post(data, "old").status_code == 200
+        self.app.api_keys.remove("old")
+        assert self.post(data, "old").status_code == 401
+        assert self.app.test_client_apiai().webhook(action="none").status_code == 200
+
+    def test_reject_before_body(self):
+        r = self.post("not json", "invalid")
+        assert r.status_code == 401
+        text = self.app.test_client().get("/metrics/").data.decode("utf-8")
+        assert 'apiaiwebhook_auth_failures_total{reason="invalid"} 1' in text
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
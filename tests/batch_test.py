@@ -0,0 +1,153 @@
+# Copyright (C) 2017 Paoro
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import gzip
+import io
+import json
+import logging
+import threading
+import time
+import unittest
+
+from apiaiwebhook import APIAIWebhook
+from apiaiwebhook.batch import iter_ndjson, ordered_map
+
+
+def webhook_request(action, parameters=None):
+    return {"result": {"action": action, "parameters": parameters or {}}}
+
+
+class BatchHelpersTest(unittest.TestCase):
+    def test_iter_ndjson(self):
+        assert list(iter_ndjson(io.BytesIO(b'{"a": 1}\n\n{"b": 2}'))) == [b'{"a": 1}', b'{"b": 2}']
+
+    def test_ordered_map(self):
+        from concurrent.futures import ThreadPoolExecutor
+
+        def f(i):
+            time.sleep(0.001 * (5 - i % 5))
+            return i * 2
+
+        with ThreadPoolExecutor(4) as executor:
+            assert list(ordered_map(f, range(20), executor, 8)) == [i * 2 for i in range(20)]
+        assert list(ordered_map(f, range(5))) == [0, 2, 4, 6, 8]
+
+
+class BatchWebhookTest(unittest.TestCase):
+    def setUp(self):
+        app = APIAIWebhook(__name__, api_key_value="secret", batch_url="/webhook/batch/", batch_workers=4)
+        app.testing = True
+        self.app = app
+        self.test_client = app.test_client()
+        self.threads = set()
+
+        @app.fulfillment("echo")
+        def echo(text):
+            self.threads.add(threading.current_thread().name)
+            return app.make_response_apiai(speech=text)
+
+    def post(self, data, content_type="application/json", api_key="secret"):
+        return self.test_client.post("/webhook/batch/", data=data, content_type=content_type,
+                                     headers={"api-key": api_key})
+
+    def read(self, r):
+        return [json.loads(line) for line in r.data.decode("utf-8").splitlines()]
+
+    def test_array(self):
+        reqs = [webhook_request("echo", {"text": "text %d" % i}) for i in range(10)]
+        reqs.append(webhook_request("unknown"))
+        reqs.append(webhook_request("echo"))
+        r = self.post(json.dumps(reqs))
+        assert r.status_code == 200
+        assert r.mimetype == "application/x-ndjson"
+        items = self.read(r)
+        assert [item["index"] for item in items] == list(range(12))
+        assert [item["response"]["speech"] for item in items[:10]] == ["text %d" % i for i in range(10)]
+        assert items[10]["status"] == 404
+        assert items[11]["status"] == 400
+        assert "text" in items[11]["error"]
+
+    def test_ndjson(self):
+        data = "\n".join(json.dumps(webhook_request("echo", {"text": "text %d" % i})) for i in range(5))
+        r = self.post(data + "\n{", content_type="application/x-ndjson")
+        items = self.read(r)
+        assert [item["status"] for item in items] == [200] * 5 + [400]
+        assert items[4]["response"]["speech"] == "text 4"
+
+    def test_array_invalid_items(self):
+        r = self.post(json.dumps([webhook_request("echo", {"text": "text"}), None, 5, [], "text"]))
+        assert r.status_code == 200
+        items = self.read(r)
+        assert [item["status"] for item in items] == [200, 400, 400, 400, 400]
+        assert items[1]["error"] == "request is not a JSON object"
+
+    def test_invalid(self):
+        assert self.post("{").status_code == 400
+        assert self.post("{}").status_code == 400
+
+    def test_auth(self):
+        assert self.post("[]", api_key="terces").status_code == 401
+
+    def test_body(self):
+        data = json.dumps([webhook_request("echo", {"text": "text"})]).encode("utf-8")
+        buf = io.BytesIO()
+        with gzip.GzipFile(fileobj=buf, mode="wb") as f:
+            f.write(data)
+        r = self.test_client.post("/webhook/batch/", data=buf.getvalue(), content_type="application/json",
+                                  headers={"api-key": "secret", "Content-Encoding": "gzip"})
+        assert self.read(r)[0]["response"]["speech"] == "text"
+
+        r = self.test_client.post("/webhook/batch/", data=data, content_type="application/json",
+                                  headers={"api-key": "secret", "Content-Encoding": "compress"})
+        assert r.status_code == 415
+
+        self.app.max_body_size = len(data) - 1
+        assert self.post(data).status_code == 413
+
+    def test_log_payload(self):
+        app = APIAIWebhook(__name__, batch_url="/webhook/batch/", log_redact=["password"])
+        app.debug = True
+        records = []
+        handler = logging.Handler(logging.DEBUG)
+        handler.emit = records.append
+        app.logger.addHandler(handler)
+
+        @app.fulfillment("login")
+        def login(password):
+            return app.make_response_apiai(speech="Welcome!")
+
+        data = json.dumps([webhook_request("login", {"password": "secret"})])
+        app.test_client().post("/webhook/batch/", data=data)
+        data = json.dumps(webhook_request("login", {"password": "secret"}))
+        app.test_client().post("/webhook/batch/", data=data, content_type="application/x-ndjson")
+        messages = [record.getMessage() for record in records]
+        assert len(messages) == 4
+        assert [message.split(":")[0] for message in messages] == ["request", "response"] * 2
+        assert "secret" not in messages[0] + messages[2]
+        assert "password" in messages[0] + messages[2]
+
+    def test_sequential(self):
+        app = APIAIWebhook(__name__, batch_url="/webhook/batch/")
+
+        @app.fulfillment("echo")
+        def echo(text):
+            return app.make_response_apiai(speech=text)
+
+        r = app.test_client().post("/webhook/batch/", data=json.dumps([webhook_request("echo", {"text": "one"})]))
+        assert self.read(r)[0]["response"]["speech"] == "one"
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
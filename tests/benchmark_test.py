@@ -0,0 +1,90 @@
+# Copyright (C) 2017 Paoro
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+import unittest
+
+from apiaiwebhook import APIAIWebhook
+from apiaiwebhook.benchmark import (PayloadGenerator, RawWSGIDriver, SocketDriver, TestClientDriver, WSGIDriver,
+                                    compare_results, percentile, run_benchmark)
+
+
+class PayloadGeneratorTest(unittest.TestCase):
+    def test_generate(self):
+        generator = PayloadGenerator({"one": 1, "two": 3}, parameters={"one": {"name": "value"}},
+                                     parameter_count=5, size=2000)
+        bodies = generator.generate(200)
+        actions = [json.loads(body.decode("utf-8"))["result"]["action"] for body in bodies]
+        assert 20 < actions.count("one") < 80
+        assert actions.count("one") + actions.count("two") == 200
+
+        req = json.loads(bodies[actions.index("one")].decode("utf-8"))
+        assert len(req["result"]["parameters"]) == 6
+        assert req["result"]["parameters"]["name"] == "value"
+        assert 1990 <= len(bodies[0]) <= 2010
+
+
+class BenchmarkTest(unittest.TestCase):
+    def setUp(self):
+        app = APIAIWebhook(__name__, api_key_value="secret")
+        self.app = app
+        self.bodies = PayloadGenerator({"hello-world": 1}).generate(20)
+
+        @app.fulfillment("hello-world")
+        def hello_world():
+            return app.make_response_apiai(speech="Hello, World!")
+
+    def run_driver(self, driver_class):
+        driver = driver_class(self.app, {"api-key": "secret"})
+        try:
+            result = run_benchmark(driver, self.bodies, warmup=5, allocations=5)
+        finally:
+            driver.close()
+        assert result.requests == 20
+        assert result.statuses == {200: 20}
+        assert result.p50 <= result.p95 <= result.p99
+        return result
+
+    def test_test_client(self):
+        self.run_driver(TestClientDriver)
+
+    def test_wsgi(self):
+        self.run_driver(WSGIDriver)
+
+    def test_raw_wsgi(self):
+        self.run_driver(RawWSGIDriver)
+
+    def test_socket(self):
+        self.run_driver(SocketDriver)
+
+    def test_compare(self):
+        result = self.run_driver(WSGIDriver)
+        baseline = result.to_dict()
+        assert compare_results([result], [baseline]) == []
+        baseline.update(throughput=result.throughput * 2, p99=result.p99 / 2)
+        assert len(compare_results([result], [baseline])) == 2
+
+
+class PercentileTest(unittest.TestCase):
+    def test_percentile(self):
+        values = list(range(1, 101))
+        assert percentile(values, 50) == 50
+        assert percentile(values, 99) == 99
+        assert percentile(values, 100) == 100
+        assert percentile([], 50) is None
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
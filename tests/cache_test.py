@@ -0,0 +1,151 @@
+# Copyright (C) 2017 Paoro
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+import time
+import unittest
+
+from apiaiwebhook import APIAIWebhook
+from apiaiwebhook.cache import LRUCache, ResponseCache, SQLiteCache, cache_key
+
+
+class CacheKeyTest(unittest.TestCase):
+    def test_canonical(self):
+        assert cache_key("faq", {"a": 1, "b": "two"}) == cache_key("faq", {"b": "two", "a": 1})
+        assert cache_key("faq", {"a": 1}) != cache_key("other", {"a": 1})
+        assert cache_key("faq", {"a": 1}) != cache_key("faq", {"a": "1"})
+
+
+class LRUCacheTest(unittest.TestCase):
+    def test_lru(self):
+        cache = LRUCache(max_entries=2)
+        cache.set("a", b"1")
+        cache.set("b", b"2")
+        assert cache.get("a") == b"1"
+        cache.set("c", b"3")
+        assert cache.get("b") is None
+        assert cache.get("a") == b"1"
+        assert cache.get("c") == b"3"
+        assert cache.stats()["evictions"] == 1
+
+    def test_max_bytes(self):
+        cache = LRUCache(max_bytes=10)
+        cache.set("a", b"1234")
+        cache.set("b", b"1234")
+        assert len(cache) == 2
+        cache.set("c", b"1234")
+        assert len(cache) == 2
+        assert cache.size == 10
+        assert cache.get("a") is None
+        cache.set("d", b"12345678901")
+        assert cache.get("d") is None
+
+    def test_ttl(self):
+        cache = LRUCache()
+        cache.set("a", b"1", ttl=0.01)
+        cache.set("b", b"2")
+        time.sleep(0.02)
+        assert cache.get("a") is None
+        assert cache.get("b") == b"2"
+        assert cache.stats()["expirations"] == 1
+
+    def test_replace(self):
+        cache = LRUCache()
+        cache.set("a", b"1")
+        cache.set("a", b"22")
+        assert cache.get("a") == b"22"
+        assert cache.size == 3
+        cache.delete("a")
+        assert cache.size == 0
+
+
+class SQLiteCacheTest(unittest.TestCase):
+    def test_sqlite(self):
+        cache = SQLiteCache(":memory:")
+        cache.set("a", b"1")
+        cache.set_many({"b": b"2", "c": b"3"}, ttl=0.01)
+        assert cache.get("a") == b"1"
+        assert cache.get("b") == b"2"
+        time.sleep(0.02)
+        assert cache.get("c") is None
+        cache.delete("a")
+        assert cache.get("a") is None
+        cache.close()
+
+
+class ResponseCacheWebhookTest(unittest.TestCase):
+    def setUp(self):
+        app = APIAIWebhook(__name__)
+        app.testing = True
+        self.test_client = app.test_client_apiai()
+        self.cache = ResponseCache(ttl=60)
+        self.calls = 0
+
+        @app.fulfillment("faq", cache=self.cache)
+        def faq(question):
+            self.calls += 1
+            return app.make_response_apiai(speech="Answer: %s" % question)
+
+    def test_cache(self):
+        r = self.test_client.webhook(action="faq", parameters={"question": "hours", "unused": "1"})
+        assert r.status_code == 200
+        r = self.test_client.webhook(action="faq", parameters={"question": "hours", "unused": "2"})
+        assert r.status_code == 200
+        assert "Answer: hours" in r.data.decode("utf-8")
+        r = self.test_client.webhook(action="faq", parameters={"question": "address"})
+        assert "Answer: address" in r.data.decode("utf-8")
+        assert self.calls == 2
+        assert self.cache.stats()["hits"] == 1
+        assert self.cache.stats()["misses"] == 2
+        assert self.cache.stats()["entries"] == 2
+
+    def test_cache_injected(self):
+        app = APIAIWebhook(__name__, deadline=5.0)
+        cache = ResponseCache(ttl=60)
+
+        @app.fulfillment("faq", cache=cache)
+        def faq(question, deadline):
+            return app.make_response_apiai(speech="Answer: %s" % question)
+
+        test_client = app.test_client_apiai()
+        test_client.webhook(action="faq", parameters={"question": "hours"})
+        test_client.webhook(action="faq", parameters={"question": "hours"})
+        assert cache.stats()["hits"] == 1
+
+    def test_cache_session(self):
+        app = APIAIWebhook(__name__)
+        with self.assertRaises(ValueError):
+            @app.fulfillment("greet", cache=ResponseCache(ttl=60))
+            def greet_cached(session):
+                return app.make_response_apiai(speech="hello")
+        with self.assertRaises(ValueError):
+            @app.fulfillment("greet", coalesce=True)
+            def greet_coalesced(request):
+                return app.make_response_apiai(speech="hello")
+        assert "greet" not in app.fulfillment_functions
+
+        @app.fulfillment("greet")
+        def greet(name, session):
+            session["visits"] = session.get("visits", 0) + 1
+            return app.make_response_apiai(speech="hello %s visit %d" % (name, session["visits"]))
+
+        test_client = app.test_client_apiai()
+        for session_id, name, visit in (("alice", "alice", 1), ("bob", "bob", 1), ("alice", "alice", 2)):
+            r = test_client.webhook(action="greet", parameters={"name": name}, session_id=session_id)
+            assert json.loads(r.data.decode("utf-8"))["speech"] == "hello %s visit %d" % (name, visit)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
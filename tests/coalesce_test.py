@@ -0,0 +1,117 @@
+# Copyright (C) 2017 Paoro
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+import threading
+import time
+import unittest
+
+from apiaiwebhook import APIAIWebhook
+from apiaiwebhook import coalesce
+from apiaiwebhook.coalesce import SingleFlight
+
+
+def wait_for(condition):
+    for _ in range(500):
+        if condition():
+            return
+        time.sleep(0.01)
+
+
+class SingleFlightTest(unittest.TestCase):
+    def test_do(self):
+        single_flight = SingleFlight()
+        release = threading.Event()
+        calls = []
+        results = []
+
+        def f():
+            calls.append(1)
+            release.wait(5)
+            return "result"
+
+        threads = [threading.Thread(target=lambda: results.append(single_flight.do("key", f))) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        wait_for(lambda: single_flight.saved == 4)
+        release.set()
+        for thread in threads:
+            thread.join()
+        assert calls == [1]
+        assert results == ["result"] * 5
+        assert len(single_flight) == 0
+
+    def test_exception(self):
+        single_flight = SingleFlight()
+
+        def f():
+            raise ValueError("failed")
+
+        with self.assertRaises(ValueError):
+            single_flight.do("key", f)
+        assert len(single_flight) == 0
+        assert single_flight.do("key", lambda: "result") == "result"
+
+    def test_without_futures(self):
+        # Python 2 without the futures package
+        future_class, coalesce.Future = coalesce.Future, None
+        try:
+            self.test_do()
+            self.test_exception()
+        finally:
+            coalesce.Future = future_class
+
+
+class CoalesceWebhookTest(unittest.TestCase):
+    def setUp(self):
+        app = APIAIWebhook(__name__, metrics_url="/metrics/")
+        app.testing = True
+        self.app = app
+        self.release = threading.Event()
+        self.calls = 0
+
+        @app.fulfillment("hours", coalesce=True)
+        def hours(location):
+            self.calls += 1
+            self.release.wait(5)
+            return app.make_response_apiai(speech="%s: 9-17" % location)
+
+    def tearDown(self):
+        self.release.set()
+
+    def test_coalesce(self):
+        results = []
+
+        def request(location):
+            r = self.app.test_client_apiai().webhook(action="hours", parameters={"location": location})
+            results.append(json.loads(r.data.decode("utf-8"))["speech"])
+
+        threads = [threading.Thread(target=request, args=("Budapest",)) for _ in range(4)]
+        threads.append(threading.Thread(target=request, args=("Vienna",)))
+        for thread in threads:
+            thread.start()
+        wait_for(lambda: self.app.single_flight.saved == 3 and self.calls == 2)
+        self.release.set()
+        for thread in threads:
+            thread.join()
+
+        assert self.calls == 2
+        assert sorted(results) == ["Budapest: 9-17"] * 4 + ["Vienna: 9-17"]
+        text = self.app.test_client().get("/metrics/").data.decode("utf-8")
+        assert 'apiaiwebhook_coalesced_total{action="hours"} 3' in text
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
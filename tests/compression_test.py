@@ -0,0 +1,152 @@
+# Copyright (C) 2017 Paoro
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import io
+import json
+import unittest
+import zlib
+
+from apiaiwebhook import APIAIWebhook, Compression
+from apiaiwebhook.compression import brotli, gzip_compress, parse_accept_encoding, read_body
+from apiaiwebhook.exceptions import WebhookError
+from tests.wsgi_test import call_wsgi, webhook_body
+
+
+def gunzip(data):
+    return zlib.decompress(data, 16 + zlib.MAX_WBITS)
+
+
+class CompressionTest(unittest.TestCase):
+    def test_parse_accept_encoding(self):
+        assert parse_accept_encoding("gzip, deflate;q=0.5, br;q=x") == {"gzip": 1.0, "deflate": 0.5, "br": 0.0}
+
+    def test_negotiate(self):
+        compression = Compression(codings=("gzip",))
+        assert compression.negotiate(None) is None
+        assert compression.negotiate("gzip, deflate") == "gzip"
+        assert compression.negotiate("deflate") is None
+        assert compression.negotiate("*;q=0.1") == "gzip"
+        assert compression.negotiate("gzip;q=0, *") is None
+
+    def test_compress(self):
+        compression = Compression(threshold=100, codings=("gzip",))
+        body = b'{"speech": "Hello, World!"}'
+        assert compression.compress(body, "gzip") == (body, None)
+        body *= 10
+        compressed, coding = compression.compress(body, "gzip")
+        assert coding == "gzip"
+        assert gunzip(compressed) == body
+        assert compression.compress(body, "identity") == (body, None)
+
+    @unittest.skipIf(brotli is None, "brotli is not installed")
+    def test_brotli(self):
+        compression = Compression(threshold=0)
+        compressed, coding = compression.compress(b"Hello, World!" * 10, "gzip, br")
+        assert coding == "br"
+        assert brotli.decompress(compressed) == b"Hello, World!" * 10
+
+    def test_unsupported(self):
+        with self.assertRaises(ValueError):
+            Compression(codings=("deflate",))
+
+
+class ReadBodyTest(unittest.TestCase):
+    def read(self, body, **kwargs):
+        return read_body(io.BytesIO(body).read, len(body), **kwargs)
+
+    def test_identity(self):
+        assert self.read(b"{}") == b"{}"
+        assert read_body(io.BytesIO(b"{}").read) == b"{}"
+        with self.assertRaises(WebhookError) as e:
+            self.read(b"{}" * 10, max_body_size=10)
+        assert e.exception.status == 413
+
+    def test_gzip(self):
+        body = b'{"result": {}}' * 1000
+        assert self.read(gzip_compress(body), content_encoding="gzip") == body
+        assert self.read(gzip_compress(body, 1), content_encoding="GZIP", max_body_size=len(body)) == body
+
+    def test_limit(self):
+        # a small body which decompresses to 100 MB is rejected after the first chunks
+        bomb = gzip_compress(b"\0" * (100 * 1024 * 1024), 9)
+        with self.assertRaises(WebhookError) as e:
+            self.read(bomb, content_encoding="gzip", max_body_size=1024 * 1024)
+        assert e.exception.status == 413
+
+    def test_invalid(self):
+        with self.assertRaises(WebhookError) as e:
+            self.read(b"{}", content_encoding="gzip")
+        assert e.exception.status == 400
+        with self.assertRaises(WebhookError) as e:
+            self.read(gzip_compress(b"{}" * 1000)[:-10], content_encoding="gzip")
+        assert e.exception.status == 400
+        with self.assertRaises(WebhookError) as e:
+            self.read(gzip_compress(b"{}" * 1000)[:-4], content_encoding="gzip")
+        assert e.exception.status == 400
+        with self.assertRaises(WebhookError) as e:
+            self.read(b"{}", content_encoding="compress")
+        assert e.exception.status == 415
+
+
+class CompressionWebhookTest(unittest.TestCase):
+    def setUp(self):
+        app = APIAIWebhook(__name__, compression=Compression(threshold=200, codings=("gzip",)),
+                           max_body_size=10000, metrics_url="/metrics/")
+        app.testing = True
+        self.app = app
+
+        @app.fulfillment("carousel")
+        def my_fulfillment_carousel(items=0):
+            return app.make_response_apiai(speech="Carousel", data={"items": ["item %d" % i for i in range(items)]})
+
+    def post(self, body, headers):
+        return self.app.test_client().post(self.app.webhook_url, data=body, content_type="application/json",
+                                           headers=headers)
+
+    def test_flask(self):
+        r = self.post(gzip_compress(webhook_body("carousel", {"items": 100})),
+                      {"Content-Encoding": "gzip", "Accept-Encoding": "gzip"})
+        assert r.status_code == 200
+        assert r.headers["Content-Encoding"] == "gzip"
+        assert r.headers["Vary"] == "Accept-Encoding"
+        assert len(json.loads(gunzip(r.data).decode("utf-8"))["data"]["items"]) == 100
+
+        r = self.post(webhook_body("carousel"), {"Accept-Encoding": "gzip"})
+        assert "Content-Encoding" not in r.headers
+        assert json.loads(r.data.decode("utf-8"))["speech"] == "Carousel"
+
+        metrics = self.app.metrics.render_prometheus()
+        assert 'apiaiwebhook_response_bytes_total{encoding="gzip"}' in metrics
+        assert 'apiaiwebhook_response_bytes_total{encoding="identity"}' in metrics
+
+    def test_flask_limit(self):
+        body = webhook_body("carousel", {"padding": "x" * 20000})
+        assert self.post(body, {}).status_code == 413
+        assert self.post(gzip_compress(body), {"Content-Encoding": "gzip"}).status_code == 413
+        assert self.post(body, {"Content-Encoding": "br"}).status_code == 415
+
+    def test_wsgi(self):
+        wsgi_app = self.app.make_wsgi_app()
+        status, body = call_wsgi(wsgi_app, headers={"Content-Encoding": "gzip"},
+                                 body=gzip_compress(webhook_body("carousel", {"items": 2})))
+        assert status == 200
+        assert json.loads(body)["data"]["items"] == ["item 0", "item 1"]
+        status, body = call_wsgi(wsgi_app, body=webhook_body("carousel", {"padding": "x" * 20000}))
+        assert status == 413
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,112 @@
+# Copyright (C) 2017 Paoro
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+import threading
+import time
+import unittest
+
+from apiaiwebhook import APIAIWebhook
+from apiaiwebhook.context import Deadline
+
+
+class DeadlineTest(unittest.TestCase):
+    def test_no_budget(self):
+        deadline = Deadline()
+        assert deadline.remaining() == float("inf")
+        assert not deadline.expired()
+        assert deadline.timeout(2.0) == 2.0
+        assert deadline.timeout() is None
+
+    def test_budget(self):
+        deadline = Deadline(1.0)
+        assert 0 < deadline.remaining() <= 1.0
+        assert deadline.timeout(2.0) <= 1.0
+        assert deadline.timeout(0.5) == 0.5
+
+    def test_expired(self):
+        deadline = Deadline(0.5, started=Deadline().started - 1.0)
+        assert deadline.expired()
+        assert deadline.remaining() < 0
+        assert deadline.timeout(2.0) == 0.0
+
+
+class DeadlineWebhookTest(unittest.TestCase):
+    def setUp(self):
+        app = APIAIWebhook(__name__, deadline=0.1, metrics_url="/metrics/")
+        app.testing = True
+        self.app = app
+        self.test_client = app.test_client_apiai()
+        self.release = threading.Event()
+        self.fallback = app.make_response_apiai(speech="Sorry, try again later.")
+
+        @app.fulfillment("remaining")
+        def remaining(deadline):
+            return app.make_response_apiai(speech="%.1f" % deadline.budget)
+
+        @app.fulfillment("kwargs")
+        def kwargs(deadline, **parameters):
+            return app.make_response_apiai(speech=" ".join(sorted(parameters)))
+
+        @app.fulfillment("slow", executor="thread", fallback=self.fallback)
+        def slow():
+            self.release.wait(5)
+            return app.make_response_apiai(speech="Done")
+
+        @app.fulfillment("slow-inline")
+        def slow_inline():
+            time.sleep(0.15)
+            return app.make_response_apiai(speech="Done")
+
+    def tearDown(self):
+        self.release.set()
+        self.app.executors.shutdown()
+
+    def speech(self, r):
+        return json.loads(r.data.decode("utf-8"))["speech"]
+
+    def metrics(self):
+        return self.app.test_client().get("/metrics/").data.decode("utf-8")
+
+    def test_injected(self):
+        r = self.test_client.webhook(action="remaining", parameters={"deadline": "ignored"})
+        assert r.status_code == 200
+        assert self.speech(r) == "0.1"
+
+    def test_injected_kwargs(self):
+        r = self.test_client.webhook(action="kwargs", parameters={"deadline": "ignored", "city": "Budapest"})
+        assert self.speech(r) == "city"
+
+    def test_fallback(self):
+        r = self.test_client.webhook(action="slow")
+        assert r.status_code == 200
+        assert self.speech(r) == "Sorry, try again later."
+        assert 'apiaiwebhook_fallbacks_total{action="slow",reason="deadline"} 1' in self.metrics()
+
+        self.release.set()
+        for _ in range(100):
+            if "apiaiwebhook_late_completions_total" in self.metrics():
+                break
+            time.sleep(0.01)
+        assert 'apiaiwebhook_late_completions_total{action="slow"} 1' in self.metrics()
+
+    def test_late_inline(self):
+        r = self.test_client.webhook(action="slow-inline")
+        assert self.speech(r) == "Done"
+        assert 'apiaiwebhook_late_completions_total{action="slow-inline"} 1' in self.metrics()
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
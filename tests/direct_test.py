@@ -0,0 +1,95 @@
+# Copyright (C) 2017 Paoro
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import itertools
+import threading
+import unittest
+
+from apiaiwebhook import APIAIWebhook
+from apiaiwebhook.direct import DirectClient, ParityError
+from apiaiwebhook.engine import WebhookEngine
+
+
+class DirectClientTest(unittest.TestCase):
+    def setUp(self):
+        app = APIAIWebhook(__name__, api_key_value=["secret", "old"])
+        app.testing = True
+        self.app = app
+        self.threads = set()
+        greeting = app.static_response(speech="Hello!")
+        counter = itertools.count()
+
+        @app.fulfillment("echo", types={"n": int})
+        def my_fulfillment_echo(n):
+            self.threads.add(threading.current_thread().name)
+            return app.make_response_apiai(speech="%d" % n)
+
+        @app.fulfillment("greeting")
+        def my_fulfillment_greeting():
+            return greeting
+
+        @app.fulfillment("counter")
+        def my_fulfillment_counter():
+            return app.make_response_apiai(speech="%d" % next(counter))
+
+    def test_webhook(self):
+        client = self.app.direct_client()
+        result = client.webhook("echo", {"n": "1"})
+        assert result.ok
+        assert result.response["speech"] == "1"
+        assert result.response.source == self.app.name
+        assert client.webhook("greeting").response["speech"] == "Hello!"
+
+    def test_errors(self):
+        client = self.app.direct_client()
+        assert client.webhook("unknown").status == 404
+        result = client.webhook("echo", {"n": "x"})
+        assert result.status == 400
+        assert "invalid value" in result.error
+        assert self.app.direct_client(api_key="terces").webhook("echo", {"n": "1"}).status == 401
+        assert self.app.direct_client(api_key="old").webhook("echo", {"n": "1"}).ok
+
+    def test_call_many(self):
+        client = self.app.direct_client(workers=4)
+        try:
+            cases = ({"result": {"action": "echo", "parameters": {"n": i}}} for i in range(200))
+            results = list(client.call_many(cases))
+        finally:
+            client.close()
+        assert [r.response["speech"] for r in results] == [str(i) for i in range(200)]
+        assert len(self.threads) > 1
+
+    def test_parity(self):
+        client = self.app.direct_client(parity=True)
+        assert client.webhook("echo", {"n": "1"}).ok
+        assert client.webhook("greeting").ok
+        assert client.webhook("echo", {"n": "x"}).status == 400
+        with self.assertRaises(ParityError):
+            client.webhook("counter")
+
+    def test_engine(self):
+        engine = WebhookEngine(__name__, api_key_value="secret")
+
+        @engine.fulfillment("hello")
+        def my_fulfillment_hello(name):
+            return engine.make_response_apiai(speech="Hello, %s!" % name)
+
+        client = DirectClient(engine, parity=True)
+        assert client.webhook("hello", {"name": "World"}).response["speech"] == "Hello, World!"
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
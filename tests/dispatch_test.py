@@ -0,0 +1,130 @@
+# Copyright (C) 2017 Paoro
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+
+from apiaiwebhook import APIAIWebhook
+from apiaiwebhook.dispatch import DispatchPlan, to_bool
+from apiaiwebhook.exceptions import WebhookError
+from apiaiwebhook.payload import WebhookPayload
+
+
+def payload(parameters, **fields):
+    data = {"result": {"action": "test", "parameters": parameters}}
+    data.update(fields)
+    return WebhookPayload(data=data)
+
+
+class DispatchPlanTest(unittest.TestCase):
+    def test_inspect(self):
+        def f(one, two=2, **kwargs):
+            pass
+
+        plan = DispatchPlan(f)
+        assert plan.names == ("one", "two")
+        assert plan.defaults == {"two": 2}
+        assert plan.required == ("one",)
+        assert plan.var_keyword
+
+    def test_bind_drops_unknown(self):
+        plan = DispatchPlan(lambda one, two=None: None)
+        assert plan.bind(payload({"one": 1, "three": 3})) == {"one": 1}
+
+    def test_bind_kwargs(self):
+        plan = DispatchPlan(lambda one, **kwargs: None)
+        assert plan.bind(payload({"one": 1, "three": 3})) == {"one": 1, "three": 3}
+
+    def test_bind_missing(self):
+        plan = DispatchPlan(lambda one: None)
+        with self.assertRaises(WebhookError) as cm:
+            plan.bind(payload({}))
+        assert cm.exception.status == 400
+
+    def test_bind_types(self):
+        plan = DispatchPlan(lambda count, flag=False, ratio=None: None, types={"count": int, "flag": bool})
+        assert plan.bind(payload({"count": "3", "flag": "true"})) == {"count": 3, "flag": True}
+
+    def test_bind_types_empty(self):
+        plan = DispatchPlan(lambda count=None: None, types={"count": int})
+        assert plan.bind(payload({"count": ""})) == {}
+
+    def test_bind_types_invalid(self):
+        plan = DispatchPlan(lambda count: None, types={"count": int})
+        with self.assertRaises(WebhookError) as cm:
+            plan.bind(payload({"count": "three"}))
+        assert cm.exception.status == 400
+
+    def test_bind_fields(self):
+        plan = DispatchPlan(lambda one=None, session_id=None: None, bind={"session_id": "sessionId"})
+        assert plan.bind(payload({"one": 1}, sessionId="abc")) == {"one": 1, "session_id": "abc"}
+        assert plan.bind(payload({"one": 1})) == {"one": 1}
+
+    def test_bind_fields_not_accepted(self):
+        with self.assertRaises(ValueError):
+            DispatchPlan(lambda one=None: None, bind={"session_id": "sessionId"})
+
+    def test_to_bool(self):
+        assert to_bool("Yes") is True
+        assert to_bool("0") is False
+        assert to_bool(1) is True
+        with self.assertRaises(ValueError):
+            to_bool("maybe")
+
+
+class DispatchWebhookTest(unittest.TestCase):
+    def setUp(self):
+        app = APIAIWebhook(__name__)
+        app.testing = True
+        self.app = app
+        self.test_client = app.test_client_apiai()
+
+        @app.fulfillment("add", types={"a": int, "b": int})
+        def my_fulfillment_add(a, b=0):
+            return app.make_response_apiai(speech="Sum: %d" % (a + b))
+
+    def test_types(self):
+        r = self.test_client.webhook(action="add", parameters={"a": "1", "b": "2", "c": "unused"})
+        assert r.status_code == 200
+        assert "Sum: 3" in r.data.decode("utf-8")
+
+    def test_missing(self):
+        r = self.test_client.webhook(action="add", parameters={"b": "2"})
+        assert r.status_code == 400
+
+    def test_invalid(self):
+        r = self.test_client.webhook(action="add", parameters={"a": "one"})
+        assert r.status_code == 400
+
+    def test_bind(self):
+        @self.app.fulfillment("contexts", bind={"contexts": "result.contexts", "name": "result.contexts.0.name"})
+        def my_fulfillment_contexts(contexts, name=None):
+            return self.app.make_response_apiai(speech="Contexts: %d %s" % (len(contexts), name))
+
+        r = self.test_client.post(
+            self.app.webhook_url,
+            data='{"result": {"action": "contexts", "contexts": [{"name": "weather"}]}}',
+            content_type="application/json")
+        assert r.status_code == 200
+        assert "Contexts: 1 weather" in r.data.decode("utf-8")
+
+    def test_registry_replaced(self):
+        self.app.fulfillment_functions["add"] = lambda a: self.app.make_response_apiai(speech="Replaced: %s" % a)
+        r = self.test_client.webhook(action="add", parameters={"a": "1"})
+        assert r.status_code == 200
+        assert "Replaced: 1" in r.data.decode("utf-8")
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,142 @@
+# Copyright (C) 2017 Paoro
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from apiaiwebhook import APIAIWebhook
+
+
+def square(n):
+    return {"speech": str(n * n)}
+
+
+class ExecutorsWebhookTest(unittest.TestCase):
+    def setUp(self):
+        app = APIAIWebhook(__name__, metrics_url="/metrics/")
+        app.testing = True
+        self.app = app
+        self.test_client = app.test_client_apiai()
+        self.release = threading.Event()
+        self.fallback = app.make_response_apiai(speech="Sorry, try again later.")
+
+        @app.fulfillment("thread", executor="thread")
+        def thread():
+            return app.make_response_apiai(speech=threading.current_thread().name)
+
+        @app.fulfillment("slow", executor="thread", timeout=0.05, fallback=self.fallback)
+        def slow():
+            self.release.wait(5)
+            return app.make_response_apiai(speech="Done")
+
+        @app.fulfillment("slow-no-fallback", executor="thread", timeout=0.05)
+        def slow_no_fallback():
+            self.release.wait(5)
+            return app.make_response_apiai(speech="Done")
+
+        @app.fulfillment("queue", executor="thread", max_queue=1, fallback=self.fallback)
+        def queue():
+            self.release.wait(5)
+            return app.make_response_apiai(speech="Done")
+
+    def tearDown(self):
+        self.release.set()
+        self.app.executors.shutdown()
+
+    def speech(self, r):
+        return json.loads(r.data.decode("utf-8"))["speech"]
+
+    def test_thread(self):
+        r = self.test_client.webhook(action="thread")
+        assert r.status_code == 200
+        assert self.speech(r) != threading.current_thread().name
+
+    def test_timeout(self):
+        r = self.test_client.webhook(action="slow")
+        assert r.status_code == 200
+        assert self.speech(r) == "Sorry, try again later."
+        text = self.app.test_client().get("/metrics/").data.decode("utf-8")
+        assert 'apiaiwebhook_fallbacks_total{action="slow",reason="timeout"} 1' in text
+
+    def test_timeout_no_fallback(self):
+        r = self.test_client.webhook(action="slow-no-fallback")
+        assert r.status_code == 504
+
+    def test_max_queue(self):
+        pending = threading.Thread(target=lambda: self.app.test_client_apiai().webhook(action="queue"))
+        pending.start()
+        for _ in range(100):
+            if self.app.dispatch_plans["queue"].pending:
+                break
+            time.sleep(0.01)
+        r = self.test_client.webhook(action="queue")
+        assert self.speech(r) == "Sorry, try again later."
+        self.release.set()
+        pending.join()
+        assert self.app.dispatch_plans["queue"].pending == 0
+
+    def test_max_queue_rebuilt_plan(self):
+        pending = threading.Thread(target=lambda: self.app.test_client_apiai().webhook(action="queue"))
+        pending.start()
+        for _ in range(100):
+            if self.app.dispatch_plans["queue"].pending:
+                break
+            time.sleep(0.01)
+        # the plans are rebuilt while the request is in flight, the queue is still full
+        self.app.resource("counter")(list)
+        assert self.app.dispatch_plans["queue"].pending == 1
+        r = self.test_client.webhook(action="queue")
+        assert self.speech(r) == "Sorry, try again later."
+        self.release.set()
+        pending.join()
+        assert self.app.dispatch_plans["queue"].pending == 0
+
+    def test_registered_pool(self):
+        self.app.executors.register("named", ThreadPoolExecutor(1, thread_name_prefix="named"))
+
+        @self.app.fulfillment("named", executor="named")
+        def named():
+            return self.app.make_response_apiai(speech=threading.current_thread().name)
+
+        assert self.speech(self.test_client.webhook(action="named")).startswith("named")
+
+    def test_unknown_pool(self):
+        @self.app.fulfillment("unknown-pool", executor="unknown")
+        def unknown_pool():
+            pass
+
+        with self.assertRaises(ValueError):
+            self.test_client.webhook(action="unknown-pool")
+
+    def test_process(self):
+        self.app.executors.configure("process", max_workers=1)
+        self.app.fulfillment("square", types={"n": int}, executor="process")(square)
+        r = self.test_client.webhook(action="square", parameters={"n": "7"})
+        assert r.status_code == 200
+        assert self.speech(r) == "49"
+
+    def test_process_coroutine(self):
+        async def coroutine():
+            pass
+
+        with self.assertRaises(ValueError):
+            self.app.fulfillment("coroutine", executor="process")(coroutine)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,227 @@
+# Copyright (C) 2017 Paoro
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import json
+import socket
+import ssl
+import threading
+import time
+import unittest
+
+from apiaiwebhook import APIAIWebhook
+from apiaiwebhook.context import Deadline
+from apiaiwebhook.httpclient import HTTPPool, PoolTimeout
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+
+
+class StubServer(ThreadingMixIn, HTTPServer):
+    """
+    Local HTTP/1.1 server which echoes the requests as JSON and records the client connections.
+    `/slow` responds after 0.2 seconds, `/close` closes the connection after the response,
+    `/drop` closes the connection without a response.
+    """
+
+    daemon_threads = True
+
+    def __init__(self):
+        HTTPServer.__init__(self, ("127.0.0.1", 0), StubHandler)
+        self.connections = set()
+        self.paths = []
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self.serve_forever, args=(0.05,))
+        self.thread.daemon = True
+        self.thread.start()
+
+    def url(self, path):
+        return "http://127.0.0.1:%d%s" % (self.server_port, path)
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.respond(b"")
+
+    def do_POST(self):
+        self.respond(self.rfile.read(int(self.headers.get("Content-Length") or 0)))
+
+    def respond(self, body):
+        server = self.server
+        with server.lock:
+            server.connections.add(self.client_address)
+            server.paths.append(self.path)
+            server.active += 1
+            server.max_active = max(server.max_active, server.active)
+        try:
+            if self.path.startswith("/slow"):
+                time.sleep(0.2)
+            if self.path.startswith("/drop"):
+                self.close_connection = True
+                return
+            data = json.dumps({"path": self.path, "body": body.decode("utf-8")}).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            if self.path.startswith("/close"):
+                self.close_connection = True
+        finally:
+            with server.lock:
+                server.active -= 1
+
+
+class HTTPPoolTest(unittest.TestCase):
+    def setUp(self):
+        self.server = StubServer()
+        self.pool = HTTPPool(max_per_host=2, timeout=2)
+
+    def tearDown(self):
+        self.pool.close()
+        self.server.stop()
+
+    def test_keep_alive(self):
+        client = self.pool.client()
+        for i in range(5):
+            r = client.get(self.server.url("/get"), params={"i": i})
+            assert r.ok
+            assert r.json()["path"] == "/get?i=%d" % i
+        assert len(self.server.connections) == 1
+        assert self.pool.stats() == {"127.0.0.1:%d" % self.server.server_port: (0, 1)}
+
+    def test_post_json(self):
+        r = self.pool.client().post(self.server.url("/post"), json={"one": 1})
+        assert json.loads(r.json()["body"]) == {"one": 1}
+
+    def test_reconnect(self):
+        client = self.pool.client()
+        client.get(self.server.url("/close"))
+        time.sleep(0.05)
+        assert client.get(self.server.url("/get")).ok
+        assert len(self.server.connections) == 2
+        client.get(self.server.url("/close"))
+        time.sleep(0.05)
+        assert client.post(self.server.url("/post"), json={}).ok
+        assert len(self.server.connections) == 3
+
+    def test_retry(self):
+        client = self.pool.client()
+        client.get(self.server.url("/get"))
+        with self.assertRaises(Exception):
+            client.post(self.server.url("/drop"), json={})
+        assert self.server.paths.count("/drop") == 1
+
+        client.get(self.server.url("/get"))
+        with self.assertRaises(Exception):
+            client.get(self.server.url("/drop"))
+        assert self.server.paths.count("/drop") == 3
+
+    def test_max_per_host(self):
+        client = self.pool.client()
+        threads = [threading.Thread(target=client.get, args=(self.server.url("/slow"),)) for _ in range(6)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert self.server.max_active == 2
+        assert len(self.server.connections) == 2
+
+    def test_pool_timeout(self):
+        pool = HTTPPool(max_per_host=1, timeout=0.05)
+        t = threading.Thread(target=pool.client().get, args=(self.server.url("/slow"),), kwargs={"timeout": 1})
+        t.start()
+        time.sleep(0.05)
+        with self.assertRaises(PoolTimeout):
+            pool.client().get(self.server.url("/get"))
+        t.join()
+        pool.close()
+
+    def test_dns_error(self):
+        pool = HTTPPool(max_per_host=1, timeout=2)
+        for _ in range(2):
+            with self.assertRaises(socket.gaierror):
+                pool.client().get("http://nonexistent.invalid/get")
+        assert pool.stats() == {"nonexistent.invalid:80": (0, 0)}
+
+    def test_ssl_error(self):
+        pool = HTTPPool(max_per_host=1, timeout=2)
+        url = "https://127.0.0.1:%d/get" % self.server.server_port
+        for _ in range(2):
+            with self.assertRaises(ssl.SSLError):
+                pool.client().get(url)
+        assert pool.stats() == {"127.0.0.1:%d" % self.server.server_port: (0, 0)}
+
+    def test_deadline(self):
+        client = self.pool.client(Deadline(0.05))
+        started = time.time()
+        with self.assertRaises(socket.timeout):
+            client.get(self.server.url("/slow"))
+        assert time.time() - started < 0.15
+        with self.assertRaises(socket.timeout):
+            client.get(self.server.url("/get"))
+
+
+class HTTPWebhookTest(unittest.TestCase):
+    def setUp(self):
+        self.server = StubServer()
+        app = APIAIWebhook(__name__, metrics_url="/metrics/", http_pool=HTTPPool(max_per_host=4))
+        app.testing = True
+        self.app = app
+
+        @app.fulfillment("echo")
+        def my_fulfillment_echo(http, text):
+            r = http.post(self.server.url("/echo"), json={"text": text})
+            return app.make_response_apiai(speech=json.loads(r.json()["body"])["text"])
+
+    def tearDown(self):
+        self.app.shutdown()
+        self.server.stop()
+
+    def test_injected(self):
+        client = self.app.test_client_apiai()
+        for text in ("one", "two"):
+            r = client.webhook(action="echo", parameters={"text": text})
+            assert json.loads(r.data.decode("utf-8"))["speech"] == text
+        assert len(self.server.connections) == 1
+
+        metrics = client.get("/metrics/").data.decode("utf-8")
+        host = "127.0.0.1:%d" % self.server.server_port
+        assert 'apiaiwebhook_http_requests_total{host="%s",status="200"} 2' % host in metrics
+        assert 'apiaiwebhook_http_connections_total{host="%s"} 1' % host in metrics
+        assert 'apiaiwebhook_http_pool_connections{host="%s",state="idle"} 1' % host in metrics
+
+        self.app.shutdown()
+        assert self.app.http_pool.stats() == {host: (0, 0)}
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,125 @@
+# Copyright (C) 2017 Paoro
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+import logging
+import unittest
+
+from apiaiwebhook import APIAIWebhook, log
+from apiaiwebhook.log import LazyPayload, PayloadLogger
+
+
+class RecordingHandler(logging.Handler):
+    def __init__(self):
+        logging.Handler.__init__(self, logging.DEBUG)
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+class CountingPayload(LazyPayload):
+    formatted = 0
+
+    def __str__(self):
+        CountingPayload.formatted += 1
+        return LazyPayload.__str__(self)
+
+
+class PayloadLoggerTest(unittest.TestCase):
+    def setUp(self):
+        self.logger = logging.getLogger("apiaiwebhook.tests.log")
+        self.logger.propagate = False
+        self.handler = RecordingHandler()
+        self.logger.addHandler(self.handler)
+
+    def tearDown(self):
+        self.logger.removeHandler(self.handler)
+        self.logger.setLevel(logging.NOTSET)
+
+    def test_disabled(self):
+        self.logger.setLevel(logging.INFO)
+        payload_logger = PayloadLogger(self.logger)
+        assert not payload_logger.sample()
+
+    def test_lazy(self):
+        self.logger.setLevel(logging.INFO)
+        CountingPayload.formatted = 0
+        log.LazyPayload = CountingPayload
+        try:
+            payload_logger = PayloadLogger(self.logger, redact=["password"])
+            payload_logger.request(b'{"result": {"parameters": {"password": "secret"}}}')
+            payload_logger.response(b'{"speech": "Welcome!"}')
+            assert CountingPayload.formatted == 0
+            assert self.handler.records == []
+
+            self.logger.setLevel(logging.DEBUG)
+            payload_logger.response(b'{"speech": "Welcome!"}')
+            assert self.handler.records[0].getMessage() == 'response: {"speech": "Welcome!"}'
+            assert CountingPayload.formatted > 0
+        finally:
+            log.LazyPayload = LazyPayload
+
+    def test_sample(self):
+        self.logger.setLevel(logging.DEBUG)
+        payload_logger = PayloadLogger(self.logger, sample_rate=3)
+        assert [payload_logger.sample() for _ in range(6)] == [True, False, False, True, False, False]
+
+    def test_redact(self):
+        body = json.dumps({"result": {"parameters": {"password": "secret", "name": "api.ai"},
+                                      "contexts": [{"name": "login", "parameters": {"password": "secret"}}]}})
+        text = str(LazyPayload(body.encode("utf-8"), frozenset(["password"])))
+        assert "secret" not in text
+        assert "api.ai" in text
+
+        text = str(LazyPayload(b'{"contextOut": [{"parameters": {"password": "secret"}}]}', frozenset(["password"])))
+        assert "secret" not in text
+
+    def test_async(self):
+        self.logger.setLevel(logging.DEBUG)
+        payload_logger = PayloadLogger(self.logger)
+        payload_logger.start_async()
+        try:
+            assert self.handler not in self.logger.handlers
+            payload_logger.request(b'{"result": {}}')
+        finally:
+            payload_logger.stop_async()
+        assert self.handler in self.logger.handlers
+        assert [record.getMessage() for record in self.handler.records] == ['request: {"result": {}}']
+
+
+class PayloadLoggerWebhookTest(unittest.TestCase):
+    def test_webhook(self):
+        app = APIAIWebhook(__name__, log_redact=["password"])
+        app.testing = True
+        app.debug = True
+        handler = RecordingHandler()
+        app.logger.addHandler(handler)
+
+        @app.fulfillment("login")
+        def login(password):
+            return app.make_response_apiai(speech="Welcome!")
+
+        r = app.test_client_apiai().webhook(action="login", parameters={"password": "secret"})
+        assert r.status_code == 200
+        messages = [record.getMessage() for record in handler.records]
+        assert len(messages) == 2
+        assert messages[0].startswith("request: ")
+        assert messages[1].startswith("response: ")
+        assert "secret" not in messages[0]
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,140 @@
+# Copyright (C) 2017 Paoro
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import threading
+import unittest
+
+from apiaiwebhook import APIAIWebhook
+from apiaiwebhook.metrics import Metrics, opentelemetry_span_hook
+
+
+class MetricsTest(unittest.TestCase):
+    def test_observe(self):
+        metrics = Metrics(buckets=(0.1, 1.0))
+        request_timer = metrics.start()
+        request_timer.action = "hello-world"
+        request_timer.mark("auth")
+        request_timer.mark("handler")
+        request_timer.finish(200)
+
+        counters, histograms = metrics.collect()
+        assert counters[("apiaiwebhook_requests_total", (("action", "hello-world"), ("status", "200")))] == 1
+        histogram = histograms[("apiaiwebhook_phase_seconds", (("action", "hello-world"), ("phase", "handler")))]
+        assert histogram[0] == 1
+        assert len(histogram) == 4
+
+    def test_threads(self):
+        metrics = Metrics()
+
+        def run():
+            for _ in range(100):
+                metrics.increment("test_total", (("action", "a"),))
+
+        threads = [threading.Thread(target=run) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        counters, histograms = metrics.collect()
+        assert counters[("test_total", (("action", "a"),))] == 400
+
+    def test_finished_threads(self):
+        metrics = Metrics()
+
+        def run():
+            metrics.increment("test_total", (("action", "a"),))
+            metrics.observe(metrics.start(), 200, 0.001)
+
+        for _ in range(10):
+            thread = threading.Thread(target=run)
+            thread.start()
+            thread.join()
+        assert len(metrics._shards) == 1
+        counters, histograms = metrics.collect()
+        assert metrics._shards == []
+        assert counters[("test_total", (("action", "a"),))] == 10
+        assert histograms[("apiaiwebhook_request_seconds", (("action", ""),))][1] == 10
+
+    def test_render(self):
+        metrics = Metrics(buckets=(0.1, 1.0))
+        request_timer = metrics.start()
+        request_timer.action = 'quote"d'
+        request_timer.mark("handler")
+        request_timer.finish(200)
+        text = metrics.render_prometheus()
+        assert "# TYPE apiaiwebhook_phase_seconds histogram" in text
+        assert 'apiaiwebhook_phase_seconds_bucket{action="quote\\"d",phase="handler",le="+Inf"} 1' in text
+        assert 'apiaiwebhook_phase_seconds_count{action="quote\\"d",phase="handler"} 1' in text
+        assert 'apiaiwebhook_requests_total{action="quote\\"d",status="200"} 1' in text
+
+    def test_span_hook(self):
+        spans = []
+
+        class Span(object):
+            def __init__(self, name, kwargs):
+                self.name = name
+                self.kwargs = kwargs
+
+            def end(self, end_time=None):
+                spans.append((self.name, self.kwargs["start_time"], end_time))
+
+        class Tracer(object):
+            def start_span(self, name, **kwargs):
+                return Span(name, kwargs)
+
+        metrics = Metrics(span_hook=opentelemetry_span_hook(Tracer()))
+        request_timer = metrics.start()
+        request_timer.action = "hello-world"
+        request_timer.mark("auth")
+        request_timer.mark("handler")
+        request_timer.finish(200)
+        assert [span[0] for span in spans] == ["auth", "handler", "webhook hello-world"]
+        assert spans[0][1] == spans[2][1]
+        assert spans[1][2] == spans[2][2]
+
+
+class MetricsWebhookTest(unittest.TestCase):
+    def setUp(self):
+        app = APIAIWebhook(__name__, api_key_value="secret", metrics_url="/metrics/")
+        app.testing = True
+        self.app = app
+        self.test_client = app.test_client_apiai()
+
+        @app.fulfillment("hello-world")
+        def hello_world():
+            return app.make_response_apiai(speech="Hello, World!")
+
+    def test_metrics(self):
+        self.test_client.webhook(action="hello-world")
+        self.test_client.webhook(action="unknown")
+        self.app.test_client().post(self.app.webhook_url, data="{}")
+
+        r = self.app.test_client().get("/metrics/")
+        assert r.status_code == 200
+        text = r.data.decode("utf-8")
+        assert 'apiaiwebhook_requests_total{action="hello-world",status="200"} 1' in text
+        assert 'apiaiwebhook_requests_total{action="",status="404"} 1' in text
+        assert 'apiaiwebhook_requests_total{action="",status="400"} 1' in text
+        for phase in ("auth", "decode", "handler", "encode"):
+            assert 'apiaiwebhook_phase_seconds_count{action="hello-world",phase="%s"} 1' % phase in text
+
+    def test_disabled(self):
+        app = APIAIWebhook(__name__)
+        assert app.metrics is None
+        assert app.test_client().get("/metrics/").status_code == 404
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
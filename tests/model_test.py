@@ -0,0 +1,145 @@
+# Copyright (C) 2017 Paoro
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import json
+import pickle
+import unittest
+
+from apiaiwebhook import APIAIWebhook, WebhookRequest, WebhookResponse
+from apiaiwebhook.model import Context
+
+REQUEST = {
+    "id": "1",
+    "sessionId": "s1",
+    "lang": "en",
+    "result": {
+        "action": "weather",
+        "resolvedQuery": "weather in Rome",
+        "parameters": {"city": "Rome"},
+        "contexts": [{"name": "location", "lifespan": 2, "parameters": {"city": "Rome"}}],
+        "metadata": {"intentId": "i1", "intentName": "weather", "webhookUsed": "true"},
+    },
+    "originalRequest": {"source": "google", "version": "2", "data": {"user": {"locale": "en-US"}}},
+}
+
+
+class WebhookRequestTest(unittest.TestCase):
+    def test_fields(self):
+        req = WebhookRequest(REQUEST)
+        assert req.id == "1"
+        assert req.session_id == "s1"
+        assert req.lang == "en"
+        assert req.action == "weather"
+        assert req.parameters == {"city": "Rome"}
+        assert req.resolved_query == "weather in Rome"
+        assert req.get("originalRequest.data.user.locale") == "en-US"
+
+    def test_lazy(self):
+        req = WebhookRequest(REQUEST)
+        assert req.action == "weather"
+        assert req._contexts is None and req._metadata is None and req._original_request is None
+        assert req.context("location").parameters == {"city": "Rome"}
+        assert req.context("other") is None
+        assert req.metadata.intent_name == "weather"
+        assert req.original_request.source == "google"
+        assert req._metadata is not None
+
+    def test_empty(self):
+        req = WebhookRequest({"result": {"action": "weather"}})
+        assert req.contexts == []
+        assert req.metadata.intent_id is None
+        assert req.original_request is None
+
+
+class WebhookResponseTest(unittest.TestCase):
+    def test_mapping(self):
+        res = WebhookResponse(speech="Hello", context_out=[Context("weather", 2, {"city": "Rome"})])
+        assert res["speech"] == "Hello"
+        assert res["contextOut"] == [{"name": "weather", "lifespan": 2, "parameters": {"city": "Rome"}}]
+        assert res.get("displayText") is None and res.get("other", 1) == 1
+        res["displayText"] = "Hello!"
+        assert res.display_text == "Hello!"
+        assert dict(res) == res.to_dict() == res
+        assert "speech" in res and len(res) == 6
+
+    def test_dict(self):
+        res = WebhookResponse(speech="Hello", context_out=[Context("weather", 2)])
+        assert isinstance(res, dict)
+        assert json.loads(json.dumps(res)) == res
+        assert sorted(res.items()) == sorted(res.to_dict().items())
+        res.update({"speech": "Hi"}, contextOut=[Context("location")])
+        assert res.speech == "Hi" and res.context_out == [{"name": "location"}]
+        res.setdefault("custom", 1)
+        assert res.copy() == res and res.copy()["custom"] == 1
+        del res["custom"]
+        assert len(res) == 6
+
+    def test_replace(self):
+        res = WebhookResponse(speech="Hello")
+        copy = res.replace(data={"one": 1})
+        assert res.data is None and copy.data == {"one": 1} and copy.speech == "Hello"
+
+    def test_pickle(self):
+        res = WebhookResponse(speech="Hello", data={"one": 1})
+        res["custom"] = 1
+        copy = pickle.loads(pickle.dumps(res))
+        assert type(copy) is WebhookResponse and copy == res
+
+
+class WebhookModelTest(unittest.TestCase):
+    def setUp(self):
+        app = APIAIWebhook(__name__, json_backend="json")
+        app.testing = True
+        self.app = app
+        self.test_client = app.test_client_apiai()
+
+        @app.fulfillment("weather")
+        def my_fulfillment_weather(request, city=None):
+            location = request.context("location")
+            return WebhookResponse(speech="%s, %s" % (city, location.parameters["city"] if location else None),
+                                   context_out=[Context("weather", 1)])
+
+    def test_request(self):
+        r = self.test_client.webhook(action="weather", parameters={"city": "Rome"},
+                                     contexts=[{"name": "location", "parameters": {"city": "Paris"}}])
+        assert r.status_code == 200
+        res = json.loads(r.data.decode("utf-8"))
+        assert res["speech"] == "Rome, Paris"
+        assert res["source"] == self.app.name
+        assert res["contextOut"] == [{"name": "weather", "lifespan": 1}]
+
+    def test_make_response_apiai(self):
+        res = self.app.make_response_apiai(speech="Hello")
+        assert isinstance(res, WebhookResponse)
+        assert res == {"speech": "Hello", "displayText": None, "data": None, "contextOut": [],
+                       "source": self.app.name, "followupEvent": None}
+        assert json.loads(self.app.encode_response(res).decode("utf-8")) == res
+
+    def test_make_response_apiai_dict(self):
+        @self.app.fulfillment("custom")
+        def my_fulfillment_custom():
+            res = self.app.make_response_apiai(speech="Hello")
+            res.update(custom=json.loads(json.dumps(res)))
+            return res
+
+        r = self.test_client.webhook(action="custom")
+        assert r.status_code == 200
+        res = json.loads(r.data.decode("utf-8"))
+        assert res["speech"] == res["custom"]["speech"] == "Hello"
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
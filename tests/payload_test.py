@@ -0,0 +1,101 @@
+# Copyright (C) 2017 Paoro
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+
+from apiaiwebhook import APIAIWebhook
+from apiaiwebhook.encoding import get_json_backend
+from apiaiwebhook.exceptions import WebhookError
+from apiaiwebhook.payload import WebhookPayload
+
+BODY = b'{"sessionId": "abc", "result": {"action": "hello-world", "parameters": {"name": "api.ai"}, ' \
+       b'"contexts": [{"name": "weather", "parameters": {"city": "Rome"}}]}}'
+
+
+class WebhookPayloadTest(unittest.TestCase):
+    def setUp(self):
+        self.loads = get_json_backend("json").loads
+
+    def test_lazy(self):
+        payload = WebhookPayload(BODY, self.loads)
+        assert payload._data is None
+        assert payload.action == "hello-world"
+        assert payload.parameters == {"name": "api.ai"}
+
+    def test_get(self):
+        payload = WebhookPayload(BODY, self.loads)
+        assert payload.get("sessionId") == "abc"
+        assert payload.get("result.contexts.0.parameters.city") == "Rome"
+        assert payload.get("result.contexts.1.name") is None
+        assert payload.get("originalRequest.source", "unknown") == "unknown"
+
+    def test_defaults(self):
+        payload = WebhookPayload(data={"result": {}})
+        assert payload.action == ""
+        assert payload.parameters == {}
+
+    def test_invalid_json(self):
+        with self.assertRaises(WebhookError) as cm:
+            WebhookPayload(b"{", self.loads).action
+        assert cm.exception.status == 400
+
+    def test_missing_result(self):
+        with self.assertRaises(WebhookError) as cm:
+            WebhookPayload(b"[]", self.loads).action
+        assert cm.exception.status == 400
+        with self.assertRaises(WebhookError) as cm:
+            WebhookPayload(b"{}", self.loads).action
+        assert cm.exception.status == 400
+
+    def test_invalid_action(self):
+        for action in (5, ["a"], {"a": 1}):
+            with self.assertRaises(WebhookError) as cm:
+                WebhookPayload(data={"result": {"action": action}}).action
+            assert cm.exception.status == 400
+
+    def test_invalid_parameters(self):
+        for parameters in (["a"], "a", 5):
+            with self.assertRaises(WebhookError) as cm:
+                WebhookPayload(data={"result": {"parameters": parameters}}).parameters
+            assert cm.exception.status == 400
+
+
+class JSONBackendTest(unittest.TestCase):
+    def test_default(self):
+        backend = get_json_backend()
+        assert backend.loads(BODY)["sessionId"] == "abc"
+
+    def test_unknown(self):
+        with self.assertRaises(ValueError):
+            get_json_backend("unknown")
+
+    def test_webhook(self):
+        app = APIAIWebhook(__name__, json_backend="json")
+        app.testing = True
+
+        @app.fulfillment("hello-world")
+        def hello_world(name):
+            return app.make_response_apiai(speech="Hello, %s!" % name)
+
+        r = app.test_client().post(app.webhook_url, data=BODY, content_type="application/json")
+        assert r.status_code == 200
+        assert "Hello, api.ai!" in r.data.decode("utf-8")
+
+        r = app.test_client().post(app.webhook_url, data=b"{", content_type="application/json")
+        assert r.status_code == 400
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,150 @@
+# Copyright (C) 2017 Paoro
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import json
+import os
+import pstats
+import tempfile
+import time
+import unittest
+
+from apiaiwebhook import APIAIWebhook
+from apiaiwebhook.engine import WebhookEngine
+from apiaiwebhook.exceptions import WebhookError
+from apiaiwebhook.profiling import Profiler
+from tests.wsgi_test import call_wsgi, webhook_body
+
+
+def fibonacci(n):
+    return n if n < 2 else fibonacci(n - 1) + fibonacci(n - 2)
+
+
+class ProfilerTest(unittest.TestCase):
+    def setUp(self):
+        self.app = APIAIWebhook(__name__, api_key_value="secret", profiler=Profiler(debug_key="debug-secret"))
+        self.app.testing = True
+        self.client = self.app.test_client_apiai()
+
+        @self.app.fulfillment("fibonacci", types={"n": int})
+        def my_fulfillment_fibonacci(n):
+            return self.app.make_response_apiai(speech="%d" % fibonacci(n))
+
+    def post(self, debug_key=None):
+        headers = {"api-key": "secret"}
+        if debug_key is not None:
+            headers["x-profile"] = debug_key
+        r = self.client.post("/webhook/", data=webhook_body("fibonacci", {"n": 10}), headers=headers,
+                             content_type="application/json")
+        assert r.status_code == 200
+        assert json.loads(r.data.decode("utf-8"))["speech"] == "55"
+
+    def get(self, query="", debug_key="debug-secret"):
+        headers = {"x-profile": debug_key} if debug_key is not None else {}
+        return self.client.get("/profile/" + query, headers=headers)
+
+    def test_debug_header(self):
+        self.post()
+        self.post("invalid")
+        assert self.get("?action=fibonacci").status_code == 404
+        self.post("debug-secret")
+        self.post("debug-secret")
+
+        r = self.get()
+        assert r.status_code == 200
+        text = r.data.decode("utf-8")
+        assert "fibonacci: 2 requests" in text
+        assert "my_fulfillment_fibonacci" in text
+
+        r = self.get("?action=fibonacci&format=pstats")
+        assert r.status_code == 200
+        assert r.headers["Content-Type"] == "application/octet-stream"
+        fd, path = tempfile.mkstemp()
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(r.data)
+            stats = pstats.Stats(path)
+        finally:
+            os.remove(path)
+        calls = [total_calls for (filename, line, name), (calls, total_calls, tt, ct, callers)
+                 in stats.stats.items() if name == "fibonacci"]
+        assert calls == [2 * 177]
+
+        assert self.get("?format=pstats").status_code == 400
+        assert self.get("?action=fibonacci&format=collapsed").status_code == 400
+        assert self.get("?format=unknown").status_code == 400
+        assert self.get("?reset=true").status_code == 200
+        assert self.get("?action=fibonacci").status_code == 404
+
+    def test_access(self):
+        assert self.get(debug_key=None).status_code == 400
+        assert self.get(debug_key="invalid").status_code == 401
+        assert self.get().status_code == 200
+
+    def test_sample_rate(self):
+        self.app.profiler = Profiler(sample_rate=2)
+        for i in range(4):
+            self.post()
+        assert self.app.profiler.requests == {"fibonacci": 2}
+        # without debug key, the admin route requires the api-key
+        r = self.client.get("/profile/", headers={"api-key": "secret"})
+        assert r.status_code == 200
+        assert self.client.get("/profile/", headers={"api-key": "invalid"}).status_code == 401
+
+    def test_batch(self):
+        app = APIAIWebhook(__name__, batch_url="/webhook/batch/", profiler=Profiler(sample_rate=1))
+
+        @app.fulfillment("fibonacci", types={"n": int})
+        def my_fulfillment_fibonacci(n):
+            return app.make_response_apiai(speech="%d" % fibonacci(n))
+
+        data = "[%s]" % ", ".join([webhook_body("fibonacci", {"n": 10}).decode("utf-8")] * 3)
+        r = app.test_client().post("/webhook/batch/", data=data, content_type="application/json")
+        assert len(r.data.splitlines()) == 3
+        assert app.profiler.requests == {"fibonacci": 3}
+
+
+class SamplingProfilerTest(unittest.TestCase):
+    def test_collapsed(self):
+        engine = WebhookEngine(__name__, profiler=Profiler(sample_rate=1, collector="sampling", interval=0.001))
+        wsgi_app = engine.make_wsgi_app()
+
+        @engine.fulfillment("slow")
+        def my_fulfillment_slow():
+            time.sleep(0.05)
+            return engine.make_response_apiai(speech="done")
+
+        assert call_wsgi(wsgi_app, body=webhook_body("slow"))[0] == 200
+        # without a debug key or an api-key, the profiles are not served
+        assert call_wsgi(wsgi_app, "GET", "/profile/")[0] == 403
+
+        engine.profiler.debug_keys = Profiler(debug_key="debug-secret").debug_keys
+        status, body = call_wsgi(wsgi_app, "GET", "/profile/", {"x-profile": "debug-secret"})
+        assert status == 200
+        assert "slow: 1 requests" in body
+
+        stacks = engine.profiler.render(format="collapsed")[0].decode("utf-8").splitlines()
+        assert stacks
+        for line in stacks:
+            stack, count = line.rsplit(" ", 1)
+            assert stack.startswith("slow;")
+            assert int(count) > 0
+        assert any("my_fulfillment_slow" in line for line in stacks)
+        with self.assertRaises(WebhookError):
+            engine.profiler.render("slow", "pstats")
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
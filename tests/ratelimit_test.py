@@ -0,0 +1,133 @@
+# Copyright (C) 2017 Paoro
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from apiaiwebhook import APIAIWebhook, AdmissionControl, RateLimit, SQLiteRateLimitBackend
+from apiaiwebhook.ratelimit import MemoryRateLimitBackend
+
+
+class MemoryRateLimitBackendTest(unittest.TestCase):
+    def test_burst(self):
+        backend = MemoryRateLimitBackend()
+        limit = RateLimit(0.001, burst=3)
+        assert [backend.acquire("a", limit) for _ in range(4)] == [True, True, True, False]
+        assert backend.acquire("b", limit)
+
+    def test_refill(self):
+        backend = MemoryRateLimitBackend()
+        limit = RateLimit(1000, burst=1)
+        assert backend.acquire("a", limit)
+        time.sleep(0.01)
+        assert backend.acquire("a", limit)
+
+    def test_max_keys(self):
+        backend = MemoryRateLimitBackend(max_keys=2)
+        limit = RateLimit(0.001, burst=1)
+        for key in ("a", "b", "c"):
+            backend.acquire(key, limit)
+        assert len(backend) == 2
+        # the evicted bucket is recreated full
+        assert backend.acquire("a", limit)
+
+
+class SQLiteRateLimitBackendTest(unittest.TestCase):
+    def test_shared(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, "buckets.db")
+            limit = RateLimit(0.001, burst=2)
+            assert SQLiteRateLimitBackend(path).acquire("a", limit)
+            assert SQLiteRateLimitBackend(path).acquire("a", limit)
+            assert not SQLiteRateLimitBackend(path).acquire("a", limit)
+        finally:
+            shutil.rmtree(directory)
+
+
+class AdmissionWebhookTest(unittest.TestCase):
+    def setUp(self):
+        app = APIAIWebhook(__name__, metrics_url="/metrics/",
+                           admission=AdmissionControl(session_limit=RateLimit(0.001, burst=2)))
+        app.testing = True
+        self.app = app
+        self.test_client = app.test_client_apiai()
+        self.release = threading.Event()
+
+        @app.fulfillment("limited", rate_limit=RateLimit(0.001, burst=1))
+        def limited():
+            return app.make_response_apiai(speech="Done")
+
+        @app.fulfillment("session")
+        def session():
+            return app.make_response_apiai(speech="Done")
+
+        @app.fulfillment("slow")
+        def slow():
+            self.release.wait(5)
+            return app.make_response_apiai(speech="Done")
+
+    def tearDown(self):
+        self.release.set()
+
+    def metrics(self):
+        return self.app.test_client().get("/metrics/").data.decode("utf-8")
+
+    def test_action(self):
+        assert self.test_client.webhook(action="limited").status_code == 200
+        assert self.test_client.webhook(action="limited").status_code == 429
+        assert 'apiaiwebhook_rejections_total{action="limited",reason="action_rate"} 1' in self.metrics()
+
+    def test_session(self):
+        for _ in range(2):
+            assert self.test_client.webhook(action="session", session_id="s1").status_code == 200
+        assert self.test_client.webhook(action="session", session_id="s1").status_code == 429
+        assert self.test_client.webhook(action="session", session_id="s2").status_code == 200
+
+    def test_response(self):
+        self.app.admission.response = self.app.make_response_apiai(speech="Slow down.")
+        self.test_client.webhook(action="limited")
+        r = self.test_client.webhook(action="limited")
+        assert r.status_code == 200
+        assert json.loads(r.data.decode("utf-8"))["speech"] == "Slow down."
+
+    def test_concurrency(self):
+        self.app.admission.max_concurrency = 1
+        pending = threading.Thread(target=lambda: self.app.test_client_apiai().webhook(action="slow"))
+        pending.start()
+        for _ in range(100):
+            if self.app.admission.running:
+                break
+            time.sleep(0.01)
+        assert self.test_client.webhook(action="session").status_code == 503
+        self.release.set()
+        pending.join()
+        assert self.app.admission.running == 0
+        assert self.test_client.webhook(action="session").status_code == 200
+
+    def test_default(self):
+        app = APIAIWebhook(__name__)
+        assert app.admission is None
+        app.fulfillment("limited", rate_limit=RateLimit(1))(lambda: None)
+        assert app.admission is not None
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,132 @@
+# Copyright (C) 2017 Paoro
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from apiaiwebhook import APIAIWebhook
+from apiaiwebhook.benchmark import SocketDriver, WSGIDriver
+from apiaiwebhook.replay import ReplayReport, diff_json, iter_lines, main, replay
+
+
+def record(action, speech=None):
+    request = {"sessionId": "s1", "result": {"action": action, "parameters": {"name": "World"}}}
+    if speech is None:
+        return json.dumps(request)
+    response = {"speech": speech, "displayText": None, "data": None, "contextOut": [], "source": "recorded",
+                "followupEvent": None}
+    return json.dumps({"request": request, "response": response})
+
+
+class ReplayTest(unittest.TestCase):
+    def setUp(self):
+        app = APIAIWebhook(__name__, api_key_value="secret")
+        self.app = app
+        self.directory = tempfile.mkdtemp()
+        self.lines = [record("hello", "Hello, World!"), record("hello", "Hi, World!"), record("bye"), ""]
+
+        @app.fulfillment("hello")
+        def hello(name):
+            return app.make_response_apiai(speech="Hello, %s!" % name)
+
+        @app.fulfillment("bye")
+        def bye():
+            return app.make_response_apiai(speech="Bye!")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, name, compress=False):
+        path = os.path.join(self.directory, name)
+        data = "\n".join(self.lines).encode("utf-8")
+        with (gzip.open(path, "wb") if compress else open(path, "wb")) as f:
+            f.write(data)
+        return path
+
+    def test_iter_lines(self):
+        expected = [line.encode("utf-8") for line in self.lines if line]
+        assert list(iter_lines(self.write("plain.ndjson"))) == expected
+        assert list(iter_lines(self.write("compressed.ndjson.gz", compress=True))) == expected
+        self.lines = []
+        assert list(iter_lines(self.write("empty.ndjson"))) == []
+
+    def test_replay(self):
+        lines = iter_lines(self.write("traffic.ndjson.gz", compress=True))
+        report = replay(lines, lambda: WSGIDriver(self.app, {"api-key": "secret"}), concurrency=2,
+                        report=ReplayReport(ignore=["source"]))
+        assert report.requests == 3
+        hello = report.actions["hello"].to_dict()
+        assert hello["requests"] == 2
+        assert hello["statuses"] == {"200": 2}
+        assert hello["compared"] == 2
+        assert hello["mismatches"] == 1
+        assert report.actions["bye"].compared == 0
+        assert report.diffs == [("hello", ["speech: 'Hi, World!' != 'Hello, World!'"])]
+
+    def test_replay_errors(self):
+        self.lines = [record("hello", "Hello, World!"), "{corrupt", "5", record("bye"), record("hello")]
+        drivers = []
+
+        class DroppedConnectionDriver(WSGIDriver):
+            def fetch(self, body):
+                if b"bye" in body and len(drivers) == 1:
+                    raise IOError("connection reset by peer")
+                return super(DroppedConnectionDriver, self).fetch(body)
+
+        def make_driver():
+            drivers.append(DroppedConnectionDriver(self.app, {"api-key": "secret"}))
+            return drivers[-1]
+
+        report = replay(iter_lines(self.write("corrupt.ndjson")), make_driver, report=ReplayReport(ignore=["source"]))
+        assert report.requests == 5
+        assert report.actions[""].statuses == {"error": 2}
+        assert report.actions["bye"].statuses == {"error": 1}
+        assert report.actions["hello"].statuses == {200: 2}
+        assert len(drivers) == 2
+        assert [action for action, error in report.errors] == ["", "", "bye"]
+        assert report.errors[2][1].endswith("Error: connection reset by peer")
+        assert "ERROR bye" in str(report)
+
+    def test_main_http(self):
+        path = self.write("traffic.ndjson")
+        driver = SocketDriver(self.app)
+        output = os.path.join(self.directory, "report.json")
+        try:
+            url = "http://127.0.0.1:%d/webhook/" % driver.server.server_port
+            status = main([path, "--url", url, "--header", "api-key: secret", "--rate", "1000",
+                           "--ignore", "source", "--output", output])
+        finally:
+            driver.close()
+        assert status == 1
+        with open(output) as f:
+            report = json.load(f)
+        assert report["requests"] == 3
+        assert [action["action"] for action in report["actions"]] == ["bye", "hello"]
+
+
+class DiffJSONTest(unittest.TestCase):
+    def test_diff(self):
+        assert diff_json({"a": [1, {"b": 2}]}, {"a": [1, {"b": 2}]}) == []
+        assert diff_json({"a": [1, {"b": 2}], "c": 1}, {"a": [1, {"b": 3}], "d": 1}) == [
+            "a.1.b: 2 != 3", "c: missing", "d: unexpected"]
+        assert diff_json({"a": 1, "source": "x"}, {"a": 1, "source": "y"}, ignore=["source"]) == []
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
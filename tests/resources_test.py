@@ -0,0 +1,101 @@
+# Copyright (C) 2017 Paoro
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import json
+import os
+import unittest
+
+from apiaiwebhook import APIAIWebhook
+from apiaiwebhook.resources import ResourceRegistry
+
+
+class ResourceRegistryTest(unittest.TestCase):
+    def test_lifecycle(self):
+        events = []
+        registry = ResourceRegistry()
+        registry.register("one", lambda: events.append("create one") or "one", lambda r: events.append("close one"))
+        registry.register("two", lambda: "two", lambda r: events.append("close two"))
+        registry.startup_hooks.append(lambda: events.append("startup"))
+        registry.shutdown_hooks.append(lambda: events.append("shutdown"))
+
+        registry.ensure_started()
+        registry.ensure_started()
+        assert registry.get("one") == "one"
+        assert registry.get("one") == "one"
+        assert registry.get("two") == "two"
+        registry.shutdown()
+        assert events == ["startup", "create one", "close two", "close one", "shutdown"]
+
+    def test_close_error(self):
+        registry = ResourceRegistry()
+        closed = []
+        registry.register("one", lambda: "one", lambda r: closed.append(r))
+        registry.register("two", lambda: "two", lambda r: 1 / 0)
+        registry.get("one")
+        registry.get("two")
+        registry.shutdown()
+        assert closed == ["one"]
+
+    @unittest.skipIf(not hasattr(os, "fork"), "fork is not supported")
+    def test_fork(self):
+        registry = ResourceRegistry()
+        registry.register("pid", os.getpid)
+        registry.ensure_started()
+        assert registry.get("pid") == os.getpid()
+
+        pid = os.fork()
+        if pid == 0:
+            ok = not registry.started and registry.get("pid") == os.getpid()
+            os._exit(0 if ok else 1)
+        _, status = os.waitpid(pid, 0)
+        assert status == 0
+        assert registry.get("pid") == os.getpid()
+
+
+class ResourceWebhookTest(unittest.TestCase):
+    def test_resource(self):
+        app = APIAIWebhook(__name__)
+        app.testing = True
+        events = []
+
+        @app.fulfillment("count")
+        def my_fulfillment_count(counter):
+            counter.append(1)
+            return app.make_response_apiai(speech="%d" % len(counter))
+
+        # the resource is registered after the function, its dispatch plan is rebuilt
+        @app.resource("counter", close=lambda counter: events.append("close %d" % len(counter)))
+        def counter():
+            return []
+
+        @app.on_startup
+        def startup():
+            events.append("startup")
+
+        @app.on_shutdown
+        def shutdown():
+            events.append("shutdown")
+
+        client = app.test_client_apiai()
+        for i in range(1, 4):
+            r = client.webhook(action="count")
+            assert json.loads(r.data.decode("utf-8"))["speech"] == str(i)
+        app.shutdown()
+        assert events == ["startup", "close 3", "shutdown"]
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,108 @@
+# Copyright (C) 2017 Paoro
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import datetime
+import json
+import unittest
+import uuid
+
+from apiaiwebhook import APIAIWebhook
+from apiaiwebhook.encoding import get_json_backend
+from apiaiwebhook.model import Context, WebhookResponse
+from apiaiwebhook.response import ResponseEncoder, StaticResponse
+
+
+class ResponseEncoderTest(unittest.TestCase):
+    def setUp(self):
+        self.app = APIAIWebhook(__name__, json_backend="json")
+        self.encoder = ResponseEncoder(self.app.name, get_json_backend("json"))
+
+    def test_fragments(self):
+        res = self.app.make_response_apiai(speech=u"Hello, \u00e9!",
+                                           data={"one": [1, 2]},
+                                           context_out=[{"name": "weather", "lifespan": 2}])
+        body = self.encoder.encode(res)
+        assert body.startswith(b'{"speech":')
+        assert json.loads(body.decode("utf-8")) == res
+
+    def test_fragments_empty(self):
+        res = self.app.make_response_apiai()
+        assert json.loads(self.encoder.encode(res).decode("utf-8")) == res
+
+    def test_other(self):
+        res = {"speech": "Hello", "source": "other"}
+        assert json.loads(self.encoder.encode(res).decode("utf-8")) == res
+
+    def test_fast(self):
+        encoder = ResponseEncoder(self.app.name, get_json_backend())
+        res = self.app.make_response_apiai(speech="Hello")
+        assert json.loads(encoder.encode(res).decode("utf-8")) == res
+
+    def test_model(self):
+        for backend in ("json", None):
+            encoder = ResponseEncoder(self.app.name, get_json_backend(backend))
+            res = WebhookResponse(speech=u"Hello, \u00e9!", data={"one": [1, 2]}, context_out=[Context("weather", 2)])
+            assert json.loads(encoder.encode(res).decode("utf-8")) == res.replace(source=self.app.name)
+            res = WebhookResponse(speech="Hello", source="other")
+            assert json.loads(encoder.encode(res).decode("utf-8"))["source"] == "other"
+
+    def test_flask_types(self):
+        # the values which flask.json encoded before the JSON backends
+        data = {"at": datetime.datetime(2017, 5, 1, 12, 30), "day": datetime.date(2017, 5, 1), "id": uuid.UUID(int=5)}
+        expected = {"at": "Mon, 01 May 2017 12:30:00 GMT", "day": "Mon, 01 May 2017 00:00:00 GMT",
+                    "id": "00000000-0000-0000-0000-000000000005"}
+        for backend in ("json", None):
+            encoder = ResponseEncoder(self.app.name, get_json_backend(backend))
+            res = json.loads(encoder.encode(self.app.make_response_apiai(speech="Hello", data=data)).decode("utf-8"))
+            assert res["data"] == expected
+            assert json.loads(encoder.encode({"data": data}).decode("utf-8"))["data"] == expected
+        with self.assertRaises(TypeError):
+            self.encoder.encode({"data": object()})
+
+    def test_webhook_flask_types(self):
+        self.app.testing = True
+
+        @self.app.fulfillment("now")
+        def my_fulfillment_now():
+            return self.app.make_response_apiai(speech="now", data={"at": datetime.datetime(2017, 5, 1, 12, 30)})
+
+        r = self.app.test_client_apiai().webhook(action="now")
+        assert r.status_code == 200
+        assert json.loads(r.data.decode("utf-8"))["data"] == {"at": "Mon, 01 May 2017 12:30:00 GMT"}
+
+    def test_static(self):
+        assert self.encoder.encode(StaticResponse(b'{"speech":"Hello"}')) == b'{"speech":"Hello"}'
+
+
+class StaticResponseTest(unittest.TestCase):
+    def setUp(self):
+        app = APIAIWebhook(__name__)
+        app.testing = True
+        self.test_client = app.test_client_apiai()
+        greeting = app.static_response(speech="Hello, World!")
+
+        @app.fulfillment("hello-world")
+        def hello_world():
+            return greeting
+
+    def test_static_response(self):
+        r = self.test_client.webhook(action="hello-world")
+        assert r.status_code == 200
+        assert r.headers["Content-Type"] == "application/json"
+        assert json.loads(r.data.decode("utf-8"))["speech"] == "Hello, World!"
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,116 @@
+# Copyright (C) 2017 Paoro
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import json
+import unittest
+
+from apiaiwebhook import APIAIWebhook
+from apiaiwebhook.routing import ActionRouter
+
+
+class ActionRouterTest(unittest.TestCase):
+    def setUp(self):
+        self.router = ActionRouter()
+        for pattern in ("orders.*.get", "orders.status.*", "orders.**", "*.help", "**"):
+            self.router.add(pattern)
+
+    def test_match(self):
+        assert self.router.match("orders.status.get") == "orders.status.*"
+        assert self.router.match("orders.history.get") == "orders.*.get"
+        assert self.router.match("orders.history.cancel") == "orders.**"
+        assert self.router.match("orders") == "orders.**"
+        assert self.router.match("orders.status.get.all") == "orders.**"
+        assert self.router.match("billing.help") == "*.help"
+        assert self.router.match("billing.invoice") == "**"
+        assert self.router.match("") == "**"
+
+    def test_no_match(self):
+        router = ActionRouter()
+        router.add("orders.*")
+        assert router.match("orders") is None
+        assert router.match("orders.") is None
+        assert router.match("orders.status.get") is None
+        assert router.match("billing.status") is None
+
+    def test_memo(self):
+        router = ActionRouter(memo_size=2)
+        router.add("orders.*")
+        assert router.match("orders.get") == "orders.*"
+        router.add("orders.get")
+        assert router.match("orders.get") == "orders.get"
+        for action in ("a", "b", "c"):
+            router.match(action)
+        assert len(router._memo) <= 2
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            self.router.add("orders.**.get")
+        with self.assertRaises(ValueError):
+            self.router.add("orders.get*")
+
+
+class RoutingWebhookTest(unittest.TestCase):
+    def setUp(self):
+        app = APIAIWebhook(__name__, metrics_url="/metrics/")
+        app.testing = True
+        self.app = app
+        self.test_client = app.test_client_apiai()
+
+        @app.fulfillment("orders.status.get")
+        def my_fulfillment_get(order_id):
+            return app.make_response_apiai(speech="exact %s" % order_id)
+
+        @app.fulfillment("orders.*.cancel", bind={"action": "result.action"})
+        def my_fulfillment_cancel(action, order_id):
+            return app.make_response_apiai(speech="%s %s" % (action, order_id))
+
+        @app.fulfillment("**")
+        def my_fulfillment_default():
+            return app.make_response_apiai(speech="default")
+
+    def speech(self, action, parameters=None):
+        r = self.test_client.webhook(action=action, parameters=parameters or {})
+        assert r.status_code == 200
+        return json.loads(r.data.decode("utf-8"))["speech"]
+
+    def test_routing(self):
+        assert self.speech("orders.status.get", {"order_id": "1"}) == "exact 1"
+        assert self.speech("orders.status.cancel", {"order_id": "2"}) == "orders.status.cancel 2"
+        assert self.speech("orders.refund.cancel", {"order_id": "3"}) == "orders.refund.cancel 3"
+        assert self.speech("unknown") == "default"
+
+    def test_metrics_label(self):
+        for i in range(3):
+            self.speech("unknown-%d" % i)
+        self.speech("orders.status.get", {"order_id": "1"})
+        body = self.app.metrics.render_prometheus()
+        assert 'apiaiwebhook_requests_total{action="**",status="200"} 3' in body
+        assert 'apiaiwebhook_requests_total{action="orders.status.get",status="200"} 1' in body
+        assert "unknown-" not in body
+
+    def test_bind_error(self):
+        r = self.test_client.webhook(action="orders.status.cancel", parameters={})
+        assert r.status_code == 400
+
+    def test_invalid_action(self):
+        for action in (5, ["a"]):
+            body = json.dumps({"result": {"action": action}})
+            r = self.app.test_client().post(self.app.webhook_url, data=body, content_type="application/json")
+            assert r.status_code == 400
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,162 @@
+# Copyright (C) 2017 Paoro
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from apiaiwebhook import APIAIWebhook, Session, SessionStore, SQLiteCache
+from apiaiwebhook.payload import WebhookPayload
+
+
+def payload(session_id, contexts=None):
+    return WebhookPayload(data={"sessionId": session_id, "result": {"contexts": contexts or []}})
+
+
+class SessionTest(unittest.TestCase):
+    def test_changed(self):
+        session = Session("s", {"a": 1, "b": 2})
+        assert not session.modified
+        session["c"] = 3
+        del session["a"]
+        session.update(d=4)
+        session.setdefault("b", 5)
+        session.pop("missing", None)
+        assert session.changed == {"a", "c", "d"}
+        assert session == {"b": 2, "c": 3, "d": 4}
+
+
+class SessionStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "sessions.db")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_in_process(self):
+        store = SessionStore()
+        session = store.load(payload("s1", [{"name": "order", "parameters": {"size": "large"}}]))
+        assert session == {}
+        assert session.context("order") == {"size": "large"}
+        assert session.context("other") is None
+        session["cart"] = ["tea"]
+        store.save(session)
+        assert store.load(payload("s1")) == {"cart": ["tea"]}
+        assert store.load(payload("s2")) == {}
+
+    def test_no_session_id(self):
+        store = SessionStore()
+        session = store.load(payload(None))
+        session["a"] = 1
+        store.save(session)
+        assert len(store.cache) == 0
+
+    def test_backend(self):
+        store = SessionStore(backend=SQLiteCache(self.path))
+        session = store.load(payload("s1"))
+        session["a"] = 1
+        store.save(session)
+
+        # a new process starts with an empty in-process cache
+        store = SessionStore(backend=SQLiteCache(self.path))
+        assert store.load(payload("s1")) == {"a": 1}
+
+    def test_backend_shared(self):
+        # two worker processes share the backend
+        one = SessionStore(backend=SQLiteCache(self.path))
+        two = SessionStore(backend=SQLiteCache(self.path))
+        for store, value in ((one, 1), (two, 2), (one, 3)):
+            session = store.load(payload("s1"))
+            assert session.get("a", 0) == value - 1
+            session["a"] = value
+            store.save(session)
+        assert len(one.cache) == 0
+        assert two.load(payload("s1")) == {"a": 3}
+
+    def test_backend_cache_ttl(self):
+        backend = SQLiteCache(self.path)
+        store = SessionStore(backend=backend, cache_ttl=60)
+        session = store.load(payload("s1"))
+        session["a"] = 1
+        store.save(session)
+        backend.set("s1", b'{"a": 2}', 60)
+        # served by the in-process cache until cache_ttl is over
+        assert store.load(payload("s1")) == {"a": 1}
+
+    def test_write_behind(self):
+        backend = SQLiteCache(self.path)
+        store = SessionStore(backend=backend, write_behind=60)
+        for session_id in ("s1", "s2"):
+            session = store.load(payload(session_id))
+            session["a"] = session_id
+            store.save(session)
+        assert backend.get("s2") is None
+        store.cache.clear()
+        assert store.load(payload("s2")) == {"a": "s2"}
+        store.flush()
+        assert json.loads(backend.get("s2").decode("utf-8")) == {"a": "s2"}
+
+    def test_context_out(self):
+        store = SessionStore(context_lifespan=2)
+        session = Session("s", {"a": 1})
+        session["b"] = 2
+        del session["a"]
+        assert store.context_out(session) == {"name": "session", "lifespan": 2, "parameters": {"b": 2}}
+        assert SessionStore(context_name=None).context_out(session) is None
+
+
+class SessionWebhookTest(unittest.TestCase):
+    def setUp(self):
+        app = APIAIWebhook(__name__)
+        app.testing = True
+        self.app = app
+        self.test_client = app.test_client_apiai()
+
+        @app.fulfillment("add")
+        def add(product, session):
+            session["cart"] = session.get("cart", []) + [product]
+            return app.make_response_apiai(speech=", ".join(session["cart"]))
+
+        @app.fulfillment("show")
+        def show(session):
+            return app.make_response_apiai(speech=", ".join(session.get("cart", [])))
+
+    def response(self, r):
+        return json.loads(r.data.decode("utf-8"))
+
+    def test_session(self):
+        r = self.test_client.webhook(action="add", parameters={"product": "tea"}, session_id="s1")
+        assert self.response(r)["speech"] == "tea"
+        assert self.response(r)["contextOut"] == [{"name": "session", "lifespan": 5,
+                                                   "parameters": {"cart": ["tea"]}}]
+        r = self.test_client.webhook(action="add", parameters={"product": "milk"}, session_id="s1")
+        assert self.response(r)["speech"] == "tea, milk"
+
+        r = self.test_client.webhook(action="show", session_id="s1")
+        assert self.response(r)["speech"] == "tea, milk"
+        assert self.response(r)["contextOut"] == []
+        r = self.test_client.webhook(action="show", session_id="s2")
+        assert self.response(r)["speech"] == ""
+
+    def test_dispatch(self):
+        res = self.app.dispatch({"sessionId": "s3", "result": {"action": "add", "parameters": {"product": "tea"}}})
+        assert res["contextOut"][0]["parameters"] == {"cart": ["tea"]}
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
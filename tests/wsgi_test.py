@@ -0,0 +1,113 @@
+# Copyright (C) 2017 Paoro
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import io
+import json
+import subprocess
+import sys
+import unittest
+
+from apiaiwebhook import APIAIWebhook
+from apiaiwebhook.engine import WebhookEngine
+
+
+def call_wsgi(wsgi_app, method="POST", path="/webhook/", headers=None, body=b""):
+    """
+    Calls the WSGI application with a single HTTP request and collects the response.
+
+    :return: tuple of the status code and the response body
+    """
+    statuses = []
+
+    def start_response(status, response_headers, exc_info=None):
+        statuses.append(int(status.split(" ", 1)[0]))
+
+    environ = {
+        "REQUEST_METHOD": method,
+        "PATH_INFO": path,
+        "CONTENT_LENGTH": str(len(body)),
+        "wsgi.input": io.BytesIO(body),
+    }
+    for name, value in (headers or {}).items():
+        environ["HTTP_" + name.upper().replace("-", "_")] = value
+    body = b"".join(wsgi_app(environ, start_response))
+    return statuses[0], body.decode("utf-8")
+
+
+def webhook_body(action, parameters=None):
+    return json.dumps({"result": {"action": action, "parameters": parameters or {}}}).encode("utf-8")
+
+
+class WSGIWebhookTest(unittest.TestCase):
+    def setUp(self):
+        engine = WebhookEngine(__name__, api_key_value="secret", metrics_url="/metrics/")
+        self.wsgi_app = engine.make_wsgi_app()
+        self.headers = {"api-key": "secret"}
+
+        @engine.fulfillment("one", types={"one": int})
+        def my_fulfillment_one(one):
+            return engine.make_response_apiai(speech="Test with one parameter: %d" % one)
+
+    def test_one(self):
+        status, body = call_wsgi(self.wsgi_app, headers=self.headers, body=webhook_body("one", {"one": "1"}))
+        assert status == 200
+        assert json.loads(body)["speech"] == "Test with one parameter: 1"
+        assert json.loads(body)["source"] == __name__
+
+    def test_errors(self):
+        assert call_wsgi(self.wsgi_app, body=webhook_body("one"))[0] == 400
+        assert call_wsgi(self.wsgi_app, headers={"api-key": "terces"}, body=webhook_body("one"))[0] == 401
+        assert call_wsgi(self.wsgi_app, headers=self.headers, body=webhook_body("one", {"one": "x"}))[0] == 400
+        assert call_wsgi(self.wsgi_app, headers=self.headers, body=webhook_body("unknown"))[0] == 404
+        assert call_wsgi(self.wsgi_app, headers=self.headers, body=b"{")[0] == 400
+        assert call_wsgi(self.wsgi_app, path="/other/", headers=self.headers)[0] == 404
+        assert call_wsgi(self.wsgi_app, method="GET", headers=self.headers)[0] == 405
+
+    def test_metrics(self):
+        call_wsgi(self.wsgi_app, headers=self.headers, body=webhook_body("one", {"one": "1"}))
+        status, body = call_wsgi(self.wsgi_app, method="GET", path="/metrics/")
+        assert status == 200
+        assert 'apiaiwebhook_requests_total{action="one",status="200"} 1' in body
+
+    def test_flask_free(self):
+        code = "import sys; from apiaiwebhook.engine import WebhookEngine; " \
+               "WebhookEngine('test').make_wsgi_app(); assert 'flask' not in sys.modules"
+        subprocess.check_call([sys.executable, "-c", code])
+
+
+class WSGIWebhookFlaskTest(unittest.TestCase):
+    def setUp(self):
+        app = APIAIWebhook(__name__)
+        app.testing = True
+        app.secret_key = "secret"
+        self.app = app
+
+        @app.fulfillment("counter")
+        def my_fulfillment_counter(session):
+            session["count"] = session.get("count", 0) + 1
+            return app.make_response_apiai(speech="%d" % session["count"])
+
+    def test_parity(self):
+        body = webhook_body("counter")
+        r = self.app.test_client_apiai().webhook(action="counter", parameters={}, session_id="flask")
+        assert r.status_code == 200
+        status, raw = call_wsgi(self.app.make_wsgi_app(), body=body)
+        assert status == 200
+        assert json.loads(raw)["speech"] == json.loads(r.data.decode("utf-8"))["speech"] == "1"
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -1,9 +1,63 @@
+import sys
 import unittest
 
+import tests.agents_test
 import tests.apiai_webhook_test
+import tests.auth_test
+import tests.benchmark_test
+import tests.cache_test
+import tests.coalesce_test
+import tests.compression_test
+import tests.context_test
+import tests.dispatch_test
+import tests.httpclient_test
+import tests.log_test
+import tests.metrics_test
+import tests.model_test
+import tests.payload_test
+import tests.profiling_test
+import tests.ratelimit_test
+import tests.resources_test
+import tests.response_test
+import tests.routing_test
+import tests.session_test
+import tests.wsgi_test
 
 test_suits = unittest.TestSuite([
-    unittest.TestLoader().loadTestsFromModule(tests.apiai_webhook_test)
+    unittest.TestLoader().loadTestsFromModule(tests.agents_test),
+    unittest.TestLoader().loadTestsFromModule(tests.apiai_webhook_test),
+    unittest.TestLoader().loadTestsFromModule(tests.auth_test),
+    unittest.TestLoader().loadTestsFromModule(tests.benchmark_test),
+    unittest.TestLoader().loadTestsFromModule(tests.cache_test),
+    unittest.TestLoader().loadTestsFromModule(tests.coalesce_test),
+    unittest.TestLoader().loadTestsFromModule(tests.compression_test),
+    unittest.TestLoader().loadTestsFromModule(tests.context_test),
+    unittest.TestLoader().loadTestsFromModule(tests.dispatch_test),
+    unittest.TestLoader().loadTestsFromModule(tests.httpclient_test),
+    unittest.TestLoader().loadTestsFromModule(tests.log_test),
+    unittest.TestLoader().loadTestsFromModule(tests.metrics_test),
+    unittest.TestLoader().loadTestsFromModule(tests.model_test),
+    unittest.TestLoader().loadTestsFromModule(tests.payload_test),
+    unittest.TestLoader().loadTestsFromModule(tests.profiling_test),
+    unittest.TestLoader().loadTestsFromModule(tests.ratelimit_test),
+    unittest.TestLoader().loadTestsFromModule(tests.resources_test),
+    unittest.TestLoader().loadTestsFromModule(tests.response_test),
+    unittest.TestLoader().loadTestsFromModule(tests.routing_test),
+    unittest.TestLoader().loadTestsFromModule(tests.session_test),
+    unittest.TestLoader().loadTestsFromModule(tests.wsgi_test),
 ])
 
+if sys.version_info >= (3, 7):
+    import tests.asgi_test
+    import tests.batch_test
+    import tests.direct_test
+    import tests.executors_test
+    import tests.replay_test
+
+    test_suits.addTest(unittest.TestLoader().loadTestsFromModule(tests.asgi_test))
+    test_suits.addTest(unittest.TestLoader().loadTestsFromModule(tests.batch_test))
+    test_suits.addTest(unittest.TestLoader().loadTestsFromModule(tests.direct_test))
+    test_suits.addTest(unittest.TestLoader().loadTestsFromModule(tests.executors_test))
+    test_suits.addTest(unittest.TestLoader().loadTestsFromModule(tests.replay_test))
+
 unittest.TextTestRunner(verbosity=2).run(test_suits)